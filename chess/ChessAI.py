@@ -3,6 +3,12 @@ This is AI module file.
 This is responsible for handling AI moves by using different algorithms.
 """
 import random
+import time
+import zlib
+from chess.analysisCache import AnalysisCache
+from chess.chessEngine import (GameState, PIECE_CODES, MAX_MOVES, MOVE_NORMAL, MOVE_ENPASSANT, MOVE_PROMOTION,
+                               GENERATE_CAPTURES, GENERATE_QUIETS)
+from chess.sharedPosition import SharedSearchSlot
 """
 A dictionary that assigns a score value to each type of chess piece.
 These values are used in heuristics for AI decision-making.
@@ -94,13 +100,48 @@ blackPawnScores = [[0, 0, 0, 0, 0, 0, 0, 0],
                    [8, 8, 8, 8, 8, 8, 8, 8],
                    [8, 8, 8, 8, 8, 8, 8, 8]]
 
+"""
+Pawn structure evaluation, in pawns from white's point of view.
+Doubled and isolated pawns are penalised, passed pawns get a bonus that grows as they advance,
+and own pawns in front of a king that is still on its back rank count as a shield.
+"""
+DOUBLED_PAWN_PENALTY = 0.2 # per extra pawn on a file
+ISOLATED_PAWN_PENALTY = 0.15 # per pawn without own pawns on the neighbouring files
+PASSED_PAWN_BONUS = [0, 0.1, 0.15, 0.25, 0.4, 0.6, 0.9, 0] # by the number of ranks the pawn has advanced
+PAWN_SHIELD_BONUS = [0.1, 0.05] # own pawn one and two ranks in front of the king, on its file or next to it
+
+"""
+Weights fitted by tuneEval.py. When the generated module exists its values replace the hand-written ones above.
+"""
+try:
+    from chess.evalWeights import (pieceScore, knightScores, bishopScores, queenScores, rookScores,
+                                   whitePawnScores, blackPawnScores, DOUBLED_PAWN_PENALTY,
+                                   ISOLATED_PAWN_PENALTY, PASSED_PAWN_BONUS, PAWN_SHIELD_BONUS)
+except ImportError:
+    pass
+
 """
 A mapping of chess pieces to their respective positional score tables.
 Used for evaluating piece placement on the board during scoring.
+Keyed by the piece as it stands on the board ("wN", "bp", ...), the board always has white at the bottom.
+The tables are written for white, a black piece uses the table mirrored top to bottom (like blackPawnScores)
+so both colours score the same on mirrored squares. Kings have no table.
 """
 
-piecePositionScores = {"N": knightScores, "B": bishopScores, "Q": queenScores,
-                       "R": rookScores, "wp": whitePawnScores, "bp": blackPawnScores}
+piecePositionScores = {color + piece: table if color == "w" else table[::-1] for color in "wb"
+                       for piece, table in (("N", knightScores), ("B", bishopScores), ("Q", queenScores),
+                                            ("R", rookScores))}
+piecePositionScores["wp"] = whitePawnScores
+piecePositionScores["bp"] = blackPawnScores
+
+"""
+Pawn hash table. Pawn structures change rarely during a search, so the pawn terms are cached by the
+pawn-only Zobrist key (gs.pawnHash) in a fixed size table. A new structure replaces whatever shared its slot.
+"""
+PAWN_HASH_SIZE = 1 << 14 # entries, must be a power of two
+pawnHashTable = [None] * PAWN_HASH_SIZE
+pawnHashProbes = 0
+pawnHashHits = 0
 
 CHECKMATE = 1000 # Value assigned to a checkmate scenario, representing a winning state.
 STALEMATE = 0 # Value assigned to a stalemate scenario, representing a draw.
@@ -114,6 +155,121 @@ DEPTH = 2 # Defines the depth of the AI's move search in the decision tree.
 nextMove = None # Placeholder for the best move determined by the AI during search.
 SET_WHITE_AS_BOT = -1 # Flag to determine if the white side is controlled by the AI (-1: Human, 1: AI).
 
+"""
+Selective search settings. Both can be switched off to A/B test them against the plain full width search.
+They only kick in from depth 3, at the default DEPTH of 2 the search is unchanged.
+Null move pruning: let the opponent move twice, if a reduced search still fails high the node is pruned.
+In zugzwang-prone endgames (side to move has only king and pawns) a cutoff is verified with a reduced normal search.
+Late move reductions: quiet moves ordered late are searched one ply shallower with a null window,
+and searched again at full depth if they unexpectedly beat alpha.
+"""
+NULL_MOVE_PRUNING = True
+NULL_MOVE_REDUCTION = 2 # R, how much shallower the null move search is
+NULL_MOVE_VERIFICATION = True
+LATE_MOVE_REDUCTIONS = True
+LMR_MIN_DEPTH = 3 # don't reduce closer to the leaves than this
+LMR_FULL_DEPTH_MOVES = 3 # the first few moves in the ordering are always searched at full depth
+NULL_WINDOW = 0.01 # null window width in pawns, the evaluation has no fixed step: closer scores count as equal
+DELTA_MARGIN = 2 # pawns a quiescence capture may gain besides its victim, less can't reach alpha: skipped
+
+"""
+Iterative deepening settings. Every iteration starts with an aspiration window around the previous
+iteration's score and widens it when the search falls outside. Non-PV moves are scouted with a null
+window (principal variation search) and the best line is collected in a triangular PV table.
+"""
+ASPIRATION_WINDOW = 0.5 # half width of the first window, in pawns
+MAX_PLY = 64 # deepest ply the PV table can hold
+pvTable = [[None] * MAX_PLY for _ in range(MAX_PLY)] # pvTable[ply] is the best line found from that ply
+pvLength = [0] * MAX_PLY
+previousPv = [] # principal variation of the last completed iteration, searched first in the next one
+
+"""
+Cooperative cancellation. Every STOP_CHECK_INTERVAL nodes the search checks its deadline and the
+stopRequested callback; once stopped every node unwinds immediately and the result of the deepest
+completed iteration is used. A node costs a few hundred microseconds, so this reacts within milliseconds.
+"""
+STOP_CHECK_INTERVAL = 4
+TIME_LIMIT = None # seconds per AI move, None searches to DEPTH without a deadline
+nodes = 0 # nodes visited by the current search
+searchStopped = False
+deadline = None
+stopCallback = None
+PRINT_SEARCH_PROGRESS = True # print the result of every iteration
+
+"""
+Transposition table and history heuristic. Both survive from one search to the next, so consecutive
+positions of a game (the AI's own moves, or every ply when annotating a game) start from what the
+previous searches already found. clearSearchState() forgets them, e.g. for a new game.
+A table entry is (hash, depth, score, flag, best move). Entries of the same position are only replaced
+by searches at least as deep, other positions simply take the slot.
+History scores count how often a quiet move (piece and target square) caused a cutoff, weighted by depth.
+With TT_SAME_DEPTH_ONLY a stored score only cuts off a node searched to exactly its depth, deeper results
+still order the moves. Every score then has the horizon it was asked for, e.g. to compare two moves.
+"""
+TT_SIZE = 1 << 18 # entries, must be a power of two
+TT_SAME_DEPTH_ONLY = False
+TT_EXACT = 0
+TT_LOWER = 1 # score is a lower bound, the search failed high
+TT_UPPER = 2 # score is an upper bound, the search failed low
+transpositionTable = [None] * TT_SIZE
+ttProbes = 0
+ttHits = 0
+HISTORY_LIMIT = 1 << 16 # all history scores are halved once one gets this big
+historyScores = [0] * (len(PIECE_CODES) * 64)
+
+"""
+Move buffers. Inside the search moves are move codes (see chessEngine.MOVE_NORMAL): the moves of the node at
+ply are generated into moveBuffers[ply] and ordered by their keys in orderKeys[ply], so visiting a node creates
+no Move objects or move lists. pvTable, previousPv and the transposition table hold move codes as well,
+searchPosition turns its result back into Moves.
+Below the root a node generates its own moves, pseudo legal ones (gs.fillPseudoLegalMoves), once the
+transposition table and null move had their chance to cut it off. A move is only tested for legality right
+before it is searched (gs.leavesKingInCheck), moves after a cutoff never are.
+"""
+moveBuffers = [[0] * MAX_MOVES for _ in range(MAX_PLY)]
+orderKeys = [[0] * MAX_MOVES for _ in range(MAX_PLY)]
+pvMoveBuffer = [0] * MAX_MOVES # tablePrincipalVariation's own, it runs in the middle of a search
+rootMoveCount = 0 # the root's moves are the caller's legal moves, searchPosition puts them in moveBuffers[0]
+PV_MOVE_KEY = 1 << 30 # order key of the move the previous iteration expected, searched first
+TT_MOVE_KEY = 1 << 29 # order key of the transposition table's best move, searched next
+
+"""
+Staged move picking. Below the root and outside of check pickMoves doesn't generate a node's moves up front,
+it hands them out in stages and only generates a stage once the ones before it are used up: the hash moves
+(the previous iteration's PV move and the transposition table's move), the captures and promotions that don't
+look like they lose material, the killer moves, the other quiet moves by history and last the captures that
+do look like losing material. Most nodes cut off on a hash move or a capture and never generate quiet moves.
+Killer moves are the last two quiet moves that caused a cutoff at the same ply, in whatever position.
+Putting the losing captures last can be switched on with DEFER_LOSING_CAPTURES. It is off because the search
+scores its leaves statically: one ply from the horizon taking a defended piece really does win material, so
+those captures cut off more often than the quiet moves put before them (60% more nodes at depth 5).
+"""
+DEFER_LOSING_CAPTURES = False
+killerMoves = [[None, None] for _ in range(MAX_PLY)]
+badCaptureBuffers = [[0] * MAX_MOVES for _ in range(MAX_PLY)]
+
+"""
+Multi-PV analysis, see searchMultiPV. Every iteration searches the root once per line, each time without the
+moves of the lines ranked above it, with an aspiration window around the line's own score from the previous
+iteration. The lines share the transposition table, history and killers, so the second and third line mostly
+revisit positions the first one already searched. A root searched without some of its moves doesn't store its
+result in the transposition table, it isn't the position's real score.
+"""
+MULTI_PV_LINES = 3 # lines findBestLines asks for
+rootMovesExcluded = False
+
+"""
+Persistent analysis cache (see analysisCache), off while ANALYSIS_CACHE_FILE is None. It sits behind the
+transposition table: a position the table doesn't know is looked up in the cache and copied into the table,
+results of at least CACHE_MIN_DEPTH plies are written through to it. Every search process opens the file itself
+and they all share it, also with later runs. clearSearchState() doesn't touch it, the results stay valid as long
+as the evaluation doesn't change, and the cache empties itself when it does.
+"""
+ANALYSIS_CACHE_FILE = None # path of the cache file
+ANALYSIS_CACHE_SIZE = 64 << 20 # bytes the file may take at most
+CACHE_MIN_DEPTH = 2 # shallower results are cheaper to search again than to keep on disk
+analysisCache = None
+
 
 '''
 Picks and returns a random move.
@@ -149,21 +305,360 @@ Finds the best move using basic heuristic evaluation.
       on static evaluation (e.g., material advantage or position).
 '''
 def findBestMove(gs, validMoves, returnQueue):
-    global nextMove, whitePawnScores, blackPawnScores
+    returnQueue.put(chooseMove(gs, validMoves)[0])
+
+'''
+Like findBestMove for analysis and hints: puts the ranked list of the best lines, as searchMultiPV returns it,
+on the returnQueue.
+'''
+def findBestLines(gs, validMoves, returnQueue, lines=MULTI_PV_LINES):
+    returnQueue.put(searchMultiPV(gs, validMoves, DEPTH, lines))
+
+'''
+Picks the AI move for the current position, this is what findBestMove and searchWorker hand back.
+timeLimit and stopRequested are passed on to searchPosition, returns its (move, score, pv).
+'''
+def chooseMove(gs, validMoves, timeLimit=None, stopRequested=None):
+    global nextMove
     nextMove = None
     random.shuffle(validMoves)
+    return searchPosition(gs, validMoves, DEPTH, timeLimit, stopRequested)
+
+'''
+Long-lived AI process. Instead of starting (and killing) a process for every move the GUI starts this once
+and sends it jobs, so undo or "move now" only has to ask the running search to stop.
+Positions arrive through a SharedSearchSlot rather than pickled, only the search id goes through the queues.
+    
+    Parameters:
+        jobQueue (Queue): search ids to work on, None shuts the worker down.
+        returnQueue (Queue): receives the search id once its move is in the result slot.
+        stopSearchId (Value): shared word, the search for job searchId stops once stopSearchId.value >= searchId.
+        slotName (str): name of the SharedSearchSlot the positions are written to.
+'''
+def searchWorker(jobQueue, returnQueue, stopSearchId, slotName):
+    slot = SharedSearchSlot(slotName)
+    gs = GameState()
+    while True:
+        searchId = jobQueue.get()
+        if searchId is None:
+            break
+        if not slot.readPosition(gs, searchId):
+            continue # a newer position was written already, nobody waits for this one
+        validMoves = gs.getValidMoves()
+        move, score, pv = chooseMove(gs, validMoves, TIME_LIMIT, lambda: stopSearchId.value >= searchId)
+        slot.writeResult(searchId, move, score)
+        returnQueue.put(searchId)
+    slot.close()
+
+'''
+Searches the position with iterative deepening up to depth and returns the result of the deepest iteration.
+    
+    Parameters:
+        gs (GameState): The current game state instance.
+        validMoves (list): A list of all valid moves for the current turn.
+        depth (int): Depth of the last iteration.
+        timeLimit (float): Seconds after which the search stops, None for no limit.
+        stopRequested (function): Called every few nodes, the search stops when it returns True.
+        onIteration (function): Called after every completed iteration with its depth, best Move and score.
+    
+    Returns:
+        (Move, float, list): The best move, its score for the side to move and the principal variation
+        (the best move followed by the expected replies). When the search is stopped these come from
+        the deepest iteration that completed.
+'''
+def searchPosition(gs, validMoves, depth, timeLimit=None, stopRequested=None, onIteration=None):
+    global nextMove, previousPv, nodes, searchStopped, deadline, stopCallback, rootMoveCount
+    stopCallback = stopRequested
+    deadline = None if timeLimit is None else time.perf_counter() + timeLimit
+    nodes = 0
+    searchStopped = False
+    BOT = 1 if gs.whiteToMove else -1
+    rootInCheck = gs.inCheck
+    rootMoves = moveBuffers[0]
+    for i, move in enumerate(validMoves):
+        rootMoves[i] = move.encode()
+    rootMoveCount = len(validMoves)
+    previousPv = []
+    score = 0
+    bestMove, bestScore, pv = None, 0, []
+    for i in range(len(historyScores)):
+        historyScores[i] >>= 1 # older cutoffs count less than the ones from this search
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
+
+    # an earlier search (of a neighbouring position, or of this one before an undo) may have searched this
+    # position already: its iterations don't have to be repeated, deeper ones start from its result.
+    # A result deeper than depth isn't used, the caller asked for this horizon (e.g. to compare two moves)
+    firstDepth = 1
+    openAnalysisCache()
+    entry = probeTransposition(gs.hash)
+    if entry is not None and entry[3] == TT_EXACT and entry[1] <= depth and \
+            entry[4] in rootMoves[:len(validMoves)]:
+        pv = tablePrincipalVariation(gs, entry[1])
+        bestMove, bestScore, score = pv[0], entry[2], entry[2]
+        previousPv = pv
+        firstDepth = entry[1] + 1
+
+    for currentDepth in range(firstDepth, depth + 1):
+        score = aspirationSearch(gs, currentDepth, None if currentDepth == 1 else score, BOT, rootInCheck)
+        if searchStopped:
+            break # this iteration didn't finish, keep the result of the previous one
+        pv = pvTable[0][:pvLength[0]]
+        if not pv and rootMoveCount:
+            # every move gets mated, none beat alpha and no line was stored: keep the move we had
+            pv = [bestMove if bestMove is not None else rootMoves[0]]
+        previousPv = pv
+        bestScore = score
+        if pv:
+            bestMove = pv[0]
+        if PRINT_SEARCH_PROGRESS:
+            print("depth", currentDepth, score, " ".join(str(move) for move in decodeLine(gs, pv)))
+        if onIteration is not None and pv:
+            onIteration(currentDepth, gs.decodeMove(pv[0]), score)
+
+    gs.inCheck = rootInCheck
+    if bestMove is None and validMoves:
+        bestMove = rootMoves[0] # stopped before the first iteration finished, take the best ordered move
+    if bestMove is not None:
+        # hand back the caller's own Move objects: the root move from validMoves, then the rest of the line
+        bestMove = next(move for move in validMoves if move.encode() == bestMove)
+        pv = [bestMove] + decodeLine(gs, pv)[1:] if pv else []
+    nextMove = bestMove
+    return bestMove, bestScore, pv
 
-    if gs.playerWantsToPlayAsBlack:
-        # Swap the variables
-        whitePawnScores, blackPawnScores = blackPawnScores, whitePawnScores
+'''
+Searches the root to depth with an aspiration window around score, the previous iteration's score (None for
+the full window), and widens the window until the score falls inside it.
+Returns the score, pvTable[0] holds the line.
+'''
+def aspirationSearch(gs, depth, score, turnMultiplier, inCheck):
+    if score is None:
+        alpha, beta = -CHECKMATE, CHECKMATE
+    else:
+        window = ASPIRATION_WINDOW
+        alpha, beta = score - window, score + window
+    while True:
+        gs.inCheck = inCheck
+        score = findMoveNegaMaxAlphaBeta(gs, depth, alpha, beta, turnMultiplier)
+        if searchStopped:
+            return score
+        if score <= alpha and alpha > -CHECKMATE: # failed low, widen downwards
+            window *= 2
+            alpha = max(score - window, -CHECKMATE)
+        elif score >= beta and beta < CHECKMATE: # failed high, widen upwards
+            window *= 2
+            beta = min(score + window, CHECKMATE)
+        else:
+            return score
+
+'''
+Multi-PV search: the position's best moves, each with its score and line, by iterative deepening.
+See MULTI_PV_LINES for how the lines are searched.
 
+    Parameters:
+        gs (GameState): The current game state instance.
+        validMoves (list): A list of all valid moves for the current turn.
+        depth (int): Depth of the last iteration.
+        lines (int): How many moves to rank, fewer if the position has fewer moves.
+        timeLimit (float): Seconds after which the search stops, None for no limit.
+        stopRequested (function): Called every few nodes, the search stops when it returns True.
+        onIteration (function): Called after every completed iteration with its depth and ranked lines.
+
+    Returns:
+        list: (Move, float, list) per line, best first: the move, its score for the side to move and the
+        principal variation starting with the move. When the search is stopped these come from the deepest
+        iteration that completed, or the lines finished so far if not even the first one did.
+'''
+def searchMultiPV(gs, validMoves, depth, lines=MULTI_PV_LINES, timeLimit=None, stopRequested=None,
+                  onIteration=None):
+    global nextMove, previousPv, nodes, searchStopped, deadline, stopCallback, rootMoveCount, rootMovesExcluded
+    stopCallback = stopRequested
+    deadline = None if timeLimit is None else time.perf_counter() + timeLimit
+    nodes = 0
+    searchStopped = False
     BOT = 1 if gs.whiteToMove else -1
+    rootInCheck = gs.inCheck
+    openAnalysisCache()
+    codes = [move.encode() for move in validMoves]
+    lines = min(lines, len(validMoves))
+    for i in range(len(historyScores)):
+        historyScores[i] >>= 1
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
+
+    ranked = [] # (score, line as move codes) of every line of the last completed iteration, best first
+    try:
+        for currentDepth in range(1, depth + 1):
+            found = []
+            for i in range(lines):
+                # the root without the moves of the lines already found in this iteration
+                excluded = [line[0] for _, line in found]
+                rootMoves = moveBuffers[0]
+                rootMoveCount = 0
+                for code in codes:
+                    if code not in excluded:
+                        rootMoves[rootMoveCount] = code
+                        rootMoveCount += 1
+                rootMovesExcluded = i > 0
+                previousScore, previousPv = ranked[i] if i < len(ranked) else (None, [])
+                score = aspirationSearch(gs, currentDepth, previousScore, BOT, rootInCheck)
+                if searchStopped:
+                    break
+                # every move gets mated: no line was better than the window, the first move searched stands in
+                line = pvTable[0][:pvLength[0]] or [rootMoves[0]]
+                found.append((score, line))
+            if searchStopped:
+                if not ranked:
+                    ranked = found
+                break
+            found.sort(key=lambda result: -result[0]) # a later line can come out better than an earlier one
+            ranked = found
+            if PRINT_SEARCH_PROGRESS:
+                for i, (score, line) in enumerate(ranked):
+                    print("depth", currentDepth, "line", i + 1, score,
+                          " ".join(str(move) for move in decodeLine(gs, line)))
+            if onIteration is not None:
+                onIteration(currentDepth, [(gs.decodeMove(line[0]), score) for score, line in ranked])
+    finally:
+        rootMovesExcluded = False
+        gs.inCheck = rootInCheck
+
+    if not ranked and validMoves:
+        ranked = [(0, [moveBuffers[0][0]])] # stopped before the first line finished, take the best ordered move
+    results = []
+    for score, line in ranked:
+        move = validMoves[codes.index(line[0])] # the caller's own Move object, then the rest of the line
+        results.append((move, score, [move] + decodeLine(gs, line)[1:]))
+    previousPv = ranked[0][1] if ranked else []
+    nextMove = results[0][0] if results else None
+    return results
+
+'''
+Follows the best moves stored in the transposition table from the current position, up to length moves.
+Returns them as move codes.
+'''
+def tablePrincipalVariation(gs, length):
+    inCheck = gs.inCheck
+    pv = []
+    while len(pv) < min(length, MAX_PLY):
+        entry = probeTransposition(gs.hash)
+        if entry is None or entry[4] is None:
+            break
+        count = gs.fillValidMoves(pvMoveBuffer)
+        if entry[4] not in pvMoveBuffer[:count]:
+            break
+        pv.append(entry[4])
+        gs.makeMoveCode(entry[4])
+    for move in reversed(pv):
+        gs.undoMoveCode(move)
+    gs.inCheck = inCheck
+    return pv
+
+'''
+Turns a line of move codes, played one after the other from the current position, into Move objects.
+'''
+def decodeLine(gs, line):
+    moves = []
+    for move in line:
+        moves.append(gs.decodeMove(move))
+        gs.makeMoveCode(move)
+    for move in reversed(line):
+        gs.undoMoveCode(move)
+    return moves
+
+'''
+Counts a node and every STOP_CHECK_INTERVAL nodes checks whether the search has to stop.
+'''
+def checkStop():
+    global nodes, searchStopped
+    nodes += 1
+    if nodes % STOP_CHECK_INTERVAL == 0:
+        if (deadline is not None and time.perf_counter() >= deadline) or \
+                (stopCallback is not None and stopCallback()):
+            searchStopped = True
+    return searchStopped
+
+
+'''
+Forgets everything the searches learned: transposition table, history scores and the last PV.
+'''
+def clearSearchState():
+    global previousPv, ttProbes, ttHits
+    for i in range(TT_SIZE):
+        transpositionTable[i] = None
+    for i in range(len(historyScores)):
+        historyScores[i] = 0
+    for killers in killerMoves:
+        killers[0] = killers[1] = None
+    previousPv = []
+    ttProbes = 0
+    ttHits = 0
+
+'''
+Transposition table statistics.
+    
+    Returns:
+        dict: probes, hits, hit rate and how many of the slots are in use.
+'''
+def ttStats():
+    used = TT_SIZE - transpositionTable.count(None)
+    return {"probes": ttProbes, "hits": ttHits, "hitRate": ttHits / ttProbes if ttProbes else 0.0,
+            "size": TT_SIZE, "used": used}
+
+'''
+Stores a search result in the transposition table, unless a deeper result for the same position is there.
+'''
+def storeTransposition(key, depth, score, flag, move):
+    index = key & (TT_SIZE - 1)
+    entry = transpositionTable[index]
+    if entry is None or entry[0] != key or depth >= entry[1]:
+        transpositionTable[index] = (key, depth, score, flag, move)
+    if analysisCache is not None and depth >= CACHE_MIN_DEPTH:
+        analysisCache.store(key, depth, score, flag, move)
+
+'''
+The transposition table entry of the position with hash key, None if there is none. The analysis cache is asked
+when the table doesn't know the position, what it has is copied into the table.
+'''
+def probeTransposition(key):
+    index = key & (TT_SIZE - 1)
+    entry = transpositionTable[index]
+    if entry is not None and entry[0] == key:
+        return entry
+    if analysisCache is None:
+        return None
+    entry = analysisCache.probe(key)
+    if entry is not None:
+        transpositionTable[index] = entry
+    return entry
 
-    findMoveNegaMaxAlphaBeta(gs, validMoves, DEPTH, -
-    CHECKMATE, CHECKMATE, BOT)
+'''
+Opens the analysis cache at ANALYSIS_CACHE_FILE the first time this process searches, and starts a new
+generation in it. Returns the cache, None while it is off.
+'''
+def openAnalysisCache():
+    global analysisCache
+    if analysisCache is None and ANALYSIS_CACHE_FILE is not None:
+        analysisCache = AnalysisCache(ANALYSIS_CACHE_FILE, ANALYSIS_CACHE_SIZE, evaluationKey())
+        analysisCache.newGeneration()
+    return analysisCache
 
-    returnQueue.put(nextMove)
+'''
+Closes the analysis cache, the next search opens ANALYSIS_CACHE_FILE again.
+'''
+def closeAnalysisCache():
+    global analysisCache
+    if analysisCache is not None:
+        analysisCache.close()
+        analysisCache = None
 
+'''
+Checksum of everything scoreBoard's scores depend on, the analysis cache's salt.
+'''
+def evaluationKey():
+    return zlib.crc32(repr((pieceScore, piecePositionScores, DOUBLED_PAWN_PENALTY, ISOLATED_PAWN_PENALTY,
+                            PASSED_PAWN_BONUS, PAWN_SHIELD_BONUS, CHECKMATE, STALEMATE,
+                            SET_WHITE_AS_BOT)).encode())
 
 '''
 Finds best move by minimax algorithm.
@@ -171,11 +666,14 @@ Uses the NegaMax algorithm with alpha-beta pruning to evaluate the best move.
     
     Parameters:
         gs (GameState): The game state instance to analyze.
-        validMoves (list): A list of all valid moves for the current turn.
         depth (int): The current depth of the search tree.
         alpha (float): The alpha value in alpha-beta pruning (best already explored option for maximizer).
         beta (float): The beta value in alpha-beta pruning (best already explored option for minimizer).
         turnMultiplier (int): Multiplier (1 or -1) to switch evaluation based on player's turn.
+        allowNullMove (bool): False right after a null move so the side to move can't pass twice in a row.
+        ply (int): Distance from the root, used for the PV table.
+    
+    gs.inCheck has to say whether the side to move is in check, the parent sets it after playing its move.
     
     Returns:
         (float): The score of the best move found.
@@ -184,34 +682,349 @@ Uses the NegaMax algorithm with alpha-beta pruning to evaluate the best move.
     - Explores the decision tree to a specified depth.
     - Ensures computational efficiency by pruning branches that cannot influence the outcome.
     - Prioritizes moves leading to gains while avoiding losses.
+    - Prunes with null moves and reduces late quiet moves, see NULL_MOVE_PRUNING and LATE_MOVE_REDUCTIONS.
+    - Searches the first move with the full window and scouts the rest with a null window (PVS).
+    - Stores the best line from this node in pvTable[ply].
+    - Reuses earlier results through the transposition table and orders quiet moves by history.
 
 '''
 
 
-def findMoveNegaMaxAlphaBeta(gs, validMoves, depth, alpha, beta, turnMultiplier):
-    global nextMove
-    if depth == 0:
+def findMoveNegaMaxAlphaBeta(gs, depth, alpha, beta, turnMultiplier, allowNullMove=True, ply=0):
+    global ttProbes, ttHits
+    pvLength[ply] = 0
+    if checkStop():
+        return 0
+    inCheck = gs.inCheck
+    if depth <= 0 or ply == MAX_PLY - 1:
+        gs.hasLegalMove(moveBuffers[ply]) # sets checkMate and staleMate for scoreBoard
         return turnMultiplier * scoreBoard(gs)
 
-    # (will add later) move ordering - like evaluate all the move first that results in check or evaluate all the move first that results in capturing opponent's queen
+    key = gs.hash
+    ttMove = None
+    ttProbes += 1
+    entry = transpositionTable[key & (TT_SIZE - 1)]
+    if analysisCache is not None and (entry is None or entry[0] != key) and depth >= CACHE_MIN_DEPTH:
+        entry = probeTransposition(key)
+    if entry is not None and entry[0] == key:
+        ttHits += 1
+        ttMove = entry[4]
+        if ply != 0 and (entry[1] == depth if TT_SAME_DEPTH_ONLY else entry[1] >= depth):
+            ttScore, flag = entry[2], entry[3]
+            if flag == TT_EXACT or (flag == TT_LOWER and ttScore >= beta) or (flag == TT_UPPER and ttScore <= alpha):
+                if alpha < ttScore < beta:
+                    # the score is inside the window, so the stored line becomes part of the PV
+                    line = tablePrincipalVariation(gs, depth)
+                    pvTable[ply][:len(line)] = line
+                    pvLength[ply] = len(line)
+                return ttScore
+    alphaOriginal = alpha
+
+    if (NULL_MOVE_PRUNING and allowNullMove and ply != 0 and depth > NULL_MOVE_REDUCTION
+            and not inCheck):
+        gs.makeNullMove()
+        gs.inCheck = False # the side that passed wasn't giving check
+        score = -findMoveNegaMaxAlphaBeta(gs, depth - 1 - NULL_MOVE_REDUCTION, -beta, -beta + NULL_WINDOW,
+                                          -turnMultiplier, False, ply + 1)
+        gs.undoNullMove()
+        if searchStopped:
+            return 0
+        if score >= beta:
+            if not (NULL_MOVE_VERIFICATION and isZugzwangProne(gs)):
+                storeTransposition(key, depth, beta, TT_LOWER, ttMove)
+                return beta
+            # passing may be the only thing that doesn't lose here, only trust the cutoff if a real move also holds
+            gs.inCheck = inCheck
+            verified = findMoveNegaMaxAlphaBeta(gs, depth - NULL_MOVE_REDUCTION, beta - NULL_WINDOW, beta,
+                                                turnMultiplier, False, ply)
+            if searchStopped:
+                return 0
+            if verified >= beta:
+                storeTransposition(key, depth, beta, TT_LOWER, ttMove)
+                return beta
+            pvLength[ply] = 0
 
+    board = gs.board
     maxScore = -CHECKMATE
-    for move in validMoves:
-        gs.makeMove(move)
-        nextMoves = gs.getValidMoves()  # opponent valid moves
-        score = -findMoveNegaMaxAlphaBeta(gs, nextMoves, depth - 1, -beta, -alpha, -turnMultiplier)
+    bestMove = None
+    legalMoves = 0
+    for move in pickMoves(gs, ply, ttMove, inCheck):
+        end = move >> 6 & 63
+        quiet = board[end >> 3][end & 7] == "--" and move >> 12 != MOVE_ENPASSANT and move >> 12 < MOVE_PROMOTION
+        gs.makeMoveCode(move)
+        if gs.leavesKingInCheck(move, inCheck):
+            gs.undoMoveCode(move)
+            continue
+        legalMoves += 1
+        givesCheck = gs.inCheck = gs.kingInCheck()
+        if legalMoves == 1:
+            score = -findMoveNegaMaxAlphaBeta(gs, depth - 1, -beta, -alpha, -turnMultiplier, True, ply + 1)
+        else:
+            fullDepth = True
+            if (LATE_MOVE_REDUCTIONS and legalMoves > LMR_FULL_DEPTH_MOVES and depth >= LMR_MIN_DEPTH and not inCheck
+                    and not givesCheck and quiet):
+                score = -findMoveNegaMaxAlphaBeta(gs, depth - 2, -alpha - NULL_WINDOW, -alpha,
+                                                  -turnMultiplier, True, ply + 1)
+                fullDepth = score > alpha  # the reduced search says this late move is better than expected
+            if fullDepth:
+                # scout with a null window, only a move that beats alpha gets the full window
+                gs.inCheck = givesCheck
+                score = -findMoveNegaMaxAlphaBeta(gs, depth - 1, -alpha - NULL_WINDOW, -alpha,
+                                                  -turnMultiplier, True, ply + 1)
+                if alpha < score < beta:
+                    gs.inCheck = givesCheck
+                    score = -findMoveNegaMaxAlphaBeta(gs, depth - 1, -beta, -alpha,
+                                                      -turnMultiplier, True, ply + 1)
+        gs.undoMoveCode(move)
+        if searchStopped:
+            return 0
         if score > maxScore:
             maxScore = score
-            if depth == DEPTH:
-                nextMove = move
-                print(move, score)
-        gs.undoMove()
+            bestMove = move
         if maxScore > alpha:
             alpha = maxScore  # alpha is the new max
+            # this move is the new best line: the move followed by the child's best line
+            pvTable[ply][0] = move
+            childLength = pvLength[ply + 1]
+            pvTable[ply][1:childLength + 1] = pvTable[ply + 1][:childLength]
+            pvLength[ply] = childLength + 1
         if alpha >= beta:  # if we find new max is greater than minimum so far in a branch then we stop iterating in that branch as we found a worse move in that branch
+            if quiet:
+                updateHistory(gs, move, depth)
+                killers = killerMoves[ply]
+                if killers[0] != move:
+                    killers[1] = killers[0]
+                    killers[0] = move
             break
+
+    if not legalMoves:
+        return -CHECKMATE if inCheck else STALEMATE
+    if maxScore <= alphaOriginal:
+        flag = TT_UPPER
+    elif maxScore >= beta:
+        flag = TT_LOWER
+    else:
+        flag = TT_EXACT
+    if ply != 0 or not rootMovesExcluded:
+        storeTransposition(key, depth, maxScore, flag, bestMove)
     return maxScore
 
+'''
+Yields the moves of the node at ply as move codes, best ordered first, see killerMoves for the stages.
+The root's moves (searchPosition put them in moveBuffers[0]) and the moves out of check, where most pseudo
+legal moves are illegal anyway, are generated and ordered all at once: the move the previous iteration
+expected here, then the best move stored for this position, then captures, the most valuable victim by the
+least valuable attacker first, then quiet moves by history.
+The moves are pseudo legal, the caller still has to check them with gs.leavesKingInCheck.
+'''
+def pickMoves(gs, ply, ttMove, inCheck):
+    moves = moveBuffers[ply]
+    keys = orderKeys[ply]
+    pvMove = previousPv[ply] if ply < len(previousPv) else None
+    if ply == 0 or inCheck:
+        count = rootMoveCount if ply == 0 else gs.fillPseudoLegalMoves(moves)
+        for i in range(count):
+            move = moves[i]
+            if move == pvMove:
+                keys[i] = PV_MOVE_KEY
+            elif move == ttMove:
+                keys[i] = TT_MOVE_KEY
+            else:
+                keys[i] = moveOrderKey(gs, move)
+        for i in range(count):
+            yield pickNextMove(moves, keys, i, count)
+        return
+
+    # hash moves, they may come from another position that shares the slot or the line
+    first = pvMove if pvMove is not None and gs.isPseudoLegal(pvMove) else None
+    if first is not None:
+        yield first
+    second = ttMove if ttMove is not None and ttMove != first and gs.isPseudoLegal(ttMove) else None
+    if second is not None:
+        yield second
+
+    # captures and promotions by most valuable victim / least valuable attacker, losing ones may be put aside
+    badCaptures = badCaptureBuffers[ply]
+    badCount = 0
+    count = gs.fillPseudoLegalMoves(moves, GENERATE_CAPTURES)
+    for i in range(count):
+        keys[i] = moveOrderKey(gs, moves[i])
+    for i in range(count):
+        move = pickNextMove(moves, keys, i, count)
+        if move == first or move == second:
+            continue
+        if DEFER_LOSING_CAPTURES and isLosingCapture(gs, move):
+            badCaptures[badCount] = move
+            badCount += 1
+            continue
+        yield move
+
+    # killers, if they are quiet moves here too
+    board = gs.board
+    killer1, killer2 = killerMoves[ply]
+    for killer in (killer1, killer2):
+        if killer is not None and killer != first and killer != second:
+            end = killer >> 6 & 63
+            if board[end >> 3][end & 7] == "--" and gs.isPseudoLegal(killer):
+                yield killer
+
+    # quiet moves by history
+    count = gs.fillPseudoLegalMoves(moves, GENERATE_QUIETS)
+    for i in range(count):
+        keys[i] = moveOrderKey(gs, moves[i])
+    for i in range(count):
+        move = pickNextMove(moves, keys, i, count)
+        if move != first and move != second and move != killer1 and move != killer2:
+            yield move
+
+    for i in range(badCount):
+        yield badCaptures[i]
+
+'''
+True for a capture that looks like it loses material: the victim is worth less than the capturing piece
+and the square is defended. En passant and promotions never count as losing.
+'''
+def isLosingCapture(gs, move):
+    if move >> 12 != MOVE_NORMAL:
+        return False
+    board = gs.board
+    start = move & 63
+    end = move >> 6 & 63
+    attacker = board[start >> 3][start & 7]
+    victim = board[end >> 3][end & 7]
+    return pieceScore[victim[1]] < pieceScore[attacker[1]] and gs.squareUnderAttack(end >> 3, end & 7, attacker[0])
+
+'''
+Selection sort step of the move loops: swaps the best ordered of moves[i:count] into slot i and returns it.
+Most nodes cut off after a move or two, sorting all their moves up front would mostly be wasted.
+'''
+def pickNextMove(moves, keys, i, count):
+    best = i
+    bestKey = keys[i]
+    for j in range(i + 1, count):
+        if keys[j] > bestKey:
+            best = j
+            bestKey = keys[j]
+    move = moves[best]
+    if best != i:
+        moves[best] = moves[i]
+        keys[best] = keys[i]
+        moves[i] = move
+        keys[i] = bestKey
+    return move
+
+'''
+Rewards a quiet move that caused a cutoff, deeper cutoffs count more. Called with the move taken back.
+'''
+def updateHistory(gs, move, depth):
+    start = move & 63
+    index = PIECE_CODES[gs.board[start >> 3][start & 7]] * 64 + (move >> 6 & 63)
+    historyScores[index] += depth * depth
+    if historyScores[index] >= HISTORY_LIMIT:
+        for i in range(len(historyScores)):
+            historyScores[i] >>= 1
+
+'''
+Quiescence search: from a position the main search would evaluate statically, keep playing captures and
+promotions (all moves when in check) until the position is quiet, so the evaluation doesn't stop in the
+middle of an exchange. The side to move can always "stand pat" on the static score instead of capturing.
+Only the captures are generated, pseudo legal, and a capture is tested for legality when it is played.
+Delta pruning skips captures that can't bring the score up to alpha even with DELTA_MARGIN to spare.
+A position without legal moves is only recognised when in check (mate), a stalemate stands pat.
+    
+    Parameters:
+        gs (GameState): The game state instance to analyze.
+        alpha (float): Lower bound of the window.
+        beta (float): Upper bound of the window.
+        turnMultiplier (int): 1 if white is to move, -1 for black.
+        ply (int): Distance from where the quiescence search started, used for the PV table.
+    
+    Returns:
+        (float): The score for the side to move, pvTable[ply] holds the capture line leading to the quiet position.
+'''
+def quiescenceSearch(gs, alpha, beta, turnMultiplier, ply=0):
+    pvLength[ply] = 0
+    moves = moveBuffers[ply]
+    inCheck = gs.inCheck = gs.kingInCheck()
+    if not inCheck or ply == MAX_PLY - 1:
+        bestScore = turnMultiplier * scoreBoard(gs)
+        if bestScore >= beta or ply == MAX_PLY - 1:
+            return bestScore
+        alpha = max(alpha, bestScore)
+        count = gs.fillPseudoLegalMoves(moves, GENERATE_CAPTURES)
+        # delta pruning, promotions are always kept
+        board = gs.board
+        margin = alpha - bestScore - DELTA_MARGIN
+        kept = 0
+        for i in range(count):
+            move = moves[i]
+            kind = move >> 12
+            if kind < MOVE_PROMOTION:
+                end = move >> 6 & 63
+                if (1 if kind == MOVE_ENPASSANT else pieceScore[board[end >> 3][end & 7][1]]) < margin:
+                    continue
+            moves[kept] = move
+            kept += 1
+        count = kept
+    else:
+        bestScore = -CHECKMATE
+        count = gs.fillPseudoLegalMoves(moves)
+    keys = orderKeys[ply]
+    for i in range(count):
+        keys[i] = moveOrderKey(gs, moves[i])
+
+    for i in range(count):
+        move = pickNextMove(moves, keys, i, count)
+        gs.makeMoveCode(move)
+        if gs.leavesKingInCheck(move, inCheck):
+            gs.undoMoveCode(move)
+            continue
+        score = -quiescenceSearch(gs, -beta, -alpha, -turnMultiplier, ply + 1)
+        gs.undoMoveCode(move)
+        if score > bestScore:
+            bestScore = score
+        if score > alpha:
+            alpha = score
+            pvTable[ply][0] = move
+            childLength = pvLength[ply + 1]
+            pvTable[ply][1:childLength + 1] = pvTable[ply + 1][:childLength]
+            pvLength[ply] = childLength + 1
+            if alpha >= beta:
+                break
+    return bestScore
+
+'''
+Sort key for move ordering: promotions, then captures by most valuable victim / least valuable attacker,
+then quiet moves by their history score (always below 1, so below every capture). move is a move code.
+'''
+def moveOrderKey(gs, move):
+    board = gs.board
+    start = move & 63
+    end = move >> 6 & 63
+    kind = move >> 12
+    pieceMoved = board[start >> 3][start & 7]
+    pieceCaptured = "wp" if kind == MOVE_ENPASSANT else board[end >> 3][end & 7]
+    key = 0
+    if kind >= MOVE_PROMOTION:
+        key += 10 * pieceScore["Q"]
+    if pieceCaptured != "--":
+        key += 10 * pieceScore[pieceCaptured[1]] - pieceScore[pieceMoved[1]] + 1
+    elif kind < MOVE_PROMOTION:
+        key += historyScores[PIECE_CODES[pieceMoved] * 64 + end] / HISTORY_LIMIT
+    return key
+
+'''
+True if the side to move has nothing but king and pawns, the positions where passing (a null move)
+can be better than any real move and null move pruning goes wrong.
+'''
+def isZugzwangProne(gs):
+    color = 'w' if gs.whiteToMove else 'b'
+    for row in gs.board:
+        for square in row:
+            if square[0] == color and square[1] != 'p' and square[1] != 'K':
+                return False
+    return True
+
 '''
 Evaluate the board state for scoring the AI's decision-making.
 This function combines material and positional evaluation.
@@ -252,10 +1065,7 @@ def scoreBoard(gs):
                 # score positionally based on piece type
                 if square[1] != "K":
                     # return score of the piece at that position
-                    if square[1] == "p":
-                        piecePositionScore = piecePositionScores[square][row][col]
-                    else:
-                        piecePositionScore = piecePositionScores[square[1]][row][col]
+                    piecePositionScore = piecePositionScores[square][row][col]
                 if SET_WHITE_AS_BOT:
                     if square[0] == 'w':
                         score += pieceScore[square[1]] + piecePositionScore * .1
@@ -267,8 +1077,128 @@ def scoreBoard(gs):
                     elif square[0] == 'b':
                         score += pieceScore[square[1]] + piecePositionScore * .1
 
+    # pawn structure and king shield, cached per pawn structure
+    key, pawnScore, whiteShield, blackShield = probePawnStructure(gs)
+    if gs.whiteKingLocation[0] == 7:
+        pawnScore += whiteShield[gs.whiteKingLocation[1]]
+    if gs.blackKingLocation[0] == 0:
+        pawnScore -= blackShield[gs.blackKingLocation[1]]
+    if SET_WHITE_AS_BOT:
+        score += pawnScore
+    else:
+        score -= pawnScore
+
     return score
 
+'''
+Looks up the pawn structure of gs in the pawn hash table, evaluating and storing it on a miss.
+    
+    Returns:
+        tuple: (pawn key, pawn score, white shield, black shield) as described in evaluatePawnStructure.
+'''
+def probePawnStructure(gs):
+    global pawnHashProbes, pawnHashHits
+    key = gs.pawnHash
+    index = key & (PAWN_HASH_SIZE - 1)
+    entry = pawnHashTable[index]
+    pawnHashProbes += 1
+    if entry is not None and entry[0] == key:
+        pawnHashHits += 1
+        return entry
+    entry = (key,) + evaluatePawnStructure(gs.board)
+    pawnHashTable[index] = entry
+    return entry
+
+'''
+Evaluates the pawns on the board, nothing but the pawns is looked at so the result can be cached by pawn hash.
+    
+    Parameters:
+        board (list): 8x8 board like GameState.board.
+    
+    Returns:
+        tuple: (score, whiteShield, blackShield). score covers doubled, isolated and passed pawns in pawns
+        from white's point of view. whiteShield[file] is the shield bonus white gets if its king stands on
+        that file of its back rank, blackShield the same for black.
+'''
+def evaluatePawnStructure(board):
+    score = 0
+    shields = []
+    for sign, (doubled, isolated, passed, shield) in zip((1, -1), countPawnStructure(board)):
+        score -= sign * (DOUBLED_PAWN_PENALTY * doubled + ISOLATED_PAWN_PENALTY * isolated)
+        score += sign * sum(bonus * count for bonus, count in zip(PASSED_PAWN_BONUS, passed))
+        shields.append(tuple(sum(bonus * count for bonus, count in zip(PAWN_SHIELD_BONUS, fileCounts))
+                             for fileCounts in shield))
+    return score, shields[0], shields[1]
+
+'''
+Counts the pawn structure features evaluatePawnStructure weighs, kept apart so the tuner can fit the weights.
+    
+    Parameters:
+        board (list): 8x8 board like GameState.board.
+    
+    Returns:
+        tuple: (white, black), each (doubled, isolated, passed, shield). doubled counts the extra pawns on
+        files, isolated the pawns without own pawns next to them, passed[n] the passed pawns that advanced
+        n ranks and shield[file] the own pawns one and two ranks in front of a king on that back rank file.
+'''
+def countPawnStructure(board):
+    pawnRows = {"wp": [[] for _ in range(8)], "bp": [[] for _ in range(8)]} # rows of the pawns on every file
+    for r in range(8):
+        for c in range(8):
+            square = board[r][c]
+            if square == "wp" or square == "bp":
+                pawnRows[square][c].append(r)
+
+    counts = []
+    for color, forward in (("w", -1), ("b", 1)): # white pawns move up the board, towards row 0
+        own = pawnRows[color + "p"]
+        enemy = pawnRows[("b" if color == "w" else "w") + "p"]
+        startRow = 6 if forward == -1 else 1
+        backRow = 7 if forward == -1 else 0
+        doubled = 0
+        isolated = 0
+        passed = [0] * 8
+        for c in range(8):
+            rows = own[c]
+            if not rows:
+                continue
+            doubled += len(rows) - 1
+            if (c == 0 or not own[c - 1]) and (c == 7 or not own[c + 1]):
+                isolated += len(rows)
+            for r in rows:
+                # passed if no enemy pawn is ahead of it on its own file or the files next to it
+                isPassed = True
+                for f in range(max(0, c - 1), min(7, c + 1) + 1):
+                    for enemyRow in enemy[f]:
+                        if (enemyRow - r) * forward > 0:
+                            isPassed = False
+                if isPassed:
+                    passed[(r - startRow) * forward] += 1
+
+        shield = []
+        for kingFile in range(8):
+            fileCounts = [0] * len(PAWN_SHIELD_BONUS)
+            for f in range(max(0, kingFile - 1), min(7, kingFile + 1) + 1):
+                for r in own[f]:
+                    ranksAhead = (r - backRow) * forward
+                    if 1 <= ranksAhead <= len(PAWN_SHIELD_BONUS):
+                        fileCounts[ranksAhead - 1] += 1
+            shield.append(fileCounts)
+        counts.append((doubled, isolated, passed, shield))
+    return counts[0], counts[1]
+
+'''
+Pawn hash table statistics, e.g. to check the table is big enough.
+    
+    Returns:
+        dict: probes, hits, hit rate and how many of the slots are in use.
+'''
+def pawnHashStats():
+    used = PAWN_HASH_SIZE - pawnHashTable.count(None)
+    return {"probes": pawnHashProbes, "hits": pawnHashHits,
+            "hitRate": pawnHashHits / pawnHashProbes if pawnHashProbes else 0.0,
+            "size": PAWN_HASH_SIZE, "used": used}
+
 
 
 
@@ -0,0 +1,232 @@
+"""
+Persistent analysis cache: search results (position hash -> depth, score, bound, best move) kept in a memory
+mapped file, so a position searched deeply in one run, or by another search process, doesn't have to be searched
+again. ChessAI uses it behind its transposition table when ANALYSIS_CACHE_FILE is set.
+
+The file is a header followed by a fixed number of buckets, its size never changes after it is created and is
+capped by maxBytes. A bucket holds BUCKET_ENTRIES entries and is 64 bytes, one cache line. An entry is two
+64-bit words: the result packed into one word and the hash XORed with that word in the other. Processes read
+and write entries without any locking: a reader only accepts an entry whose two words give back its hash, so
+an entry torn by two processes writing it at the same time just reads as a miss.
+
+Aging: results are stamped with the generation they were stored in, ChessAI starts a new generation whenever a
+process opens the cache. A new result goes into the bucket slot of the same position, else an empty slot, else
+the slot whose result is worth the least, shallow results from generations long ago first. A deeper result of
+the same position stays and only becomes current again. A result from an older evaluation (a different salt)
+is worthless, opening the cache with a new salt empties it.
+
+    python -m chess.analysisCache analysis.cache --stats
+    python -m chess.analysisCache analysis.cache --clear
+"""
+import argparse
+import mmap
+import os
+import struct
+
+MAGIC = b"CHESSAC1"
+HEADER_FORMAT = struct.Struct("<8sIIII") # magic, salt, bucket count, generation, entries per bucket
+HEADER_SIZE = 64 # the header is padded so the buckets start on a cache line
+ENTRY_FORMAT = struct.Struct("<QQ") # hash XOR data, data
+BUCKET_ENTRIES = 4
+BUCKET_FORMAT = struct.Struct("<%dQ" % (2 * BUCKET_ENTRIES))
+BUCKET_SIZE = BUCKET_FORMAT.size
+DEFAULT_SIZE = 64 << 20 # bytes
+SCORE_SCALE = 1000 # scores are stored in thousandths of a pawn
+NO_MOVE = 0xFFFF
+MAX_DEPTH = 63 # depth has 6 bits
+AGE_WEIGHT = 2 # a generation of age costs a result as much as this many plies of depth
+
+"""
+Data word: score (32 bits, signed) | move code << 32 (16 bits) | depth << 48 (6 bits) | flag << 54 (2 bits)
+| generation << 56 (8 bits). The move code of "no move" is NO_MOVE, so a used entry never has a data word of 0.
+"""
+
+
+class AnalysisCache:
+    """
+        Search results in a memory mapped file, shared by every process that opens the same path.
+        salt identifies the evaluation the scores come from.
+    """
+    def __init__(self, path, maxBytes=DEFAULT_SIZE, salt=0):
+        self.path = path
+        self.salt = salt & 0xFFFFFFFF
+        self.probes = 0
+        self.hits = 0
+        if not self.isUsable(path, maxBytes):
+            createFile(path, maxBytes, self.salt)
+        self.file = open(path, "r+b")
+        self.buffer = mmap.mmap(self.file.fileno(), 0)
+        _, salt, self.bucketCount, self.generation, _ = HEADER_FORMAT.unpack_from(self.buffer, 0)
+        if salt != self.salt:
+            self.clear() # the scores in there come from another evaluation
+
+    """
+        True if path is a cache file with the current layout that isn't bigger than maxBytes.
+    """
+    @staticmethod
+    def isUsable(path, maxBytes):
+        try:
+            with open(path, "rb") as file:
+                header = file.read(HEADER_FORMAT.size)
+                size = os.fstat(file.fileno()).st_size
+        except OSError:
+            return False
+        if len(header) < HEADER_FORMAT.size:
+            return False
+        magic, _, bucketCount, _, entries = HEADER_FORMAT.unpack(header)
+        return magic == MAGIC and entries == BUCKET_ENTRIES and size == HEADER_SIZE + bucketCount * BUCKET_SIZE \
+            and size <= max(maxBytes, HEADER_SIZE + BUCKET_SIZE)
+
+    """
+        Starts a new generation, results stored from now on are younger than every result already there.
+    """
+    def newGeneration(self):
+        _, _, _, generation, _ = HEADER_FORMAT.unpack_from(self.buffer, 0)
+        self.generation = (generation + 1) & 0xFF
+        HEADER_FORMAT.pack_into(self.buffer, 0, MAGIC, self.salt, self.bucketCount, self.generation, BUCKET_ENTRIES)
+
+    """
+        The result stored for the position with hash key as a transposition table entry
+        (hash, depth, score, flag, move), None if there is none.
+    """
+    def probe(self, key):
+        self.probes += 1
+        words = BUCKET_FORMAT.unpack_from(self.buffer, HEADER_SIZE + (key & (self.bucketCount - 1)) * BUCKET_SIZE)
+        for i in range(0, 2 * BUCKET_ENTRIES, 2):
+            data = words[i + 1]
+            if data and words[i] ^ data == key:
+                self.hits += 1
+                return unpackEntry(key, data)
+        return None
+
+    """
+        Stores a search result, see the module docstring for which slot of the bucket it takes.
+        A deeper result of the same position is kept instead, stamped with the current generation.
+    """
+    def store(self, key, depth, score, flag, move):
+        offset = HEADER_SIZE + (key & (self.bucketCount - 1)) * BUCKET_SIZE
+        words = BUCKET_FORMAT.unpack_from(self.buffer, offset)
+        generation = self.generation
+        slot = 0
+        slotWorth = None
+        for i in range(BUCKET_ENTRIES):
+            check, data = words[2 * i], words[2 * i + 1]
+            if not data:
+                worth = -1 << 20 # empty
+            else:
+                entryDepth = data >> 48 & 63
+                entryGeneration = data >> 56
+                if check ^ data == key:
+                    if entryDepth > depth:
+                        if entryGeneration != generation:
+                            data = data & ~(0xFF << 56) | generation << 56
+                            ENTRY_FORMAT.pack_into(self.buffer, offset + i * ENTRY_FORMAT.size, key ^ data, data)
+                        return
+                    slot = i
+                    break
+                worth = entryDepth - AGE_WEIGHT * ((generation - entryGeneration) & 0xFF)
+            if slotWorth is None or worth < slotWorth:
+                slot = i
+                slotWorth = worth
+        data = packData(depth, score, flag, move, generation)
+        ENTRY_FORMAT.pack_into(self.buffer, offset + slot * ENTRY_FORMAT.size, key ^ data, data)
+
+    """
+        Empties every bucket, e.g. after the evaluation changed.
+    """
+    def clear(self):
+        chunk = bytes(1 << 20)
+        for start in range(HEADER_SIZE, len(self.buffer), len(chunk)):
+            end = min(start + len(chunk), len(self.buffer))
+            self.buffer[start:end] = chunk[:end - start]
+        HEADER_FORMAT.pack_into(self.buffer, 0, MAGIC, self.salt, self.bucketCount, self.generation, BUCKET_ENTRIES)
+
+    """
+        Occupancy of the cache.
+
+            Returns:
+                dict: size in bytes, entry slots, used slots, the current generation, results stored in it
+                and this process's probes, hits and hit rate.
+    """
+    def stats(self):
+        used = current = 0
+        chunkBuckets = min(self.bucketCount, 1 << 14)
+        chunkFormat = struct.Struct("<%dQ" % (2 * BUCKET_ENTRIES * chunkBuckets))
+        for offset in range(HEADER_SIZE, len(self.buffer), chunkFormat.size):
+            words = chunkFormat.unpack_from(self.buffer, offset)
+            for i in range(1, len(words), 2):
+                if words[i]:
+                    used += 1
+                    current += words[i] >> 56 == self.generation
+        return {"bytes": len(self.buffer), "slots": self.bucketCount * BUCKET_ENTRIES, "used": used,
+                "generation": self.generation, "currentGeneration": current, "probes": self.probes,
+                "hits": self.hits, "hitRate": self.hits / self.probes if self.probes else 0.0}
+
+    """
+        Writes the mapped pages back to the file, the operating system does it anyway at some point.
+    """
+    def flush(self):
+        self.buffer.flush()
+
+    def close(self):
+        self.buffer.close()
+        self.file.close()
+
+
+'''
+Creates an empty cache file with as many buckets as fit in maxBytes (a power of two, at least one).
+It is built under a temporary name and renamed, a process opening the cache meanwhile never sees half a file.
+'''
+def createFile(path, maxBytes, salt):
+    bucketCount = 1
+    while HEADER_SIZE + 2 * bucketCount * BUCKET_SIZE <= maxBytes:
+        bucketCount *= 2
+    temporary = "%s.%d.tmp" % (path, os.getpid())
+    with open(temporary, "wb") as file:
+        file.write(HEADER_FORMAT.pack(MAGIC, salt, bucketCount, 0, BUCKET_ENTRIES).ljust(HEADER_SIZE, b"\0"))
+        file.truncate(HEADER_SIZE + bucketCount * BUCKET_SIZE)
+    os.replace(temporary, path)
+
+'''
+Packs a result into a data word, see the layout above.
+'''
+def packData(depth, score, flag, move, generation):
+    return ((round(score * SCORE_SCALE) & 0xFFFFFFFF) | (NO_MOVE if move is None else move) << 32
+            | min(depth, MAX_DEPTH) << 48 | flag << 54 | generation << 56)
+
+'''
+A data word as a transposition table entry (hash, depth, score, flag, move).
+'''
+def unpackEntry(key, data):
+    score = data & 0xFFFFFFFF
+    if score >= 1 << 31:
+        score -= 1 << 32
+    move = data >> 32 & 0xFFFF
+    return key, data >> 48 & 63, score / SCORE_SCALE, data >> 54 & 3, None if move == NO_MOVE else move
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspect or empty a persistent analysis cache.")
+    parser.add_argument("path")
+    parser.add_argument("--stats", action="store_true", help="print how full the cache is")
+    parser.add_argument("--clear", action="store_true", help="forget every stored result")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        parser.error("no cache at " + args.path)
+    with open(args.path, "rb") as file:
+        magic, salt, _, _, _ = HEADER_FORMAT.unpack(file.read(HEADER_FORMAT.size))
+    if magic != MAGIC:
+        parser.error(args.path + " is not an analysis cache")
+    cache = AnalysisCache(args.path, os.path.getsize(args.path), salt)
+    if args.clear:
+        cache.clear()
+    stats = cache.stats()
+    cache.close()
+    if args.stats or not args.clear:
+        print("%d of %d slots used (%.1f%%), %d bytes, generation %d" % (
+            stats["used"], stats["slots"], 100 * stats["used"] / stats["slots"], stats["bytes"], stats["generation"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Whole-game analysis. Every position of a game is searched, every move is compared with the engine's choice,
+and moves that lose too much are marked as inaccuracies, mistakes or blunders.
+The searches run one after another in this process and share the transposition table and history scores,
+so each position starts from what the searches of its neighbours found instead of from scratch.
+Games come from a GameState's moveLog or from PGN, the result is written as annotated PGN or JSON.
+
+    python -m chess.annotateGame game.pgn --depth 3 --format pgn > annotated.pgn
+"""
+import argparse
+import json
+import sys
+import time
+from chess import ChessAI, pgn
+from chess.chessEngine import GameState
+
+"""
+Judgements by how much worse the played move scored than the engine's best move, in pawns.
+Scores are clipped to SCORE_CAP first, so going from +12 to +9 in a won position isn't a blunder.
+"""
+INACCURACY = 0.5
+MISTAKE = 1.0
+BLUNDER = 2.0
+SCORE_CAP = 10
+JUDGEMENT_NAGS = {"inaccuracy": 6, "mistake": 2, "blunder": 4} # ?!, ? and ??
+ANNOTATION_DEPTH = 3 # default search depth per position
+"""
+ChessAI settings while annotating. The played move and the best move have to be scored at the same horizon:
+results of deeper searches of the neighbouring positions may order the moves but not score them, and no move
+is searched shallower than the others (no null move pruning or late move reductions). Then a position gets the
+same scores whether the search state was kept or not, keeping it only saves nodes through the move ordering.
+"""
+SEARCH_SETTINGS = {"PRINT_SEARCH_PROGRESS": False, "TT_SAME_DEPTH_ONLY": True, "NULL_MOVE_PRUNING": False,
+                   "LATE_MOVE_REDUCTIONS": False}
+
+
+'''
+Analyses every position of a game and judges every move.
+
+    Parameters:
+        gs (GameState): positioned at the start of the game, it is back at that position afterwards.
+        moves (list): the moves of the game, legal moves of the positions they are played in.
+        depth (int): search depth per position.
+        timeLimit (float): seconds per position, None to always search to depth.
+        backwards (bool): search the positions from the last one to the first, the search of a position then
+            finds the moves of the line after the played move in the transposition table.
+        keepSearchState (bool): False clears the transposition table and history before every position,
+            only useful to measure what reusing them saves. The scores are the same either way.
+
+    Returns:
+        (list, dict): one dict per ply (move, scores from white's point of view, best move, loss in pawns,
+        judgement, engine line) and a summary with the judgement counts, average loss per side and node count.
+'''
+def annotateMoves(gs, moves, depth=ANNOTATION_DEPTH, timeLimit=None, backwards=True, keepSearchState=True):
+    settings = {name: getattr(ChessAI, name) for name in SEARCH_SETTINGS}
+    for name, value in SEARCH_SETTINGS.items():
+        setattr(ChessAI, name, value)
+    try:
+        return judgeMoves(gs, moves, depth, timeLimit, backwards, keepSearchState)
+    finally:
+        for name, value in settings.items():
+            setattr(ChessAI, name, value)
+
+'''
+annotateMoves with the search settings in place.
+'''
+def judgeMoves(gs, moves, depth, timeLimit, backwards, keepSearchState):
+    sans = []
+    whiteMoved = []
+    for move in moves:
+        validMoves = gs.getValidMoves()
+        if move not in validMoves:
+            for _ in sans:
+                gs.undoMove()
+            raise ValueError("illegal move " + move.getChessNotation() + " at ply " + str(len(sans) + 1))
+        sans.append(gs.getSan(move, validMoves))
+        whiteMoved.append(gs.whiteToMove)
+        gs.makeMove(move)
+
+    # analyses[i] is (best move in SAN, score for the side to move, engine line) of the position before ply i + 1,
+    # playedScores[i] the score of the move played there, searched to the same horizon as the best move.
+    # Searching backwards the position after the move has been searched already, its iteration one ply shallower
+    # than depth is the played move's score, it only needs a search of its own when searching forwards
+    analyses = [None] * (len(moves) + 1)
+    playedScores = [None] * len(moves)
+    iterationScores = [None] * (len(moves) + 1) # depth -> score of every iteration searched in a position
+    current = len(moves)
+    totalNodes = 0
+    start = time.perf_counter()
+    for index in (range(len(moves), -1, -1) if backwards else range(len(moves) + 1)):
+        while current > index:
+            gs.undoMove()
+            current -= 1
+        while current < index:
+            gs.makeMove(moves[current])
+            current += 1
+        if not keepSearchState:
+            ChessAI.clearSearchState()
+        iterationScores[index] = {}
+        analyses[index] = analysePosition(gs, depth, timeLimit, iterationScores[index])
+        totalNodes += ChessAI.nodes
+        if index < len(moves):
+            childScores = iterationScores[index + 1] or {}
+            if sans[index] == analyses[index][0]:
+                playedScores[index] = analyses[index][1]
+            elif depth - 1 in childScores:
+                # the position after the move was searched already, one iteration of it went to this horizon
+                playedScores[index] = -childScores[depth - 1]
+            else:
+                gs.makeMove(moves[index])
+                playedScores[index] = -analysePosition(gs, depth - 1, timeLimit)[1]
+                totalNodes += ChessAI.nodes
+                gs.undoMove()
+    while current > 0:
+        gs.undoMove()
+        current -= 1
+
+    annotations = []
+    summary = {"white": {"inaccuracy": 0, "mistake": 0, "blunder": 0, "averageLoss": 0.0},
+               "black": {"inaccuracy": 0, "mistake": 0, "blunder": 0, "averageLoss": 0.0}}
+    for i, san in enumerate(sans):
+        bestSan, bestScore, line = analyses[i]
+        playedScore = playedScores[i]
+        loss = max(0.0, clip(bestScore) - clip(playedScore))
+        judgement = None
+        if loss >= BLUNDER:
+            judgement = "blunder"
+        elif loss >= MISTAKE:
+            judgement = "mistake"
+        elif loss >= INACCURACY:
+            judgement = "inaccuracy"
+        color = "white" if whiteMoved[i] else "black"
+        sign = 1 if whiteMoved[i] else -1
+        if judgement:
+            summary[color][judgement] += 1
+        summary[color]["averageLoss"] += loss
+        annotations.append({"ply": i + 1, "color": color, "move": san, "score": round(sign * playedScore, 2),
+                            "best": bestSan, "bestScore": round(sign * bestScore, 2), "loss": round(loss, 2),
+                            "judgement": judgement, "line": line})
+    for color in ("white", "black"):
+        played = whiteMoved.count(color == "white")
+        if played:
+            summary[color]["averageLoss"] = round(summary[color]["averageLoss"] / played, 3)
+    summary["positions"] = len(analyses)
+    summary["nodes"] = totalNodes
+    summary["seconds"] = round(time.perf_counter() - start, 2)
+    return annotations, summary
+
+'''
+Searches one position. iterationScores, a dict, gets the score of every iteration by its depth.
+
+    Returns:
+        (str, float, list): the best move in SAN (None when the game is over), the score for the side
+        to move and the engine's line in SAN.
+'''
+def analysePosition(gs, depth, timeLimit=None, iterationScores=None):
+    validMoves = gs.getValidMoves()
+    if not validMoves:
+        ChessAI.nodes = 0
+        return None, -ChessAI.CHECKMATE if gs.inCheck else ChessAI.STALEMATE, []
+    if depth <= 0:
+        ChessAI.nodes = 1
+        return None, (1 if gs.whiteToMove else -1) * ChessAI.scoreBoard(gs), []
+    onIteration = None
+    if iterationScores is not None:
+        def onIteration(iterationDepth, move, score):
+            iterationScores[iterationDepth] = score
+    bestMove, score, pv = ChessAI.searchPosition(gs, validMoves, depth, timeLimit, onIteration=onIteration)
+    inCheck = gs.inCheck
+    line = []
+    for move in pv:
+        validMoves = gs.getValidMoves()
+        if move not in validMoves:
+            break
+        line.append(gs.getSan(move, validMoves))
+        gs.makeMove(move)
+    for _ in line:
+        gs.undoMove()
+    gs.inCheck = inCheck
+    return (line[0] if line else gs.getSan(bestMove)), score, line
+
+'''
+Clips a score to +-SCORE_CAP.
+'''
+def clip(score):
+    return max(-SCORE_CAP, min(SCORE_CAP, score))
+
+'''
+Annotates the game played so far on gs (its moveLog), e.g. from the GUI. gs ends up where it was.
+'''
+def annotateGameState(gs, **options):
+    moves = list(gs.moveLog)
+    for _ in moves:
+        gs.undoMove()
+    try:
+        return annotateMoves(gs, moves, **options)
+    finally:
+        for move in moves:
+            gs.makeMove(move)
+
+'''
+Annotates a game read with pgn.readGames. A FEN tag sets the start position.
+
+    Returns:
+        (GameState, list, dict): the game at its start position and annotateMoves' result.
+'''
+def annotatePgnGame(headers, sanMoves, **options):
+    gs = GameState()
+    if "FEN" in headers:
+        gs.loadFen(headers["FEN"])
+    moves = []
+    try:
+        for san in sanMoves:
+            move = gs.parseSan(san)
+            moves.append(move)
+            gs.makeMove(move)
+    finally:
+        for _ in moves:
+            gs.undoMove()
+    return (gs,) + annotateMoves(gs, moves, **options)
+
+'''
+Formats a score from white's point of view for a PGN comment, mates as +M / -M.
+'''
+def formatScore(score):
+    if abs(score) >= ChessAI.CHECKMATE:
+        return "+M" if score > 0 else "-M"
+    return "%+.2f" % score
+
+'''
+Writes an annotated game as PGN: the score after every move as a comment, the engine's move and line
+after every judged move, and ?!, ? or ?? as NAGs.
+'''
+def toPgn(headers, annotations, firstPly=0):
+    comments = []
+    nags = []
+    for annotation in annotations:
+        comment = formatScore(annotation["score"])
+        if annotation["judgement"]:
+            comment += " %s, best %s %s (%s)" % (annotation["judgement"].capitalize(), annotation["best"],
+                                                 formatScore(annotation["bestScore"]), " ".join(annotation["line"]))
+        comments.append(comment)
+        nags.append(JUDGEMENT_NAGS.get(annotation["judgement"]))
+    headers = dict(headers)
+    headers.setdefault("Annotator", "ChessAI")
+    return pgn.writeGame(headers, [annotation["move"] for annotation in annotations], comments, nags, firstPly)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Annotate games: judge every move against the engine.")
+    parser.add_argument("pgn", help="PGN file, - for standard input")
+    parser.add_argument("--depth", type=int, default=ANNOTATION_DEPTH)
+    parser.add_argument("--time", type=float, default=None, help="seconds per position")
+    parser.add_argument("--format", choices=("pgn", "json"), default="pgn")
+    parser.add_argument("--forwards", action="store_true", help="search the positions in game order")
+    parser.add_argument("--cold", action="store_true", help="forget the search state between positions")
+    args = parser.parse_args()
+
+    file = sys.stdin if args.pgn == "-" else open(args.pgn)
+    games = []
+    for headers, sanMoves in pgn.readGames(file):
+        gs, annotations, summary = annotatePgnGame(headers, sanMoves, depth=args.depth, timeLimit=args.time,
+                                                   backwards=not args.forwards, keepSearchState=not args.cold)
+        print("%s - %s: %d positions, %d nodes, %.1fs" % (headers.get("White", "?"), headers.get("Black", "?"),
+                                                          summary["positions"], summary["nodes"],
+                                                          summary["seconds"]), file=sys.stderr)
+        if args.format == "pgn":
+            sys.stdout.write(toPgn(headers, annotations, 0 if gs.whiteToMove else 1))
+        else:
+            games.append({"headers": headers, "moves": annotations, "summary": summary})
+    if args.format == "json":
+        json.dump(games, sys.stdout, indent=1)
+        sys.stdout.write("\n")
+
+
+if __name__ == "__main__":
+    main()
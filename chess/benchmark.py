@@ -0,0 +1,276 @@
+"""
+Micro-benchmarks of the engine's hot paths over a fixed set of positions, with a history to compare against.
+Every run measures calls per second and the latency percentiles of the single calls of each benchmark,
+appends them to a JSON history file and compares them with the stored baseline: a benchmark that got slower
+than the baseline by more than the threshold is a regression and the run exits with status 1, so a change
+that claims to be faster can be proven and one that slows a hot path down is caught.
+The search benchmark seeds random before every search, so findBestMove's shuffle of the moves, and with it the
+node count, is the same from run to run. Timings depend on the machine, keep one history per machine.
+
+    python -m chess.benchmark --save-baseline           # measure and make this run the baseline
+    python -m chess.benchmark                           # measure and compare, exit status 1 on a regression
+    python -m chess.benchmark --only getValidMoves,scoreBoard --repeats 20
+"""
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import queue
+import random
+import subprocess
+import sys
+import time
+from chess import ChessAI
+from chess.chessEngine import GameState, Move, MAX_MOVES
+
+CORPUS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "r1bq1rk1/pp2bppp/2n1pn2/3p4/2PP4/2N1PN2/PP2BPPP/R2QKB1R w KQ - 0 8",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "2r3k1/pp3ppp/4p3/3pP3/3P4/P4N2/1P3PPP/2R3K1 w - - 0 25",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+]
+SEED = 1 # random.seed before every search
+SEARCH_DEPTH = 3 # ChessAI.DEPTH for the findBestMove benchmark
+REPEATS = 10 # timed batches per benchmark, the percentiles are over these
+THRESHOLD = 0.15 # slower than the baseline by more than this fraction is a regression
+HISTORY_FILE = "benchmarkHistory.json"
+searchNodes = [0] * len(CORPUS) # nodes of the last search of every position, shows whether the search changed
+
+
+'''
+The corpus as one GameState per position.
+'''
+def loadCorpus():
+    states = []
+    for fen in CORPUS:
+        gs = GameState()
+        gs.loadFen(fen)
+        states.append(gs)
+    return states
+
+"""
+The benchmarks. Each one prepares its inputs from the corpus and returns (call, calls per batch):
+call(i) does the i-th unit of work, cycling through the inputs, and a batch is timed as a whole.
+"""
+
+def benchGetValidMoves(states):
+    def call(i):
+        states[i % len(states)].getValidMoves()
+    return call, 100
+
+def benchMakeUndoMove(states):
+    pairs = [(gs, move) for gs in states for move in gs.getValidMoves()]
+    def call(i):
+        gs, move = pairs[i % len(pairs)]
+        gs.makeMove(move)
+        gs.undoMove()
+    return call, 2000
+
+def benchCheckForPinsAndChecks(states):
+    def call(i):
+        states[i % len(states)].checkForPinsAndChecks()
+    return call, 2000
+
+def benchSquareUnderAttack(states):
+    squares = [(gs, r, c, "w" if gs.whiteToMove else "b") for gs in states for r in range(8) for c in range(8)]
+    def call(i):
+        gs, r, c, allyColor = squares[i % len(squares)]
+        gs.squareUnderAttack(r, c, allyColor)
+    return call, 5000
+
+def benchMoveInit(states):
+    moves = [((move.startRow, move.startCol), (move.endRow, move.endCol), gs.board, move.isEnpassantMove,
+              move.isCastleMove) for gs in states for move in gs.getValidMoves()]
+    def call(i):
+        Move(*moves[i % len(moves)])
+    return call, 5000
+
+def benchFillValidMoves(states):
+    buffer = [0] * MAX_MOVES
+    def call(i):
+        states[i % len(states)].fillValidMoves(buffer)
+    return call, 500
+
+def benchFillPseudoLegalMoves(states):
+    buffer = [0] * MAX_MOVES
+    for gs in states:
+        gs.inCheck = gs.kingInCheck()
+    def call(i):
+        states[i % len(states)].fillPseudoLegalMoves(buffer)
+    return call, 500
+
+def benchMakeUndoMoveCode(states):
+    buffer = [0] * MAX_MOVES
+    pairs = [(gs, buffer[i]) for gs in states for i in range(gs.fillValidMoves(buffer))]
+    def call(i):
+        gs, code = pairs[i % len(pairs)]
+        gs.makeMoveCode(code)
+        gs.undoMoveCode(code)
+    return call, 5000
+
+def benchScoreBoard(states):
+    def call(i):
+        ChessAI.scoreBoard(states[i % len(states)])
+    return call, 500
+
+def benchFindBestMove(states):
+    replies = queue.SimpleQueue()
+    def call(i):
+        gs = states[i % len(states)]
+        ChessAI.clearSearchState()
+        random.seed(SEED)
+        ChessAI.findBestMove(gs, gs.getValidMoves(), replies)
+        replies.get()
+        searchNodes[i % len(states)] = ChessAI.nodes
+    return call, len(states)
+
+BENCHMARKS = {
+    "getValidMoves": benchGetValidMoves,
+    "makeMove/undoMove": benchMakeUndoMove,
+    "checkForPinsAndChecks": benchCheckForPinsAndChecks,
+    "squareUnderAttack": benchSquareUnderAttack,
+    "Move.__init__": benchMoveInit,
+    "fillValidMoves": benchFillValidMoves,
+    "fillPseudoLegalMoves": benchFillPseudoLegalMoves,
+    "makeMoveCode/undoMoveCode": benchMakeUndoMoveCode,
+    "scoreBoard": benchScoreBoard,
+    "findBestMove": benchFindBestMove,
+}
+
+'''
+Times one benchmark: a warm-up batch, then repeats timed batches. Every call is timed on its own as well,
+for findBestMove a call is a whole search.
+
+    Returns:
+        dict: calls per second over all batches and the 50th, 90th and 99th percentile of the latency of
+        the single calls, in microseconds.
+'''
+def measure(call, calls, repeats):
+    for i in range(calls):
+        call(i)
+    gc.collect()
+    latencies = []
+    total = 0.0
+    clock = time.perf_counter
+    for _ in range(repeats):
+        start = clock()
+        for i in range(calls):
+            callStart = clock()
+            call(i)
+            latencies.append(clock() - callStart)
+        total += clock() - start
+    latencies.sort()
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1e6, 3)
+    return {"opsPerSecond": round(calls * repeats / total, 1), "p50": percentile(0.5), "p90": percentile(0.9),
+            "p99": percentile(0.99)}
+
+'''
+Runs the benchmarks named in names (all of them for None).
+
+    Returns:
+        dict: measure's result per benchmark, the search benchmark also has the nodes it searched per batch.
+'''
+def runBenchmarks(names=None, repeats=REPEATS):
+    printProgress, depth = ChessAI.PRINT_SEARCH_PROGRESS, ChessAI.DEPTH
+    ChessAI.PRINT_SEARCH_PROGRESS = False
+    ChessAI.DEPTH = SEARCH_DEPTH
+    results = {}
+    try:
+        for name, benchmark in BENCHMARKS.items():
+            if names is not None and name not in names:
+                continue
+            states = loadCorpus()
+            call, calls = benchmark(states)
+            if name == "findBestMove":
+                results[name] = measure(call, calls, max(1, repeats // 3)) # whole searches, fewer batches
+                results[name]["nodes"] = sum(searchNodes)
+            else:
+                results[name] = measure(call, calls, repeats)
+    finally:
+        ChessAI.PRINT_SEARCH_PROGRESS, ChessAI.DEPTH = printProgress, depth
+    return results
+
+'''
+The benchmarks that got slower than in the baseline by more than threshold.
+
+    Returns:
+        list: (name, baseline calls per second, calls per second) of each regression.
+'''
+def findRegressions(results, baseline, threshold=THRESHOLD):
+    regressions = []
+    for name, result in results.items():
+        if name in baseline and result["opsPerSecond"] < baseline[name]["opsPerSecond"] * (1 - threshold):
+            regressions.append((name, baseline[name]["opsPerSecond"], result["opsPerSecond"]))
+    return regressions
+
+'''
+Reads the history file, {"baseline": run, "runs": [run, ...]}, empty if there is none yet.
+'''
+def loadHistory(path):
+    if not os.path.exists(path):
+        return {"baseline": None, "runs": []}
+    with open(path) as file:
+        return json.load(file)
+
+'''
+The commit the tree is at, None outside a git checkout.
+'''
+def currentCommit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the engine's hot paths against a stored baseline.")
+    parser.add_argument("--history", default=HISTORY_FILE, help="JSON file with the baseline and past runs")
+    parser.add_argument("--save-baseline", action="store_true", help="make this run the new baseline")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD, help="allowed slowdown, 0.15 is 15%%")
+    parser.add_argument("--repeats", type=int, default=REPEATS, help="timed batches per benchmark")
+    parser.add_argument("--only", help="comma separated benchmark names")
+    args = parser.parse_args()
+
+    names = args.only.split(",") if args.only else None
+    for name in names or []:
+        if name not in BENCHMARKS:
+            parser.error("unknown benchmark %s, choose from %s" % (name, ", ".join(BENCHMARKS)))
+    history = loadHistory(args.history)
+    baseline = history["baseline"]["results"] if history["baseline"] else {}
+    results = runBenchmarks(names, args.repeats)
+
+    print("%-26s %12s %10s %10s %10s %9s" % ("benchmark", "calls/s", "p50 us", "p90 us", "p99 us", "baseline"))
+    for name, result in results.items():
+        change = ""
+        if name in baseline:
+            change = "%+.1f%%" % (100 * (result["opsPerSecond"] / baseline[name]["opsPerSecond"] - 1))
+        print("%-26s %12.1f %10.2f %10.2f %10.2f %9s" % (name, result["opsPerSecond"], result["p50"],
+                                                          result["p90"], result["p99"], change))
+    run = {"date": datetime.datetime.now().isoformat(timespec="seconds"), "commit": currentCommit(),
+           "python": platform.python_version(), "results": results}
+    history["runs"].append(run)
+    if args.save_baseline or not history["baseline"]:
+        history["baseline"] = run
+        print("baseline saved")
+    with open(args.history, "w") as file:
+        json.dump(history, file, indent=1)
+        file.write("\n")
+
+    regressions = findRegressions(results, baseline, args.threshold)
+    for name, before, after in regressions:
+        print("REGRESSION %s: %.1f -> %.1f calls/s" % (name, before, after))
+    if "findBestMove" in results and "findBestMove" in baseline and \
+            results["findBestMove"]["nodes"] != baseline["findBestMove"].get("nodes"):
+        print("note: findBestMove searched %d nodes, the baseline %s, the search itself changed" % (
+            results["findBestMove"]["nodes"], baseline["findBestMove"].get("nodes")))
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
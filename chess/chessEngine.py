@@ -3,18 +3,97 @@ This class is responsible for storing all the information about the current stat
 It will also be responsible for determining the valid moves at current state.
 It will also keep mov log.
 """
+import copy
+import random
+import re
+from collections import OrderedDict
+
+# Castling rights are packed into the four low bits of a single int.
+WHITE_KING_SIDE = 1
+WHITE_QUEEN_SIDE = 2
+BLACK_KING_SIDE = 4
+BLACK_QUEEN_SIDE = 8
+ALL_CASTLE_RIGHTS = WHITE_KING_SIDE | WHITE_QUEEN_SIDE | BLACK_KING_SIDE | BLACK_QUEEN_SIDE
+
+# Undo stack layout: every ply pushes one fixed-size record of
+# (captured piece, castle rights, en passant square, halfmove clock, hash, pawn hash).
+UNDO_RECORD_SIZE = 6
+MAX_GAME_PLY = 1024 # records preallocated up front by default, the stack doubles when a game gets longer
+MOVE_LIST_CACHE_SIZE = 64 # positions whose legal moves getCachedValidMoves keeps
+
+"""
+Zobrist keys used to hash a position incrementally.
+A fixed seed keeps hashes identical across processes and runs.
+"""
+_zobristRandom = random.Random(0x5EED)
+zobristPieces = {color + piece: [_zobristRandom.getrandbits(64) for _ in range(64)]
+                 for color in "wb" for piece in "pRNBQK"}
+zobristCastle = [_zobristRandom.getrandbits(64) for _ in range(16)]
+zobristEnpassant = [_zobristRandom.getrandbits(64) for _ in range(8)]
+zobristBlackToMove = _zobristRandom.getrandbits(64)
+
+# Small integer codes for the pieces, used wherever a position has to fit in a fixed size buffer.
+PIECES = ["--", "wp", "wR", "wN", "wB", "wQ", "wK", "bp", "bR", "bN", "bB", "bQ", "bK"]
+PIECE_CODES = {piece: code for code, piece in enumerate(PIECES)}
+
+# piece, origin file and rank (both optional), target square and promotion piece of a SAN move
+SAN_PATTERN = re.compile(r"^([NBRQK])?([a-h])?([1-8])?x?([a-h])([1-8])(?:=?([NBRQ]))?$")
+
+"""
+Move codes, the search's allocation free stand-in for Move objects:
+from square | to square << 6 | kind << 12, squares numbered row * 8 + col.
+fillValidMoves writes them into a preallocated buffer and returns the count, makeMoveCode/undoMoveCode play them.
+The codes of ordinary moves are built once below and shared, so generating and reading them back creates no objects.
+"""
+MOVE_NORMAL = 0
+MOVE_ENPASSANT = 1
+MOVE_CASTLE = 2
+MOVE_PROMOTION = 4 # kinds 4 to 7 promote to PROMOTION_PIECES[kind - MOVE_PROMOTION]
+PROMOTION_PIECES = "QRBN"
+MAX_MOVES = 256 # slots in a move buffer, more than any position has moves
+GENERATE_CAPTURES = 1 # captures, en passant and promotions
+GENERATE_QUIETS = 2 # every other move, castling included
+GENERATE_ALL = GENERATE_CAPTURES | GENERATE_QUIETS
+DIRECTIONS = ((-1, 0), (0, -1), (1, 0), (0, 1), (-1, -1), (-1, 1), (1, -1), (1, 1)) # orthogonal, then diagonal
+OPPOSITE_DIRECTION = (2, 3, 0, 1, 7, 6, 5, 4) # index of the reverse of each direction
+KNIGHT_JUMPS = ((-2, -1), (-2, 1), (-1, -2), (-1, 2), (1, -2), (1, 2), (2, -1), (2, 1))
+
+moveCodes = [[start | end << 6 for end in range(64)] for start in range(64)] # moveCodes[from][to]
+# squares reachable from every square as (row, col, move code): rays[square][direction] walks outwards
+# until the edge, knightTargets and kingTargets hold the single steps
+rays = [tuple(tuple((r + dr * i, c + dc * i, moveCodes[r * 8 + c][(r + dr * i) * 8 + c + dc * i])
+                    for i in range(1, 8) if 0 <= r + dr * i < 8 and 0 <= c + dc * i < 8)
+              for dr, dc in DIRECTIONS)
+        for r in range(8) for c in range(8)]
+knightTargets = [tuple((r + dr, c + dc, moveCodes[r * 8 + c][(r + dr) * 8 + c + dc])
+                       for dr, dc in KNIGHT_JUMPS if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+                 for r in range(8) for c in range(8)]
+kingTargets = [tuple((r + dr, c + dc, moveCodes[r * 8 + c][(r + dr) * 8 + c + dc])
+                     for dr, dc in DIRECTIONS if 0 <= r + dr < 8 and 0 <= c + dc < 8)
+               for r in range(8) for c in range(8)]
+# rayDirections[a][b] is the direction from square a to square b when they share a line, None otherwise
+rayDirections = [[None] * 64 for _ in range(64)]
+for square in range(64):
+    for d in range(8):
+        for _, _, code in rays[square][d]:
+            rayDirections[square][code >> 6] = d
+
+
 class GameState:
-    def __init__(self):
+    def __init__(self, undoCapacity=MAX_GAME_PLY):
         """
             Initializes the GameState object by setting up the board, player turn,
             castling rights, en passant possibilities, and move logs. Manages the core
             state of the chess game.
+            undoCapacity is how many plies the undo stack holds before it has to grow, a server holding
+            thousands of mostly idle games keeps it small.
         """
 
         #board is 8x8 2d list ,each element of the list has 2 characters.
         #The first character represents the color of the piece, 'b' or 'w'
         #The second character represents the type of the piece 'K', 'Q', 'R', 'B', 'N', or 'P'
         #"--" - represent an empty space with no piece.
+        #Row 0 is the 8th rank and column 0 the a-file, whichever side the GUI shows at the bottom.
 
         self.board = [
             ["bR", "bN", "bB", "bQ", "bK", "bB", "bN", "bR"],
@@ -26,16 +105,6 @@ class GameState:
             ["wp", "wp", "wp", "wp", "wp", "wp", "wp", "wp"],
             ["wR", "wN", "wB", "wQ", "wK", "wB", "wN", "wR"]]
 
-        self.board1 = [
-            ['wR', 'wN', 'wB', 'wQ', 'wK', 'wB', 'wN', 'wR'],
-            ['wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp', 'wp'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['--', '--', '--', '--', '--', '--', '--', '--'],
-            ['bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp', 'bp'],
-            ['bR', 'bN', 'bB', 'bQ', 'bK', 'bB', 'bN', 'bR']]
-
         self.moveFunctions = {
             'p': self.getPawnMoves,
             'R': self.getRookMoves,
@@ -46,78 +115,310 @@ class GameState:
         }
         # Game state variables
         self.whiteToMove = True
-        self.playerWantsToPlayAsBlack = False
         self.moveLog = []
-        if self.playerWantsToPlayAsBlack:
-            self.whiteKingLocation = (0, 4)
-            self.blackKingLocation = (7, 4)
-        else:
-            self.whiteKingLocation = (7, 4)
-            self.blackKingLocation = (0, 4)
+        self.whiteKingLocation = (7, 4)
+        self.blackKingLocation = (0, 4)
         self.checkMate = False
         self.staleMate = False
         self.inCheck = False
         self.score = 0
         self.pins = []
         self.checks = []
+        # fillValidMoves' scratch space: direction a pinned piece may move along, by square, and the pinned squares
+        self.pinDirections = [None] * 64
+        self.pinnedSquares = [0] * 8
+        self.scratchMoves = [0] * MAX_MOVES # isPseudoLegal's move buffer
         self.enpassantPossible = () #coordinates for the square where the en passant capture is possible
-        self.enpassantPossibleLog = [self.enpassantPossible]
+        self.castleRights = ALL_CASTLE_RIGHTS
+        self.halfmoveClock = 0 # plies since the last capture or pawn move
+        self.startPly = 0 # plies played before the position the game was set up in, counts the move numbers
+
+        # preallocated undo stack, makeMove/undoMove only overwrite slots in place
+        self.undoStack = [None] * (max(1, undoCapacity) * UNDO_RECORD_SIZE)
+        self.undoPointer = 0
+        self.hash = self.computeHash()
+        self.pawnHash = self.computePawnHash() # hash of the pawns alone, keys the AI's pawn structure cache
+        self.moveListCache = None # hash -> (MoveList, inCheck, checkMate, staleMate), least recently used first
+
+    """
+        Sets up an arbitrary position, e.g. one received from another process.
+        board is an 8x8 list like self.board, the move log and undo stack start empty.
+    """
+    def setPosition(self, board, whiteToMove, castleRights, enpassantPossible=(), halfmoveClock=0):
+        self.board = board
+        self.whiteToMove = whiteToMove
+        self.castleRights = castleRights
+        self.enpassantPossible = enpassantPossible
+        self.halfmoveClock = halfmoveClock
+        self.startPly = 0 if whiteToMove else 1
+        for r in range(8):
+            for c in range(8):
+                if board[r][c] == "wK":
+                    self.whiteKingLocation = (r, c)
+                elif board[r][c] == "bK":
+                    self.blackKingLocation = (r, c)
+        self.moveLog = []
+        self.undoPointer = 0
+        self.checkMate = False
+        self.staleMate = False
+        self.inCheck = False
+        self.pins = []
+        self.checks = []
+        self.hash = self.computeHash()
+        self.pawnHash = self.computePawnHash()
 
-        self.currentCastlingRight = CastleRights(True, True, True, True)
-        self.castleRightsLog = [CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                             self.currentCastlingRight.wqs, self.currentCastlingRight.bqs)]
+    """
+        Sets up the position described by a FEN string, e.g. a position from a test suite or a training set.
+        The halfmove clock and move number fields are optional. Raises ValueError for a malformed FEN.
+    """
+    def loadFen(self, fen):
+        fields = fen.split()
+        if len(fields) < 4:
+            raise ValueError("FEN needs at least 4 fields: " + fen)
+        ranks = fields[0].split("/")
+        if len(ranks) != 8:
+            raise ValueError("FEN board needs 8 ranks: " + fen)
+        board = []
+        for rank in ranks:
+            row = []
+            for char in rank:
+                if char.isdigit():
+                    row.extend(["--"] * int(char))
+                elif char.lower() in "prnbqk":
+                    piece = char.upper() if char.lower() != "p" else "p"
+                    row.append(("w" if char.isupper() else "b") + piece)
+                else:
+                    raise ValueError("unknown piece " + char + " in FEN: " + fen)
+            if len(row) != 8:
+                raise ValueError("FEN rank needs 8 squares: " + fen)
+            board.append(row)
+
+        castleRights = 0
+        for char, right in (("K", WHITE_KING_SIDE), ("Q", WHITE_QUEEN_SIDE),
+                            ("k", BLACK_KING_SIDE), ("q", BLACK_QUEEN_SIDE)):
+            if char in fields[2]:
+                castleRights |= right
+
+        enpassantPossible = ()
+        if fields[3] != "-":
+            col = "abcdefgh".index(fields[3][0])
+            rank = int(fields[3][1])
+            enpassantPossible = (8 - rank, col)
+        halfmoveClock = int(fields[4]) if len(fields) > 4 else 0
+        moveNumber = max(1, int(fields[5])) if len(fields) > 5 else 1
+        self.setPosition(board, fields[1] == "w", castleRights, enpassantPossible, halfmoveClock)
+        self.startPly += 2 * (moveNumber - 1)
+
+    """
+        FEN string of the current position, the counterpart of loadFen.
+        The move number continues from the one of the position the game was set up in.
+    """
+    def getFen(self):
+        ranks = []
+        for row in self.board:
+            rank = ""
+            empty = 0
+            for square in row:
+                if square == "--":
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                rank += square[1].upper() if square[0] == "w" else square[1].lower()
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+        castle = "".join(char for char, right in (("K", WHITE_KING_SIDE), ("Q", WHITE_QUEEN_SIDE),
+                                                  ("k", BLACK_KING_SIDE), ("q", BLACK_QUEEN_SIDE))
+                         if self.castleRights & right) or "-"
+        enpassant = "-"
+        if self.enpassantPossible:
+            row, col = self.enpassantPossible
+            enpassant = "abcdefgh"[col] + str(8 - row)
+        return " ".join(["/".join(ranks), "w" if self.whiteToMove else "b", castle, enpassant,
+                         str(self.halfmoveClock), str(1 + (self.startPly + len(self.moveLog)) // 2)])
+
+    """
+        Computes the Zobrist hash of the current position from scratch.
+        makeMove and undoMove keep self.hash up to date incrementally, this is only needed on setup.
+    """
+    def computeHash(self):
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece != "--":
+                    h ^= zobristPieces[piece][r * 8 + c]
+        h ^= zobristCastle[self.castleRights]
+        if self.enpassantPossible:
+            h ^= zobristEnpassant[self.enpassantPossible[1]]
+        if not self.whiteToMove:
+            h ^= zobristBlackToMove
+        return h
 
+    """
+        Computes the Zobrist hash of the pawns only, kept up to date in self.pawnHash like self.hash.
+    """
+    def computePawnHash(self):
+        h = 0
+        for r in range(8):
+            for c in range(8):
+                piece = self.board[r][c]
+                if piece[1] == "p":
+                    h ^= zobristPieces[piece][r * 8 + c]
+        return h
 
 
     '''
-    Takes a move as parameter and executes it.(this will not work for castling, pawn promotion and en passant)
+    Takes a move as parameter and executes it.
     Makes a move on the board based on the given move object.
     Updates board state, turn tracking, logs, and special move cases like en passant or promotion.
     '''
     def makeMove(self, move):
-        self.board[move.startRow][move.startCol] = "--" # Clear initial square
-        self.board[move.endRow][move.endCol] = move.pieceMoved # Move piece to target square
+        self.makeMoveCode(move.encode())
         self.moveLog.append(move) #log the move so we can undo it later
-        self.whiteToMove = not self.whiteToMove #swap players
-        # update the king's location if moved
-        if move.pieceMoved == "wK":
-            self.whiteKingLocation = (move.endRow, move.endCol)  # if self.whiteToMove else (move.startRow, move.startCol)
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == "bK":
-            self.blackKingLocation = (move.endRow, move.endCol)  # if self.whiteToMove else (move.startRow, move.startCol)
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
 
+    """
+        Plays a move given as a move code, what makeMove does for a Move. The search uses this directly:
+        nothing is added to moveLog, undoMoveCode(code) takes the move back.
+    """
+    def makeMoveCode(self, code):
+        start = code & 63
+        end = code >> 6 & 63
+        kind = code >> 12
+        startRow, startCol = start >> 3, start & 7
+        endRow, endCol = end >> 3, end & 7
+        board = self.board
+        pieceMoved = board[startRow][startCol]
+        captureRow = startRow if kind == MOVE_ENPASSANT else endRow
+        pieceCaptured = board[captureRow][endCol]
+
+        # save everything the move can't tell us about on the undo stack
+        stack = self.undoStack
+        i = self.undoPointer
+        if i == len(stack):
+            stack.extend([None] * len(stack))
+        stack[i] = pieceCaptured
+        stack[i + 1] = self.castleRights
+        stack[i + 2] = self.enpassantPossible
+        stack[i + 3] = self.halfmoveClock
+        stack[i + 4] = self.hash
+        stack[i + 5] = self.pawnHash
+        self.undoPointer = i + UNDO_RECORD_SIZE
+
+        if pieceMoved[1] == "p" or pieceCaptured[1] == "p":
+            ph = self.pawnHash
+            if pieceMoved[1] == "p":
+                ph ^= zobristPieces[pieceMoved][start]
+                if kind < MOVE_PROMOTION:
+                    ph ^= zobristPieces[pieceMoved][end]
+            if pieceCaptured[1] == "p":
+                ph ^= zobristPieces[pieceCaptured][captureRow * 8 + endCol]
+            self.pawnHash = ph
+
+        h = self.hash ^ zobristBlackToMove ^ zobristPieces[pieceMoved][start]
+        if pieceCaptured != "--":
+            h ^= zobristPieces[pieceCaptured][captureRow * 8 + endCol]
+
+        board[startRow][startCol] = "--" # Clear initial square
         #pawn promotion
-        # if move.isPawnPromotion:
-        #     self.board[move.endRow][move.endCol] = move.pieceMoved[0] + 'Q'
-
+        piece = pieceMoved if kind < MOVE_PROMOTION else pieceMoved[0] + PROMOTION_PIECES[kind - MOVE_PROMOTION]
+        board[endRow][endCol] = piece # Move piece to target square
+        h ^= zobristPieces[piece][end]
         #enpassasnt move
-        if move.isEnpassantMove:
-            self.board[move.startRow][move.endCol] = "--" #capturing the pawn
+        if kind == MOVE_ENPASSANT:
+            board[startRow][endCol] = "--" #capturing the pawn
+        self.whiteToMove = not self.whiteToMove #swap players
+        # update the king's location if moved
+        if pieceMoved == "wK":
+            self.whiteKingLocation = (endRow, endCol)
+        elif pieceMoved == "bK":
+            self.blackKingLocation = (endRow, endCol)
 
         #update enpassant possible variable
-        if move.pieceMoved[1] == "p" and abs(move.startRow - move.endRow) == 2: #only on 2 square a pawn advances
-            self.enpassantPossible = ((move.startRow + move.endRow)//2, move.startCol)
+        if self.enpassantPossible:
+            h ^= zobristEnpassant[self.enpassantPossible[1]]
+        if pieceMoved[1] == "p" and (endRow - startRow == 2 or startRow - endRow == 2): #only on 2 square a pawn advances
+            self.enpassantPossible = ((startRow + endRow) // 2, startCol)
+            h ^= zobristEnpassant[startCol]
         else:
             self.enpassantPossible = ()
 
         #castle move
-        if move.isCastleMove:
-            if move.endCol - move.startCol == 2: #kingside castle move
-                self.board[move.endRow][move.endCol-1] = self.board[move.endRow][move.endCol+1] #moves the rook
-                self.board[move.endRow][move.endCol+1] = '--' #erase old rook
+        if kind == MOVE_CASTLE:
+            if endCol > startCol: #kingside castle move
+                rookFrom, rookTo = endCol + 1, endCol - 1
             else: #queenside castle move
-                self.board[move.endRow][move.endCol+1] = self.board[move.endRow][move.endCol-2] #move the rook
-                self.board[move.endRow][move.endCol-2] = '--' #erase old rook
+                rookFrom, rookTo = endCol - 2, endCol + 1
+            rook = board[endRow][rookFrom]
+            board[endRow][rookTo] = rook #moves the rook
+            board[endRow][rookFrom] = "--" #erase old rook
+            h ^= zobristPieces[rook][endRow * 8 + rookFrom] ^ zobristPieces[rook][endRow * 8 + rookTo]
+
+        #halfmove clock for the fifty move rule
+        if pieceMoved[1] == "p" or pieceCaptured != "--":
+            self.halfmoveClock = 0
+        else:
+            self.halfmoveClock += 1
 
         #update castling rights -- whenever it is a rook or a king move
-        self.updateCastleRights(move)
-        self.castleRightsLog.append(CastleRights(self.currentCastlingRight.wks, self.currentCastlingRight.bks,
-                                                 self.currentCastlingRight.wqs, self.currentCastlingRight.bqs))
+        oldRights = self.castleRights
+        if oldRights:
+            self.updateCastleRights(pieceMoved, pieceCaptured, startRow, startCol, endRow, endCol)
+            if oldRights != self.castleRights:
+                h ^= zobristCastle[oldRights] ^ zobristCastle[self.castleRights]
+        self.hash = h
 
+    """
+        Replaces the piece a pawn promoted to, e.g. after the player picked one in the promotion dialog.
+        makeMove promotes to move.promotionChoice (a queen unless set otherwise), this keeps the hash in sync.
+    """
+    def setPromotionPiece(self, move, piece):
+        square = move.endRow * 8 + move.endCol
+        oldPiece = self.board[move.endRow][move.endCol]
+        newPiece = move.pieceMoved[0] + piece
+        self.board[move.endRow][move.endCol] = newPiece
+        self.hash ^= zobristPieces[oldPiece][square] ^ zobristPieces[newPiece][square]
+        move.promotionChoice = piece
 
+    """
+        Passes the turn without moving, used by the AI for null move pruning.
+        Pushes an undo record like makeMove but leaves moveLog alone, undo it with undoNullMove.
+    """
+    def makeNullMove(self):
+        stack = self.undoStack
+        i = self.undoPointer
+        if i == len(stack):
+            stack.extend([None] * (MAX_GAME_PLY * UNDO_RECORD_SIZE))
+        stack[i] = "--"
+        stack[i + 1] = self.castleRights
+        stack[i + 2] = self.enpassantPossible
+        stack[i + 3] = self.halfmoveClock
+        stack[i + 4] = self.hash
+        stack[i + 5] = self.pawnHash
+        self.undoPointer = i + UNDO_RECORD_SIZE
+
+        h = self.hash ^ zobristBlackToMove
+        if self.enpassantPossible:
+            h ^= zobristEnpassant[self.enpassantPossible[1]]
+            self.enpassantPossible = ()
+        self.hash = h
+        self.halfmoveClock += 1
+        self.whiteToMove = not self.whiteToMove
+
+    """
+        Takes back a makeNullMove.
+    """
+    def undoNullMove(self):
+        i = self.undoPointer - UNDO_RECORD_SIZE
+        self.undoPointer = i
+        self.enpassantPossible = self.undoStack[i + 2]
+        self.halfmoveClock = self.undoStack[i + 3]
+        self.hash = self.undoStack[i + 4]
+        self.whiteToMove = not self.whiteToMove
+        self.checkMate = False
+        self.staleMate = False
 
     '''
     Undo the last move made.
@@ -128,71 +429,265 @@ class GameState:
     def undoMove(self):
         if len(self.moveLog) != 0:  # Make sure there is a move to undo
             move = self.moveLog.pop()
-            self.board[move.startRow][move.startCol] = move.pieceMoved
-            self.board[move.endRow][move.endCol] = move.pieceCaptured
-            self.whiteToMove = not self.whiteToMove  # Switch turns back
-
-            # Update the king's position if needed
-            if move.pieceMoved == "wK":
-                self.whiteKingLocation = (move.startRow, move.startCol)
-            elif move.pieceMoved == "bK":
-                self.blackKingLocation = (move.startRow, move.startCol)
-
-            # Undo en passant move
-            if move.isEnpassantMove:
-                self.board[move.endRow][move.startCol] = '--'  # Restore captured pawn
-                self.board[move.startRow][move.endCol] = move.pieceCaptured
-
-            # Undo en passant possible log
-            if len(self.enpassantPossibleLog) > 0:
-                self.enpassantPossibleLog.pop()
-                self.enpassantPossible = self.enpassantPossibleLog[-1] if self.enpassantPossibleLog else ()
-            else:
-                self.enpassantPossible = ()  # Default to no en passant possible
-
-            # Undo castling rights
-            self.castleRightsLog.pop()
-            self.currentCastlingRight = self.castleRightsLog[-1]
+            self.undoMoveCode(move.encode())
 
-            # Undo castle move
-            if move.isCastleMove:
-                if move.endCol - move.startCol == 2:  # Kingside castle
-                    self.board[move.endRow][move.endCol + 1] = self.board[move.endRow][move.endCol - 1]
-                    self.board[move.endRow][move.endCol - 1] = '--'
-                else:  # Queenside castle
-                    self.board[move.endRow][move.endCol - 2] = self.board[move.endRow][move.endCol + 1]
-                    self.board[move.endRow][move.endCol + 1] = '--'
+    """
+        Takes back makeMoveCode(code), code has to be the last move played.
+    """
+    def undoMoveCode(self, code):
+        start = code & 63
+        end = code >> 6 & 63
+        kind = code >> 12
+        startRow, startCol = start >> 3, start & 7
+        endRow, endCol = end >> 3, end & 7
+        i = self.undoPointer - UNDO_RECORD_SIZE
+        self.undoPointer = i
+        stack = self.undoStack
+        pieceCaptured = stack[i]
+        self.castleRights = stack[i + 1]
+        self.enpassantPossible = stack[i + 2]
+        self.halfmoveClock = stack[i + 3]
+        self.hash = stack[i + 4]
+        self.pawnHash = stack[i + 5]
+
+        board = self.board
+        piece = board[endRow][endCol]
+        if kind >= MOVE_PROMOTION:
+            piece = "wp" if piece[0] == "w" else "bp" # promoted pieces turn back into the pawn
+        board[startRow][startCol] = piece
+        if kind == MOVE_ENPASSANT:
+            board[endRow][endCol] = "--"  # landing square was empty
+            board[startRow][endCol] = pieceCaptured  # Restore captured pawn
+        else:
+            board[endRow][endCol] = pieceCaptured
+        self.whiteToMove = not self.whiteToMove  # Switch turns back
+
+        # Update the king's position if needed
+        if piece == "wK":
+            self.whiteKingLocation = (startRow, startCol)
+        elif piece == "bK":
+            self.blackKingLocation = (startRow, startCol)
+
+        # Undo castle move
+        if kind == MOVE_CASTLE:
+            if endCol > startCol:  # Kingside castle
+                board[endRow][endCol + 1] = board[endRow][endCol - 1]
+                board[endRow][endCol - 1] = "--"
+            else:  # Queenside castle
+                board[endRow][endCol - 2] = board[endRow][endCol + 1]
+                board[endRow][endCol + 1] = "--"
 
-            self.checkMate = False
-            self.staleMate = False
+        self.checkMate = False
+        self.staleMate = False
 
     '''
     Update the castling rights based on the move that was just made.
     Updates the castling rights for both sides (white and black) based on the current 
     game state. Essential for ensuring valid and legal moves.
     '''
-    def updateCastleRights(self, move):
-        if move.pieceMoved == 'wK':
-            self.currentCastlingRight.wks = False
-            self.currentCastlingRight.wqs = False
-        elif move.pieceMoved == 'bK':
-            self.currentCastlingRight.bks = False
-            self.currentCastlingRight.bqs = False
-        elif move.pieceMoved == 'wR':
-            if move.startRow == 7:
-                if move.startCol == 0: #left rook
-                    self.currentCastlingRight.wqs = False
-                elif move.startCol == 7: #right rook
-                    self.currentCastlingRight.wks = False
-        elif move.pieceMoved == 'bR':
-            if move.startRow == 0:
-                if move.startCol == 0: #left rook
-                    self.currentCastlingRight.bqs = False
-                elif move.startCol == 7: #right rook
-                    self.currentCastlingRight.bks = False
+    def updateCastleRights(self, pieceMoved, pieceCaptured, startRow, startCol, endRow, endCol):
+        if pieceMoved == 'wK':
+            self.castleRights &= ~(WHITE_KING_SIDE | WHITE_QUEEN_SIDE)
+        elif pieceMoved == 'bK':
+            self.castleRights &= ~(BLACK_KING_SIDE | BLACK_QUEEN_SIDE)
+        elif pieceMoved == 'wR':
+            if startRow == 7:
+                if startCol == 0: #left rook
+                    self.castleRights &= ~WHITE_QUEEN_SIDE
+                elif startCol == 7: #right rook
+                    self.castleRights &= ~WHITE_KING_SIDE
+        elif pieceMoved == 'bR':
+            if startRow == 0:
+                if startCol == 0: #left rook
+                    self.castleRights &= ~BLACK_QUEEN_SIDE
+                elif startCol == 7: #right rook
+                    self.castleRights &= ~BLACK_KING_SIDE
+        # a rook captured on its starting square takes the castling right with it
+        if pieceCaptured == 'wR' and endRow == 7:
+            if endCol == 0:
+                self.castleRights &= ~WHITE_QUEEN_SIDE
+            elif endCol == 7:
+                self.castleRights &= ~WHITE_KING_SIDE
+        elif pieceCaptured == 'bR' and endRow == 0:
+            if endCol == 0:
+                self.castleRights &= ~BLACK_QUEEN_SIDE
+            elif endCol == 7:
+                self.castleRights &= ~BLACK_KING_SIDE
+
+
 
 
+    """
+        Standard algebraic notation of a legal move in the current position (Nf3, exd5, O-O, e8=Q+).
+        validMoves are the legal moves of this position, needed to disambiguate e.g. Nbd2 from Nfd2.
+        checkSuffix adds + or #, that takes making the move and generating the replies.
+    """
+    def getSan(self, move, validMoves=None, checkSuffix=True):
+        if validMoves is None:
+            validMoves = self.getValidMoves()
+        target = move.getRankFile(move.endRow, move.endCol)
+        if move.isCastleMove:
+            san = "O-O" if move.endCol > move.startCol else "O-O-O"
+        elif move.pieceMoved[1] == "p":
+            san = (move.colsToFiles[move.startCol] + "x" if move.isCapture else "") + target
+            if move.isPawnPromotion:
+                san += "=" + move.promotionChoice
+        else:
+            san = move.pieceMoved[1]
+            rivals = [other for other in validMoves if other.pieceMoved == move.pieceMoved and other != move
+                      and other.endRow == move.endRow and other.endCol == move.endCol]
+            if rivals:
+                if all(other.startCol != move.startCol for other in rivals):
+                    san += move.colsToFiles[move.startCol]
+                elif all(other.startRow != move.startRow for other in rivals):
+                    san += move.rowsToRanks[move.startRow]
+                else:
+                    san += move.getRankFile(move.startRow, move.startCol)
+            san += ("x" if move.isCapture else "") + target
+
+        if checkSuffix:
+            inCheck, checkMate, staleMate = self.inCheck, self.checkMate, self.staleMate
+            self.makeMove(move)
+            replies = self.getValidMoves()
+            if self.inCheck:
+                san += "+" if replies else "#"
+            self.undoMove()
+            self.inCheck, self.checkMate, self.staleMate = inCheck, checkMate, staleMate
+        return san
+
+    """
+        Finds the legal move written in standard algebraic notation, e.g. from a PGN file.
+        Check marks and annotations (+ # ! ?) are ignored, castling may use zeros. A promotion is returned as a
+        copy of the Move in validMoves with promotionChoice set, validMoves itself isn't changed. Moves only
+        differing in the promotion piece are == to each other, compare their encode() to tell them apart.
+        Raises ValueError if no legal move or more than one matches.
+    """
+    def parseSan(self, san, validMoves=None):
+        if validMoves is None:
+            validMoves = self.getValidMoves()
+        text = san.strip().rstrip("+#!?").replace("0", "O")
+        promotion = None
+        if text in ("O-O", "O-O-O"):
+            matches = [move for move in validMoves if move.isCastleMove and
+                       (move.endCol > move.startCol) == (text == "O-O")]
+        else:
+            match = SAN_PATTERN.match(text)
+            if match is None:
+                raise ValueError("not a move: " + san)
+            piece, fromFile, fromRank, toFile, toRank, promotion = match.groups()
+            piece = piece or "p"
+            endRow, endCol = Move.ranksToRows[toRank], Move.filesToCols[toFile]
+            matches = [move for move in validMoves if move.pieceMoved[1] == piece and
+                       move.endRow == endRow and move.endCol == endCol and
+                       (fromFile is None or move.startCol == Move.filesToCols[fromFile]) and
+                       (fromRank is None or move.startRow == Move.ranksToRows[fromRank])]
+        if len(matches) != 1:
+            raise ValueError(("ambiguous move: " if matches else "illegal move: ") + san)
+        move = matches[0]
+        if move.isPawnPromotion:
+            move = copy.copy(move)
+            move.promotionChoice = promotion or "Q"
+        return move
 
+    """
+        parseSan for move codes, e.g. to replay thousands of games with makeMoveCode. Instead of generating
+        every legal move it looks backwards from the target square for pieces of the named kind that reach it,
+        and only those are tested for legality. Raises ValueError like parseSan.
+    """
+    def parseSanCode(self, san):
+        text = san.strip().rstrip("+#!?").replace("0", "O")
+        if self.whiteToMove:
+            allyColor, kingRow, kingCol, back = "w", self.whiteKingLocation[0], self.whiteKingLocation[1], 1
+        else:
+            allyColor, kingRow, kingCol, back = "b", self.blackKingLocation[0], self.blackKingLocation[1], -1
+        board = self.board
+        inCheck = self.squareUnderAttack(kingRow, kingCol, allyColor)
+        if text in ("O-O", "O-O-O"):
+            # castling is only generated when it is legal
+            king = kingRow * 8 + kingCol
+            count = self.fillKingMoves(kingRow, kingCol, self.scratchMoves, 0, allyColor, not inCheck, True)
+            if kingCol == 4:
+                code = moveCodes[king][king + (2 if text == "O-O" else -2)] | MOVE_CASTLE << 12
+                if code in self.scratchMoves[:count]:
+                    return code
+            raise ValueError("illegal move: " + san)
+
+        match = SAN_PATTERN.match(text)
+        if match is None:
+            raise ValueError("not a move: " + san)
+        piece, fromFile, fromRank, toFile, toRank, promotion = match.groups()
+        endRow, endCol = Move.ranksToRows[toRank], Move.filesToCols[toFile]
+        end = endRow * 8 + endCol
+        if board[endRow][endCol][0] == allyColor:
+            raise ValueError("illegal move: " + san)
+        kind = MOVE_NORMAL
+        origins = []
+        if piece is None: # pawn: one or two squares straight back, or one diagonally back for a capture
+            pawn = allyColor + "p"
+            if fromFile is not None and Move.filesToCols[fromFile] != endCol:
+                if 0 <= endRow + back < 8:
+                    origins.append((endRow + back, Move.filesToCols[fromFile]))
+                if board[endRow][endCol] == "--":
+                    if self.enpassantPossible != (endRow, endCol):
+                        raise ValueError("illegal move: " + san)
+                    kind = MOVE_ENPASSANT
+            elif board[endRow][endCol] == "--" and 0 <= endRow + back < 8:
+                if board[endRow + back][endCol] == pawn:
+                    origins.append((endRow + back, endCol))
+                elif board[endRow + back][endCol] == "--" and endRow + 2 * back == (6 if back == 1 else 1):
+                    origins.append((endRow + 2 * back, endCol))
+            if endRow == 0 or endRow == 7:
+                kind = MOVE_PROMOTION + PROMOTION_PIECES.index(promotion or "Q")
+            origins = [(r, c) for r, c in origins if board[r][c] == pawn]
+        else:
+            wanted = allyColor + piece
+            if piece == "N" or piece == "K":
+                for r, c, _ in (knightTargets if piece == "N" else kingTargets)[end]:
+                    if board[r][c] == wanted:
+                        origins.append((r, c))
+            else:
+                directions = range(4) if piece == "R" else range(4, 8) if piece == "B" else range(8)
+                for d in directions:
+                    for r, c, _ in rays[end][d]:
+                        if board[r][c] != "--":
+                            if board[r][c] == wanted:
+                                origins.append((r, c))
+                            break
+        if fromFile is not None:
+            origins = [(r, c) for r, c in origins if c == Move.filesToCols[fromFile]]
+        if fromRank is not None:
+            origins = [(r, c) for r, c in origins if r == Move.ranksToRows[fromRank]]
+
+        legal = []
+        for r, c in origins:
+            code = moveCodes[r * 8 + c][end] | kind << 12
+            self.makeMoveCode(code)
+            if not self.leavesKingInCheck(code, inCheck):
+                legal.append(code)
+            self.undoMoveCode(code)
+        if len(legal) != 1:
+            raise ValueError(("ambiguous move: " if legal else "illegal move: ") + san)
+        return legal[0]
+
+    """
+        getValidMoves for the GUI: the legal moves as a MoveList, indexed by square, remembered for the last
+        MOVE_LIST_CACHE_SIZE positions by hash. Going back to a position, e.g. by undoing a move, doesn't generate
+        its moves again. The list is shared between calls, don't change it.
+    """
+    def getCachedValidMoves(self):
+        cache = self.moveListCache
+        if cache is None:
+            cache = self.moveListCache = OrderedDict()
+        entry = cache.get(self.hash)
+        if entry is not None:
+            cache.move_to_end(self.hash)
+            moves, self.inCheck, self.checkMate, self.staleMate = entry
+            return moves
+        moves = MoveList(self.getValidMoves())
+        cache[self.hash] = (moves, self.inCheck, self.checkMate, self.staleMate)
+        if len(cache) > MOVE_LIST_CACHE_SIZE:
+            cache.popitem(last=False)
+        return moves
 
     '''
     All moves considering checks.
@@ -200,8 +695,7 @@ class GameState:
     Considers checks, pins, and special rules (e.g., castling, en passant).
     '''
     def getValidMoves(self):
-        # 1. generate all possible moves
-        moves = self.getAllPossibleMoves()
+        # pins and checks first, the move generators use the pins of this position
         self.inCheck, self.pins, self.checks = self.checkForPinsAndChecks()
 
         if self.whiteToMove:
@@ -213,6 +707,7 @@ class GameState:
 
         if self.inCheck:
             if len(self.checks) == 1:  # Single check
+                moves = self.getAllPossibleMoves()
                 check = self.checks[0]
                 checkRow, checkCol = check[0], check[1]
                 pieceChecking = self.board[checkRow][checkCol]
@@ -231,9 +726,13 @@ class GameState:
                 # Remove moves that don't block the check or capture the attacker
                 for i in range(len(moves) - 1, -1, -1):
                     if moves[i].pieceMoved[1] != 'K':  # Non-king moves
-                        if (moves[i].endRow, moves[i].endCol) not in validSquares:
+                        # en passant can take a checking pawn without landing on its square
+                        capturesChecker = moves[i].isEnpassantMove and \
+                            (moves[i].startRow, moves[i].endCol) == (checkRow, checkCol)
+                        if (moves[i].endRow, moves[i].endCol) not in validSquares and not capturesChecker:
                             moves.remove(moves[i])
-            else:  # Double check
+            else:  # Double check, only the king can move
+                moves = []
                 self.getKingMoves(kingRow, kingCol, moves)
         else:
             moves = self.getAllPossibleMoves()
@@ -249,6 +748,350 @@ class GameState:
 
         return moves
 
+    """
+        Buffered counterpart of getValidMoves for the search: writes the legal moves as move codes into moves,
+        a list of MAX_MOVES slots that the caller reuses from node to node, and returns how many there are.
+        Sets inCheck, checkMate and staleMate like getValidMoves, but creates no Move objects or lists.
+    """
+    def fillValidMoves(self, moves):
+        board = self.board
+        if self.whiteToMove:
+            allyColor, enemyColor, enemyKnight = "w", "b", "bN"
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            allyColor, enemyColor, enemyKnight = "b", "w", "wN"
+            kingRow, kingCol = self.blackKingLocation
+        kingSquare = kingRow * 8 + kingCol
+        pinDirections = self.pinDirections
+        pinnedSquares = self.pinnedSquares
+        pinCount = 0
+        checkCount = 0
+        checkSquares = 0 # bit mask of the squares that capture the checking piece or block its line
+
+        # pins and checks, walking outwards from the king like checkForPinsAndChecks
+        kingRays = rays[kingSquare]
+        for d in range(8):
+            pinned = -1
+            i = 0
+            for row, col, code in kingRays[d]:
+                i += 1
+                piece = board[row][col]
+                if piece == "--":
+                    continue
+                if piece[0] == allyColor:
+                    if pinned >= 0:
+                        break # two own pieces in front of the king, neither is pinned
+                    pinned = code >> 6
+                    continue
+                type = piece[1]
+                if type == "Q" or type == ("R" if d < 4 else "B") or (i == 1 and (type == "K" or (
+                        type == "p" and ((d == 4 or d == 5) if enemyColor == "b" else (d == 6 or d == 7))))):
+                    if pinned < 0:
+                        checkCount += 1
+                        for _, _, lineCode in kingRays[d]:
+                            checkSquares |= 1 << (lineCode >> 6)
+                            if lineCode == code:
+                                break
+                    else:
+                        pinDirections[pinned] = d
+                        pinnedSquares[pinCount] = pinned
+                        pinCount += 1
+                break
+        for row, col, code in knightTargets[kingSquare]:
+            if board[row][col] == enemyKnight:
+                checkCount += 1
+                checkSquares |= 1 << (code >> 6)
+
+        count = 0
+        if checkCount < 2: # in double check only the king can move
+            count = self.fillPieceMoves(moves, 0, allyColor, enemyColor, kingRow, kingCol)
+
+            if checkCount == 1:
+                # Remove moves that don't block the check or capture the attacker,
+                # en passant was already checked by playing it
+                kept = 0
+                for i in range(count):
+                    code = moves[i]
+                    if checkSquares >> (code >> 6 & 63) & 1 or code >> 12 == MOVE_ENPASSANT:
+                        moves[kept] = code
+                        kept += 1
+                count = kept
+        for i in range(pinCount):
+            pinDirections[pinnedSquares[i]] = None
+
+        count = self.fillKingMoves(kingRow, kingCol, moves, count, allyColor, checkCount == 0)
+        self.inCheck = checkCount > 0
+        self.checkMate = count == 0 and self.inCheck
+        self.staleMate = count == 0 and not self.inCheck
+        return count
+
+    """
+        The moves of every piece but the king on the given rows, for fillValidMoves, fillPseudoLegalMoves and
+        hasLegalMove. Pieces recorded in pinDirections only move along their pin. stage picks captures, quiet
+        moves or both (GENERATE_CAPTURES, GENERATE_QUIETS, GENERATE_ALL). Returns the new move count.
+    """
+    def fillPieceMoves(self, moves, count, allyColor, enemyColor, kingRow, kingCol, rows=range(8),
+                       stage=GENERATE_ALL):
+        board = self.board
+        pinDirections = self.pinDirections
+        captures = stage & GENERATE_CAPTURES
+        quiets = stage & GENERATE_QUIETS
+        for r in rows:
+            boardRow = board[r]
+            for c in range(8):
+                piece = boardRow[c]
+                if piece[0] != allyColor:
+                    continue
+                type = piece[1]
+                square = r * 8 + c
+                if type == "p":
+                    count = self.fillPawnMoves(r, c, moves, count, kingRow, kingCol, stage)
+                elif type == "N":
+                    if pinDirections[square] is None: # a pinned knight can't move at all
+                        for row, col, code in knightTargets[square]:
+                            target = board[row][col][0]
+                            if (quiets and target == "-") or (captures and target == enemyColor):
+                                moves[count] = code
+                                count += 1
+                elif type != "K":
+                    pin = pinDirections[square]
+                    pieceRays = rays[square]
+                    for d in range(4 if type == "B" else 0, 4 if type == "R" else 8):
+                        if pin is not None and pin != d and pin != OPPOSITE_DIRECTION[d]:
+                            continue # a pinned piece stays on the line between the king and the pinner
+                        for row, col, code in pieceRays[d]:
+                            target = board[row][col]
+                            if target == "--":
+                                if quiets:
+                                    moves[count] = code
+                                    count += 1
+                            else:
+                                if captures and target[0] == enemyColor:
+                                    moves[count] = code
+                                    count += 1
+                                break
+        return count
+
+    """
+        fillValidMoves' pawn moves: pushes, captures, en passant and promotions (to a queen, like getPawnMoves).
+        A push that promotes counts as a capture for stage. Returns the new move count.
+    """
+    def fillPawnMoves(self, r, c, moves, count, kingRow, kingCol, stage=GENERATE_ALL):
+        board = self.board
+        pawn = board[r][c]
+        if pawn[0] == "w":
+            moveAmount, startRow, pushDirection, captureDirection = -1, 6, 0, 4
+        else:
+            moveAmount, startRow, pushDirection, captureDirection = 1, 1, 2, 6
+        enemyColor = "b" if pawn[0] == "w" else "w"
+        pin = self.pinDirections[r * 8 + c]
+        codes = moveCodes[r * 8 + c]
+        endRow = r + moveAmount
+        promotion = endRow == 0 or endRow == 7
+
+        if board[endRow][c] == "--" and (pin is None or pin == pushDirection or
+                                         pin == OPPOSITE_DIRECTION[pushDirection]):
+            if promotion:
+                if stage & GENERATE_CAPTURES:
+                    moves[count] = codes[endRow * 8 + c] | MOVE_PROMOTION << 12
+                    count += 1
+            elif stage & GENERATE_QUIETS:
+                moves[count] = codes[endRow * 8 + c]
+                count += 1
+                if r == startRow and board[endRow + moveAmount][c] == "--":
+                    moves[count] = codes[(endRow + moveAmount) * 8 + c]
+                    count += 1
+        if not stage & GENERATE_CAPTURES:
+            return count
+        for side in (0, 1): # capture to the left, then to the right
+            endCol = c - 1 + 2 * side
+            direction = captureDirection + side
+            if not 0 <= endCol < 8 or (pin is not None and pin != direction and
+                                       pin != OPPOSITE_DIRECTION[direction]):
+                continue
+            if board[endRow][endCol][0] == enemyColor:
+                moves[count] = codes[endRow * 8 + endCol] | MOVE_PROMOTION << 12 if promotion else \
+                    codes[endRow * 8 + endCol]
+                count += 1
+            elif self.enpassantPossible and self.enpassantPossible[0] == endRow and \
+                    self.enpassantPossible[1] == endCol:
+                # play it and look at the king: covers pins, checks and both pawns leaving the king's rank
+                captured = board[r][endCol]
+                board[r][c] = board[r][endCol] = "--"
+                board[endRow][endCol] = pawn
+                exposed = self.squareUnderAttack(kingRow, kingCol, pawn[0])
+                board[r][c] = pawn
+                board[r][endCol] = captured
+                board[endRow][endCol] = "--"
+                if not exposed:
+                    moves[count] = codes[endRow * 8 + endCol] | MOVE_ENPASSANT << 12
+                    count += 1
+        return count
+
+    """
+        fillValidMoves' king moves and castling. Returns the new move count.
+        pseudoLegal skips the test whether the target square is attacked, castling is always checked fully.
+        stage is honoured by the pseudo legal moves only.
+    """
+    def fillKingMoves(self, r, c, moves, count, allyColor, castlingAllowed, pseudoLegal=False, stage=GENERATE_ALL):
+        board = self.board
+        if pseudoLegal:
+            quiets = stage & GENERATE_QUIETS
+            captures = stage & GENERATE_CAPTURES
+            for row, col, code in kingTargets[r * 8 + c]:
+                target = board[row][col][0]
+                if (quiets and target == "-") or (captures and target != allyColor and target != "-"):
+                    moves[count] = code
+                    count += 1
+            castlingAllowed = castlingAllowed and quiets
+        else:
+            king = board[r][c]
+            board[r][c] = "--" # off the board, so a square behind it on a checking line counts as attacked
+            for row, col, code in kingTargets[r * 8 + c]:
+                if board[row][col][0] != allyColor and not self.squareUnderAttack(row, col, allyColor):
+                    moves[count] = code
+                    count += 1
+            board[r][c] = king
+        if castlingAllowed: #we can't castle while we are in check
+            codes = moveCodes[r * 8 + c]
+            if self.castleRights & (WHITE_KING_SIDE if allyColor == "w" else BLACK_KING_SIDE) and \
+                    board[r][c + 1] == "--" and board[r][c + 2] == "--" and \
+                    not self.squareUnderAttack(r, c + 1, allyColor) and not self.squareUnderAttack(r, c + 2, allyColor):
+                moves[count] = codes[r * 8 + c + 2] | MOVE_CASTLE << 12
+                count += 1
+            if self.castleRights & (WHITE_QUEEN_SIDE if allyColor == "w" else BLACK_QUEEN_SIDE) and \
+                    board[r][c - 1] == "--" and board[r][c - 2] == "--" and board[r][c - 3] == "--" and \
+                    not self.squareUnderAttack(r, c - 1, allyColor) and not self.squareUnderAttack(r, c - 2, allyColor):
+                moves[count] = codes[r * 8 + c - 2] | MOVE_CASTLE << 12
+                count += 1
+        return count
+
+    """
+        Search counterpart of fillValidMoves that leaves out the legality work: writes the pseudo legal moves,
+        the moves the pieces can make if pins and checks are ignored, and returns how many there are.
+        Most nodes of an alpha-beta search cut off after their first move or two, so instead of proving every
+        move legal up front the search plays a move and asks leavesKingInCheck before it searches it.
+        Castling is the exception, it is only generated when it is legal, so inCheck has to be up to date.
+        stage asks for the captures (with promotions) or the quiet moves alone, see GENERATE_ALL.
+    """
+    def fillPseudoLegalMoves(self, moves, stage=GENERATE_ALL):
+        if self.whiteToMove:
+            allyColor, enemyColor, castleRights = "w", "b", WHITE_KING_SIDE | WHITE_QUEEN_SIDE
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            allyColor, enemyColor, castleRights = "b", "w", BLACK_KING_SIDE | BLACK_QUEEN_SIDE
+            kingRow, kingCol = self.blackKingLocation
+        count = self.fillPieceMoves(moves, 0, allyColor, enemyColor, kingRow, kingCol, range(8), stage)
+        castlingAllowed = self.castleRights & castleRights and not self.inCheck
+        return self.fillKingMoves(kingRow, kingCol, moves, count, allyColor, castlingAllowed, True, stage)
+
+    """
+        Whether a move code, e.g. a move remembered from another position, is one of the pseudo legal moves
+        of this position. Generates the moves of the board row it starts on into a scratch buffer and looks.
+    """
+    def isPseudoLegal(self, code):
+        start = code & 63
+        r, c = start >> 3, start & 7
+        piece = self.board[r][c]
+        if self.whiteToMove:
+            allyColor, enemyColor, castleRights = "w", "b", WHITE_KING_SIDE | WHITE_QUEEN_SIDE
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            allyColor, enemyColor, castleRights = "b", "w", BLACK_KING_SIDE | BLACK_QUEEN_SIDE
+            kingRow, kingCol = self.blackKingLocation
+        if piece[0] != allyColor:
+            return False
+        moves = self.scratchMoves
+        if piece[1] == "K":
+            castlingAllowed = self.castleRights & castleRights and not self.inCheck
+            count = self.fillKingMoves(r, c, moves, 0, allyColor, castlingAllowed, True)
+        else:
+            count = self.fillPieceMoves(moves, 0, allyColor, enemyColor, kingRow, kingCol, (r,))
+        for i in range(count):
+            if moves[i] == code:
+                return True
+        return False
+
+    """
+        Called right after makeMoveCode(code): True if the move left the king of the side that played it
+        attacked, i.e. the move was illegal and has to be taken back.
+        wasInCheck is whether that side was in check before the move. If it wasn't, only king moves and
+        en passant need the full test, any other move can only expose the king along the line from the king
+        through the square the piece left, so only that line is looked at.
+    """
+    def leavesKingInCheck(self, code, wasInCheck):
+        if self.whiteToMove:
+            allyColor, enemyColor = "b", "w"
+            kingRow, kingCol = self.blackKingLocation
+        else:
+            allyColor, enemyColor = "w", "b"
+            kingRow, kingCol = self.whiteKingLocation
+        kingSquare = kingRow * 8 + kingCol
+        if wasInCheck or code >> 6 & 63 == kingSquare or code >> 12 == MOVE_ENPASSANT:
+            return self.squareUnderAttack(kingRow, kingCol, allyColor)
+        d = rayDirections[kingSquare][code & 63]
+        if d is None:
+            return False
+        board = self.board
+        for row, col, _ in rays[kingSquare][d]:
+            piece = board[row][col]
+            if piece != "--":
+                return piece[0] == enemyColor and (piece[1] == "Q" or piece[1] == ("R" if d < 4 else "B"))
+        return False
+
+    """
+        Whether the king of the side to move is attacked.
+    """
+    def kingInCheck(self):
+        if self.whiteToMove:
+            return self.squareUnderAttack(self.whiteKingLocation[0], self.whiteKingLocation[1], "w")
+        return self.squareUnderAttack(self.blackKingLocation[0], self.blackKingLocation[1], "b")
+
+    """
+        Whether the side to move has a legal move, for the positions the search evaluates without searching
+        their moves. Generates pseudo legal moves into moves one row of the board at a time and stops at the
+        first legal one, usually the first one tried, the king's moves come last. Sets checkMate and staleMate
+        from inCheck, which has to be up to date.
+    """
+    def hasLegalMove(self, moves):
+        if self.whiteToMove:
+            allyColor, enemyColor = "w", "b"
+            kingRow, kingCol = self.whiteKingLocation
+        else:
+            allyColor, enemyColor = "b", "w"
+            kingRow, kingCol = self.blackKingLocation
+        inCheck = self.inCheck
+        found = False
+        for r in range(8):
+            for i in range(self.fillPieceMoves(moves, 0, allyColor, enemyColor, kingRow, kingCol, (r,))):
+                code = moves[i]
+                self.makeMoveCode(code)
+                found = not self.leavesKingInCheck(code, inCheck)
+                self.undoMoveCode(code)
+                if found:
+                    break
+            if found:
+                break
+        else:
+            # castling is left out, whenever it is legal so is the king's step towards the rook
+            found = self.fillKingMoves(kingRow, kingCol, moves, 0, allyColor, False) > 0
+        self.checkMate = not found and inCheck
+        self.staleMate = not found and not inCheck
+        return found
+
+    """
+        The Move for a move code of the current position, e.g. to hand a move the search found to the GUI.
+    """
+    def decodeMove(self, code):
+        start = code & 63
+        end = code >> 6 & 63
+        kind = code >> 12
+        move = Move((start >> 3, start & 7), (end >> 3, end & 7), self.board,
+                    isEnpassantMove=kind == MOVE_ENPASSANT, isCastleMove=kind == MOVE_CASTLE)
+        if kind >= MOVE_PROMOTION:
+            move.promotionChoice = PROMOTION_PIECES[kind - MOVE_PROMOTION]
+        return move
+
     '''
     Determine if the enemy can attack the square rc
     Checks if a specific square is under attack by enemy pieces.
@@ -257,37 +1100,38 @@ class GameState:
 
     def squareUnderAttack(self, row, col, allyColor):
         enemyColor = 'w' if allyColor == 'b' else 'b'
-        directions = ((-1, 0), (0, -1), (1, 0), (0, 1),
-                      (-1, -1), (-1, 1), (1, -1), (1, 1))
-        for j in range(len(directions)):
-            d = directions[j]
-            for i in range(1, 8):
-                endRow = row + d[0] * i
-                endCol = col + d[1] * i
-                if 0 <= endRow < 8 and 0 <= endCol < 8:
-                    endPiece = self.board[endRow][endCol]
-                    if endPiece[0] == allyColor:  # no attack from that direction
-                        break
-                    elif endPiece[0] == enemyColor:
-                        type = endPiece[1]
-                        # Possibilities
-                        # 1) Rook in any orthogonal directions
-                        # 2) Bishop in any diagonal
-                        # 3) Queen in orthogonal or diagonal directions
-                        # 4) Pawn if onw square away in any diagonal
-                        # 5) King in any direction to 1 square (to prevent king move controlled by another king)
-                        # For Rook we will check only if directions and up, down, left, right which is in range 0 <= j <=  3 in directions.
-                        # Similarity for bishop, in directions we have added the bishop direction in directions (4 to 7).
-                        # For pawn if one forward diagonal square in front of king has opponent's pawn
-                        if (0 <= j <= 3 and type == 'R') or (4 <= j <= 7 and type == 'B') or \
-                                (i == 1 and type == 'p' and (
-                                        (enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
-                                (type == 'Q') or (i == 1 and type == 'K'):
-                            return True
-                        else:  # enemy piece not applying check
-                            break
-                else:  # off board
-                    break
+        board = self.board
+        square = row * 8 + col
+        for j, ray in enumerate(rays[square]):
+            i = 0
+            for endRow, endCol, code in ray:
+                i += 1
+                endPiece = board[endRow][endCol]
+                if endPiece == "--":
+                    continue
+                if endPiece[0] == enemyColor:
+                    type = endPiece[1]
+                    # Possibilities
+                    # 1) Rook in any orthogonal directions
+                    # 2) Bishop in any diagonal
+                    # 3) Queen in orthogonal or diagonal directions
+                    # 4) Pawn if onw square away in any diagonal
+                    # 5) King in any direction to 1 square (to prevent king move controlled by another king)
+                    # For Rook we will check only if directions and up, down, left, right which is in range 0 <= j <=  3 in directions.
+                    # Similarity for bishop, in directions we have added the bishop direction in directions (4 to 7).
+                    # For pawn if one forward diagonal square in front of king has opponent's pawn
+                    if (0 <= j <= 3 and type == 'R') or (4 <= j <= 7 and type == 'B') or \
+                            (i == 1 and type == 'p' and (
+                                    (enemyColor == 'w' and 6 <= j <= 7) or (enemyColor == 'b' and 4 <= j <= 5))) or \
+                            (type == 'Q') or (i == 1 and type == 'K'):
+                        return True
+                break # own piece, or an enemy piece not attacking along this line, blocks it
+        # knights jump, they aren't found by walking the directions above
+        enemyKnight = 'wN' if enemyColor == 'w' else 'bN'
+        for endRow, endCol, code in knightTargets[square]:
+            if board[endRow][endCol] == enemyKnight:
+                return True
+        return False
 
 
     '''
@@ -321,32 +1165,20 @@ class GameState:
                 self.pins.remove(self.pins[i])
                 break
 
-        if self.playerWantsToPlayAsBlack:
-            if self.whiteToMove:
-                moveAmount = 1
-                startRow = 1
-                enemyColor = 'b'
-                kingRow, kingCol = self.whiteKingLocation
-            else:
-                moveAmount = -1
-                startRow = 6
-                enemyColor = 'w'
-                kingRow, kingCol = self.blackKingLocation
+        if self.whiteToMove:
+            moveAmount = -1
+            startRow = 6
+            enemyColor = 'b'
+            kingRow, kingCol = self.whiteKingLocation
         else:
-            if self.whiteToMove:
-                moveAmount = -1
-                startRow = 6
-                enemyColor = 'b'
-                kingRow, kingCol = self.whiteKingLocation
-            else:
-                moveAmount = 1
-                startRow = 1
-                enemyColor = 'w'
-                kingRow, kingCol = self.blackKingLocation
+            moveAmount = 1
+            startRow = 1
+            enemyColor = 'w'
+            kingRow, kingCol = self.blackKingLocation
 
         if self.board[r + moveAmount][c] == "--":  # first square move
-            # if piece is not pinned then its fine or if it is pinned but from forward direction then we can still move
-            if not piecePinned or pinDirection == (moveAmount, 0):
+            # if piece is not pinned then its fine or if it is pinned along the file then we can still move
+            if not piecePinned or pinDirection in ((moveAmount, 0), (-moveAmount, 0)):
                 moves.append(
                     Move((r, c), (r+moveAmount, c), self.board))
                 # Check if pawn can directly advance to second square
@@ -357,7 +1189,7 @@ class GameState:
         if c - 1 >= 0:  # there is a col to the left for white
             # check if there is a black piece to the left of your pawn that you can capture
             # if piece is not pinned then its fine or if it is pinned but from left direction then we can capture left piece
-            if not piecePinned or pinDirection == (moveAmount, -1):
+            if not piecePinned or pinDirection in ((moveAmount, -1), (-moveAmount, 1)):
                 if self.board[r + moveAmount][c - 1][0] == enemyColor:
                     moves.append(
                         Move((r, c), (r + moveAmount, c - 1), self.board))
@@ -380,15 +1212,17 @@ class GameState:
                             square = self.board[r][i]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):
                                 attackingPiece = True
+                                break
                             elif square != "--":
                                 blockingPiece = True
+                                break
                     if not attackingPiece or blockingPiece:
                         moves.append(Move((r, c), (r + moveAmount, c - 1), self.board, isEnpassantMove=True))
 
         if c + 1 <= 7:  # there is a col to the right for white
             # check if there is a black piece to the right of your pawn that you can capture
             # if piece is not pinned then its fine or if it is pinned but from left direction then we can capture right piece
-            if not piecePinned or pinDirection == (moveAmount, 1):
+            if not piecePinned or pinDirection in ((moveAmount, 1), (-moveAmount, -1)):
                 if self.board[r + moveAmount][c + 1][0] == enemyColor:
                     moves.append(
                         Move((r, c), (r + moveAmount, c + 1), self.board))
@@ -411,8 +1245,10 @@ class GameState:
                             square = self.board[r][i]
                             if square[0] == enemyColor and (square[1] == "R" or square[1] == "Q"):
                                 attackingPiece = True
+                                break
                             elif square != "--":
                                 blockingPiece = True
+                                break
                     if not attackingPiece or blockingPiece:
                         moves.append(Move((r, c), (r + moveAmount, c + 1),
                                           self.board, isEnpassantMove=True))
@@ -585,9 +1421,9 @@ class GameState:
     def getCastleMoves(self,r ,c , moves, allyColor):
         if self.squareUnderAttack(r, c, allyColor):
             return #we can't castle while we are in check
-        if (self.whiteToMove and self.currentCastlingRight.wks) or (not self.whiteToMove and self.currentCastlingRight.bks):
+        if self.castleRights & (WHITE_KING_SIDE if self.whiteToMove else BLACK_KING_SIDE):
             self.getKingsideCastleMoves(r,c,moves,allyColor)
-        if (self.whiteToMove and self.currentCastlingRight.wqs) or (not self.whiteToMove and self.currentCastlingRight.bqs):
+        if self.castleRights & (WHITE_QUEEN_SIDE if self.whiteToMove else BLACK_QUEEN_SIDE):
             self.getQueensideCastleMoves(r,c,moves,allyColor)
 
     """
@@ -684,14 +1520,45 @@ class GameState:
         return boardString
 
 
-class CastleRights:
-    def __init__(self, wks, bks, wqs, bqs):
-        self.wks = wks
-        self.bks = bks
-        self.wqs = wqs
-        self.bqs = bqs
 
+class MoveList(list):
+    """
+        The legal moves of a position with lookups by square, so the GUI finds the moves of the clicked piece
+        or the move between two clicked squares without going through the whole list. The indexes are built
+        on the first lookup. A promotion is a single Move per square pair, its piece is promotionChoice.
+    """
+    def __init__(self, moves=()):
+        super().__init__(moves)
+        self.byOrigin = None # (row, col) -> moves starting there
+        self.bySquares = None # ((row, col), (row, col)) -> the move between them
+
+    def buildIndexes(self):
+        self.byOrigin = {}
+        self.bySquares = {}
+        for move in self:
+            startSq = (move.startRow, move.startCol)
+            self.byOrigin.setdefault(startSq, []).append(move)
+            self.bySquares[(startSq, (move.endRow, move.endCol))] = move
+
+    """
+        The moves of the piece on startSq, empty if it has none.
+    """
+    def fromSquare(self, startSq):
+        if self.byOrigin is None:
+            self.buildIndexes()
+        return self.byOrigin.get(startSq, ())
 
+    """
+        The move from startSq to endSq, None if there is no such legal move.
+        A promotion is set to promote to promotion (a piece letter from QRBN).
+    """
+    def find(self, startSq, endSq, promotion="Q"):
+        if self.bySquares is None:
+            self.buildIndexes()
+        move = self.bySquares.get((startSq, endSq))
+        if move is not None and move.isPawnPromotion:
+            move.promotionChoice = promotion
+        return move
 
 
 class Move:
@@ -724,7 +1591,6 @@ class Move:
         self.endCol = endSq[1]
         self.pieceMoved = board[self.startRow][self.startCol]
 
-        self.pieceCaptured = board[self.endRow][self.endCol]
         #pawn promotion
         self.isPawnPromotion = (self.pieceMoved == 'wp' and self.endRow == 0) or (self.pieceMoved == 'bp' and self.endRow == 7)
         if isEnpassantMove:
@@ -734,14 +1600,8 @@ class Move:
         self.isCapture = self.pieceCaptured != '--'
         self.moveID = self.startRow * 1000 + self.startCol * \
                       100 + self.endRow * 10 + self.endCol
-        # pawn promotion
-        gs = GameState()
-        if gs.playerWantsToPlayAsBlack:
-            self.isPawnPromotion = (self.pieceMoved == "wp" and self.endRow == 7) or (
-                    self.pieceMoved == "bp" and self.endRow == 0)
-        else:
-            self.isPawnPromotion = (self.pieceMoved == "wp" and self.endRow == 0) or (
-                    self.pieceMoved == "bp" and self.endRow == 7)
+
+        self.promotionChoice = 'Q' # piece the pawn turns into, the GUI overrides it with the player's pick
 
         # enpassant
         self.isEnpassantMove = isEnpassantMove
@@ -761,6 +1621,20 @@ class Move:
             return self.moveID == other.moveID
         return False
 
+    """
+        The move code of this move, see MOVE_NORMAL.
+    """
+    def encode(self):
+        if self.isEnpassantMove:
+            kind = MOVE_ENPASSANT
+        elif self.isCastleMove:
+            kind = MOVE_CASTLE
+        elif self.isPawnPromotion:
+            kind = MOVE_PROMOTION + PROMOTION_PIECES.index(self.promotionChoice)
+        else:
+            kind = MOVE_NORMAL
+        return moveCodes[self.startRow * 8 + self.startCol][self.endRow * 8 + self.endCol] | kind << 12
+
     """
         Returns the human-readable chess notation for the move (e.g., e4, Nf3, O-O).
     """
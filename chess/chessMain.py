@@ -3,19 +3,27 @@ This is main driver file.
 It will be responsible for handling user input and displaying the current GameState object.
 """
 
+import os
 import sys
-import pygame as p
+import time
+STARTUP_BEGAN = time.perf_counter() # startup is measured from here to the first frame on screen
 from chess import chessEngine, ChessAI
-from multiprocessing import Process, Queue
-
-#Initialize the mixer
-p.mixer.init()
-
-# Sound effects for various game actions
-move_sound = p.mixer.Sound("sounds/move-sound.mp3") # Sound for a piece move
-capture_sound = p.mixer.Sound("sounds/capture.mp3") #Sound for capturing a piece
-promote_sound = p.mixer.Sound("sounds/promote.mp3") # Sound for pawn promotion
-
+from chess.sharedPosition import SharedSearchSlot
+from multiprocessing import Process, Queue, Value
+from threading import Thread
+
+# Assets are found relative to this file so the game can be started from any directory.
+# Nothing is loaded at import time, not even pygame: spawned AI processes import this module and never need them.
+p = None # the pygame module, imported by initPygame() in the GUI process only
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Sound effects for various game actions, loaded on first play
+SOUND_FILES = {
+    "move": "move-sound.mp3", # Sound for a piece move
+    "capture": "capture.mp3", #Sound for capturing a piece
+    "promote": "promote.mp3" # Sound for pawn promotion
+}
+SOUNDS = {}
 
 # Screen dimensions and other constants
 WIDTH = HEIGHT = 512 # Main screen width and height in pixels
@@ -23,8 +31,14 @@ MOVE_LOG_PANEL_WIDTH = 250  # Panel dimensions
 MOVE_LOG_PANEL_HEIGHT = HEIGHT
 DIMENSION = 8 # Chessboard grid (8x8 by default)
 SQ_SIZE = HEIGHT // DIMENSION # Square size
-MAX_FPS = 15 # Frame rate for rendering animations
+ANIMATION_FPS = 60 # Frame rate for move animations, the rest of the time the loop sleeps until an event arrives
+AI_MOVE_READY = None # pygame event type posted when the AI process has found its move, set by initPygame()
 IMAGES = {} # Dictionary to cache and load piece images
+USE_SPRITE_ATLAS = True # keep the scaled pieces in one pre-scaled atlas image that is cached on disk
+ATLAS_FILE = os.path.join(ASSET_DIR, "images", f"atlas_{SQ_SIZE}.png")
+PROMOTION_IMAGES = {} # Bigger piece images for the promotion dialog, cached like IMAGES
+PROMOTION_PIECES = ["Q", "R", "B", "N"] # order of the buttons in the promotion dialog
+PROMOTION_BUTTON_SIZE = 100
 
 '''
 This two variables used for defining AI player and human player.
@@ -32,13 +46,14 @@ This two variables used for defining AI player and human player.
 
 SET_WHITE_AS_BOT = True #if true Ai bot plays Setting for if the white side is controlled by AI
 SET_BLACK_AS_BOT = True #if false human plays Setting for if the black side is controlled by AI
+PLAY_AS_BLACK = False #if true the board is shown from black's side, black's pieces at the bottom
 
 
 '''
 These are colors used in the code
 '''
 
-colors = [p.Color("#EBECD0"), p.Color("#739552")]
+colors = [] # light and dark square colours as pygame Colors, set by initPygame()
 LIGHT_SQUARE_COLOR = (237, 238, 209)
 DARK_SQUARE_COLOR = (119, 153, 82)
 MOVE_HIGHLIGHT_COLOR = (84, 115, 161)
@@ -46,25 +61,87 @@ POSSIBLE_MOVE_COLOR = (255, 255, 51)
 
 
 
+'''
+Imports and initialises pygame and sets the module constants that depend on it.
+Only the GUI process calls this, the AI processes re-import this module on spawn platforms and never load pygame.
+'''
+def initPygame():
+    global p, AI_MOVE_READY, colors
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import pygame as p
+    p.init()
+    AI_MOVE_READY = p.USEREVENT + 1
+    colors = [p.Color("#EBECD0"), p.Color("#739552")]
+
+
 '''
 Initialise a global dictionary of images. This will be called exactly once in the main
 Loads and caches chess piece images into the global `IMAGES` dictionary.
 This function is used to improve performance by preloading all necessary assets so they can be reused throughout the application.
-
+Calling it again is free. With USE_SPRITE_ATLAS the scaled pieces are saved as one atlas image,
+so later startups load a single file and skip smoothscale. The atlas is rebuilt when any piece image is newer.
 '''
 
 def loadImages():
+    if IMAGES:
+        return IMAGES
     pieces = ['wp', 'wR', 'wN', 'wB', 'wK', 'wQ', 'bp', 'bR', 'bN', 'bB', 'bK', 'bQ']
+    sourceFiles = [os.path.join(ASSET_DIR, "images", f"{piece}.png") for piece in pieces]
     try:
-        for piece in pieces:
-            # IMAGES[piece] = p.transform.scale(p.image.load(f"images/{piece}.png"), (SQ_SIZE, SQ_SIZE))
-            # p.transform.smoothscale is a bit slower than p.transform.scale, using this to reduce pixelation and better visual quality for scaling images to larger sizes
-            IMAGES[piece] = p.transform.smoothscale(p.image.load(f"images/{piece}.png"), (SQ_SIZE, SQ_SIZE))
+        atlas = None
+        if USE_SPRITE_ATLAS and os.path.exists(ATLAS_FILE) and \
+                os.path.getmtime(ATLAS_FILE) >= max(os.path.getmtime(path) for path in sourceFiles):
+            atlas = p.image.load(ATLAS_FILE)
+        if atlas is None or atlas.get_size() != (SQ_SIZE * len(pieces), SQ_SIZE):
+            atlas = p.Surface((SQ_SIZE * len(pieces), SQ_SIZE), p.SRCALPHA)
+            for i, piece in enumerate(pieces):
+                # p.transform.smoothscale is a bit slower than p.transform.scale, using this to reduce pixelation and better visual quality for scaling images to larger sizes
+                image = p.image.load(sourceFiles[i])
+                atlas.blit(p.transform.smoothscale(image, (SQ_SIZE, SQ_SIZE)), (i * SQ_SIZE, 0))
+            if USE_SPRITE_ATLAS:
+                try:
+                    p.image.save(atlas, ATLAS_FILE)
+                except (p.error, OSError) as e: # read-only install, just rebuild it next time
+                    print(f"Could not cache sprite atlas: {e}")
+        for i, piece in enumerate(pieces):
+            IMAGES[piece] = atlas.subsurface(p.Rect(i * SQ_SIZE, 0, SQ_SIZE, SQ_SIZE))
     except Exception as e:
         print(f"Error while loading images: {e}")
+    return IMAGES
+
+'''
+Plays one of the SOUND_FILES effects. The mixer and the sound are only loaded the first time it is played.
+If there is no audio device the game just stays silent.
+'''
+
+def playSound(name):
+    if name not in SOUNDS:
+        try:
+            if not p.mixer.get_init():
+                p.mixer.init()
+            SOUNDS[name] = p.mixer.Sound(os.path.join(ASSET_DIR, "sounds", SOUND_FILES[name]))
+        except p.error as e:
+            print(f"Error while loading sound {name}: {e}")
+            SOUNDS[name] = None
+    if SOUNDS[name] is not None:
+        SOUNDS[name].play()
 
 #Note: we can access an image by saying IMAGES['wp']
 
+'''
+Loads the bigger piece images shown in the promotion dialog into PROMOTION_IMAGES.
+They are scaled once, the first time a pawn promotes, and reused for every promotion after that.
+'''
+
+def loadPromotionImages():
+    if not PROMOTION_IMAGES:
+        size = (PROMOTION_BUTTON_SIZE, PROMOTION_BUTTON_SIZE)
+        for color in "wb":
+            for piece in PROMOTION_PIECES:
+                image = p.image.load(os.path.join(ASSET_DIR, "images", f"{color}{piece}.png"))
+                PROMOTION_IMAGES[color + piece] = p.transform.smoothscale(image, size)
+    return PROMOTION_IMAGES
+
 '''
 Displays a popup when a pawn reaches the last rank to allow the player to choose
 a piece for promotion. Options typically include Queen, Rook, Bishop, or Knight.
@@ -75,7 +152,7 @@ def pawnPromotionPopup(screen, gs):
     text = font.render("Choose promotion:", True, p.Color("black"))
 
     # Create buttons for promotion choices with images
-    width, height = 100, 100
+    width, height = PROMOTION_BUTTON_SIZE, PROMOTION_BUTTON_SIZE
     buttons = [
         p.Rect(100, 200, width, height),
         p.Rect(200, 200, width, height),
@@ -83,55 +160,28 @@ def pawnPromotionPopup(screen, gs):
         p.Rect(400, 200, width, height)
     ]
 
-    if gs.whiteToMove:
-        button_images = [
-            p.transform.smoothscale(p.image.load(
-                "images1/bQ.png"), (100, 100)),
-            p.transform.smoothscale(p.image.load(
-                "images1/bR.png"), (100, 100)),
-            p.transform.smoothscale(p.image.load(
-                "images1/bB.png"), (100, 100)),
-            p.transform.smoothscale(p.image.load("images1/bN.png"), (100, 100))
-        ]
-    else:
-        button_images = [
-            p.transform.smoothscale(p.image.load(
-                "images1/wQ.png"), (100, 100)),
-            p.transform.smoothscale(p.image.load(
-                "images1/wR.png"), (100, 100)),
-            p.transform.smoothscale(p.image.load(
-                "images1/wB.png"), (100, 100)),
-            p.transform.smoothscale(p.image.load("images1/wN.png"), (100, 100))
-        ]
-
-    while True:
-        for e in p.event.get():
-            if e.type == p.QUIT:
-                p.quit()
-                sys.exit()
-            elif e.type == p.MOUSEBUTTONDOWN:
-                mouse_pos = e.pos
-                for i, button in enumerate(buttons):
-                    if button.collidepoint(mouse_pos): # Return the index of the selected piece
-                        if i == 0:
-                            return "Q"
-                        elif i == 1:
-                            return "R"
-                        elif i == 2:
-                            return "B"
-                        else:
-                            return "N"
-
-        screen.fill(p.Color(LIGHT_SQUARE_COLOR))
-        screen.blit(text, (110, 150))
-
-        for i, button in enumerate(buttons):
-            p.draw.rect(screen, p.Color("white"), button)
-            screen.blit(button_images[i], button.topleft)
-
-        p.display.flip()
+    color = "b" if gs.whiteToMove else "w" # the side that just moved is promoting
+    images = loadPromotionImages()
+    button_images = [images[color + piece] for piece in PROMOTION_PIECES]
 
+    # the dialog never changes, draw it once and sleep until the player clicks
+    screen.fill(p.Color(LIGHT_SQUARE_COLOR))
+    screen.blit(text, (110, 150))
+    for i, button in enumerate(buttons):
+        p.draw.rect(screen, p.Color("white"), button)
+        screen.blit(button_images[i], button.topleft)
+    p.display.flip()
 
+    while True:
+        e = p.event.wait()
+        if e.type == p.QUIT:
+            p.quit()
+            sys.exit()
+        elif e.type == p.MOUSEBUTTONDOWN:
+            mouse_pos = e.pos
+            for i, button in enumerate(buttons):
+                if button.collidepoint(mouse_pos): # Return the selected piece
+                    return PROMOTION_PIECES[i]
 
 
 '''
@@ -144,21 +194,22 @@ Key Features:
 
 def main():
     #initialise py game
-    p.init()
+    initPygame()
     screen = p.display.set_mode((WIDTH + MOVE_LOG_PANEL_WIDTH, HEIGHT))
     clock = p.time.Clock()
+    p.event.set_blocked(p.MOUSEMOTION) # hovering doesn't change anything, don't wake up for it
     screen.fill(p.Color("white"))
     moveLogFont = p.font.SysFont("Arial", 12, False, False)
     # Creating GameState object calling our constructor
     gs = chessEngine.GameState()
-    # this used to rotate board since player wants to play as black
-    if gs.playerWantsToPlayAsBlack:
-        gs.board = gs.board1
-    validMoves = gs.getValidMoves()
+    validMoves = gs.getCachedValidMoves()
     moveMade = False #flag variable for when a move is made
     animate = False #flag variable for when we should animate a move
     # print(gs.board)
     loadImages() #only do this once before the while loop
+    renderer = BoardRenderer(screen, moveLogFont)
+    assetsLoaded = time.perf_counter()
+    startupReported = False
     running = True
     sqSelected = () #no square is selected, keep track of the last click of the user (tuple: (row, col))
     playerClicks = [] #keep track of player clicks (two tuples: [(6, 4), (4,4)])
@@ -166,7 +217,12 @@ def main():
     playerOne = not SET_WHITE_AS_BOT #if a human is playing white, then this will be true. If AI is playing then false
     playerTwo = not SET_BLACK_AS_BOT #same as above but for black
     AIThinking = False #true if AI is thinking.
-    moveFinderProcess = None
+    moveFinderProcess = None # AI process, started on the first AI turn and reused for every move after that
+    jobQueue = Queue() # positions for the AI process to search
+    returnQueue = Queue() # search ids whose move is ready in the slot
+    searchSlot = None # shared memory the positions and moves are exchanged through
+    stopSearchId = Value('l', 0, lock=False) # shared word, the AI stops every search with an id up to this
+    searchId = 0 # tags AI results so a cancelled search can't play its move
     moveUndone = False
     pieceCaptured = False
     positionHistory = ""
@@ -178,15 +234,56 @@ def main():
 
     while running:
         humanTurn = (gs.whiteToMove and playerOne) or (not gs.whiteToMove and playerTwo)
-        for e in p.event.get():
+
+        endText = None
+        if COUNT_DRAW == 1:
+            gameOver = True
+            endText = "Draw due to repetition"
+        elif gs.checkMate:
+            gameOver = True
+            endText = "Black wins by checkmate." if gs.whiteToMove else "White wins by checkmate."
+        elif gs.staleMate:
+            gameOver = True
+            endText = "Stalemate."
+
+        #AI move finder
+        if not gameOver and not humanTurn and not moveUndone and not AIThinking:
+            AIThinking = True
+            searchId += 1
+            if moveFinderProcess is None:
+                searchSlot = SharedSearchSlot()
+                moveFinderProcess = Process(target=ChessAI.searchWorker, args=(jobQueue, returnQueue, stopSearchId, searchSlot.name), daemon=True)
+                moveFinderProcess.start()
+                # wakes the loop up with an AI_MOVE_READY event as soon as a move is ready
+                Thread(target=postAIMoves, args=(returnQueue,), daemon=True).start()
+            searchSlot.writePosition(gs, searchId)
+            jobQueue.put(searchId) #rest of the code could still work even if the AI is thinking
+
+        # renderer only repaints what changed, an unchanged frame costs nothing
+        renderer.draw(gs, validMoves, sqSelected, endText)
+        if not startupReported:
+            reportStartup(assetsLoaded)
+            startupReported = True
+
+        events = p.event.get()
+        if not events:
+            events = [p.event.wait()] # nothing to do, sleep until something happens
+        for e in events:
             if e.type == p.QUIT:
                 running = False
             #mouse handler
+            elif e.type == p.MOUSEWHEEL:
+                if p.mouse.get_pos()[0] >= WIDTH: # scroll the move log
+                    renderer.moveLogView.scroll(-e.y)
             elif e.type == p.MOUSEBUTTONDOWN:
+                if e.button in (4, 5): # wheel, handled as MOUSEWHEEL
+                    continue
                 if not gameOver: # allow mouse handling only if its not game over
-                    location = p.mouse.get_pos() #(x, y) location of mouse
+                    location = e.pos #(x, y) location of mouse
                     col = location[0]//SQ_SIZE
                     row = location[1]//SQ_SIZE
+                    if col < DIMENSION:
+                        row, col = viewSquare(row, col) # the board square under the mouse
                     if sqSelected == (row, col) or col >= 8: #user clicked the same square twice
                         sqSelected = () #deselect
                         playerClicks = [] #clear player clicks
@@ -194,30 +291,30 @@ def main():
                         sqSelected = (row, col)
                         playerClicks.append(sqSelected) #append for both 1st and 2nd click
                     if len(playerClicks) == 2 and humanTurn: #after 2nd click
-                        move = chessEngine.Move(playerClicks[0], playerClicks[1], gs.board)
-                        for i in range(len(validMoves)):
-                            if move == validMoves[i]:
-                                # Check if a piece is captured at the destination square
-                                if gs.board[validMoves[i].endRow][validMoves[i].endCol] != '--':
-                                    pieceCaptured = True
-                                gs.makeMove(validMoves[i])
-                                if move.isPawnPromotion:
-                                    # Show pawn promotion popup and get the selected piece
-                                    promotion_choice = pawnPromotionPopup(screen, gs)
-                                    # Set the promoted piece on the board
-                                    gs.board[move.endRow][move.endCol] = move.pieceMoved[0] + promotion_choice
-                                    promote_sound.play()
-                                    pieceCaptured = False
-                                #add sound for human move
-                                if pieceCaptured or move.isEnpassantMove:
-                                    capture_sound.play() #plays capture sound
-                                elif not move.isPawnPromotion:
-                                    move_sound.play() #plays move sound
+                        move = validMoves.find(playerClicks[0], playerClicks[1])
+                        if move is not None:
+                            # Check if a piece is captured at the destination square
+                            if gs.board[move.endRow][move.endCol] != '--':
+                                pieceCaptured = True
+                            gs.makeMove(move)
+                            if move.isPawnPromotion:
+                                # Show pawn promotion popup and get the selected piece
+                                promotion_choice = pawnPromotionPopup(screen, gs)
+                                renderer.invalidate() # popup painted over the whole window
+                                # Set the promoted piece on the board
+                                gs.setPromotionPiece(move, promotion_choice)
+                                playSound("promote")
                                 pieceCaptured = False
-                                moveMade = True
-                                animate = True
-                                sqSelected = () #reset user clicks
-                                playerClicks = []
+                            #add sound for human move
+                            if pieceCaptured or move.isEnpassantMove:
+                                playSound("capture") #plays capture sound
+                            elif not move.isPawnPromotion:
+                                playSound("move") #plays move sound
+                            pieceCaptured = False
+                            moveMade = True
+                            animate = True
+                            sqSelected = () #reset user clicks
+                            playerClicks = []
                         if not moveMade:
                             playerClicks = [sqSelected]
             #key handlers
@@ -228,33 +325,29 @@ def main():
                         animate = False
                         gameOver = False
                         if AIThinking:
-                            moveFinderProcess.terminate() # terminate the AI thinking if we undo
+                            stopSearchId.value = searchId # stop the AI thinking if we undo, its move is ignored
                             AIThinking = False
                         moveUndone = True
                     if e.key == p.K_r: #reset the board when 'r' is pressed
                         gs = chessEngine.GameState()
-                        validMoves = gs.getValidMoves()
+                        validMoves = gs.getCachedValidMoves()
                         sqSelected = ()
                         playerClicks = []
                         moveMade = False
                         animate = False
                         gameOver = False
                         if AIThinking:
-                            moveFinderProcess.terminate() # terminate the AI thinking if we undo
+                            stopSearchId.value = searchId # stop the AI thinking if we undo, its move is ignored
                             AIThinking = False
                         moveUndone = False
-
-        #AI move finder
-        if not gameOver and not humanTurn and not moveUndone:
-            if not AIThinking:
-                AIThinking = True
-                returnQueue = Queue() #keep track of data, to pass data between threads
-                moveFinderProcess = Process(target=ChessAI.findBestMove, args=(gs, validMoves, returnQueue)) # when processing start we call these process
-                # call findBestMove(gs, validMoves, returnQueue) #rest of the code could still work even if the AI is thinking
-                moveFinderProcess.start()
-
-            if not moveFinderProcess.is_alive():
-                AIMove = returnQueue.get()  # return from returnQueue
+                    if e.key == p.K_m: #make the AI move now with the best move it has found so far
+                        if AIThinking:
+                            stopSearchId.value = searchId
+            #AI move is ready
+            elif e.type == AI_MOVE_READY:
+                if not AIThinking or e.searchId != searchId:
+                    continue # result of a search that was cancelled by undo or reset
+                AIMove = searchSlot.readResult(searchId, validMoves)
                 if AIMove is None:
                     AIMove = ChessAI.findRandomMove(validMoves)
 
@@ -266,15 +359,16 @@ def main():
                 if AIMove.isPawnPromotion:
                     # Show pawn promotion popup and get the selected piece
                     promotion_choice = pawnPromotionPopup(screen, gs)
+                    renderer.invalidate() # popup painted over the whole window
                     # Set the promoted piece on the board
-                    gs.board[AIMove.endRow][AIMove.endCol] = AIMove.pieceMoved[0] + promotion_choice
-                    promote_sound.play()
+                    gs.setPromotionPiece(AIMove, promotion_choice)
+                    playSound("promote")
                     pieceCaptured = False
 
                 if pieceCaptured or AIMove.isEnpassantMove:
-                    capture_sound.play()
+                    playSound("capture")
                 elif not AIMove.isPawnPromotion:
-                    move_sound.play()
+                    playSound("move")
 
                 pieceCaptured = False
                 moveMade = True
@@ -282,14 +376,9 @@ def main():
                 sqSelected = ()
                 playerClicks = []
                 AIThinking = False
-
-            # AIMove = ChessAI.findBestMoveMinMax(gs, validMoves)
-            # if AIMove is None:
-            #     AIMove = ChessAI.findRandomMove(validMoves)
-            # gs.makeMove(AIMove)
-            # print("move by AI: " + AIMove.getChessNotation())  # Print the AI's move
-            # moveMade = True
-            # animate = True
+            #window was uncovered, what we think is on screen may be gone
+            elif e.type == p.WINDOWEXPOSED or e.type == p.VIDEOEXPOSE:
+                renderer.invalidate()
 
         if moveMade:
             if countMovesForDraw == 0 or countMovesForDraw == 1 or countMovesForDraw == 2 or countMovesForDraw == 3:
@@ -307,63 +396,223 @@ def main():
                     COUNT_DRAW = 0
             #call animateMove to animate the move
             if animate:
-                animateMove(gs.moveLog[-1], screen, gs.board, clock)
+                # leaves the screen matching the board minus highlights, the renderer repaints the changed squares
+                animateMove(gs.moveLog[-1], screen, gs.board, clock, renderer.boardSurface)
             # Generate new set of valid move if valid move is made
-            validMoves = gs.getValidMoves()
+            validMoves = gs.getCachedValidMoves()
             moveMade = False
             animate = False
             moveUndone = False
 
-        drawGameState(screen, gs, validMoves, sqSelected, moveLogFont)
+    if moveFinderProcess is not None:
+        stopSearchId.value = searchId
+        jobQueue.put(None) # lets the AI process finish
+        moveFinderProcess.join(1)
+        searchSlot.close()
 
-        if COUNT_DRAW == 1:
-            gameOver = True
-            drawText(screen, "Draw due to repetition")
-        elif gs.checkMate:
-            gameOver = True
-            drawText(screen, "Black wins by checkmate." if gs.whiteToMove else "White wins by checkmate.")
-        elif gs.staleMate:
-            gameOver = True
-            drawText(screen, "Stalemate.")
+'''
+Prints how long startup took: importing modules, creating the window and loading assets, and the first frame.
+'''
+def reportStartup(assetsLoaded):
+    firstFrame = time.perf_counter()
+    print(f"Startup: imports {(MODULE_LOADED - STARTUP_BEGAN) * 1000:.0f} ms, "
+          f"window and assets {(assetsLoaded - MODULE_LOADED) * 1000:.0f} ms, "
+          f"first frame after {(firstFrame - STARTUP_BEGAN) * 1000:.0f} ms")
 
-        clock.tick(MAX_FPS)
-        p.display.flip()
+'''
+Runs on a helper thread for as long as the AI process lives.
+Blocks on the return queue and posts an AI_MOVE_READY event for every finished search, so the main loop
+can sleep in p.event.wait() instead of polling the process every frame. The move itself is in the search slot.
+'''
+def postAIMoves(returnQueue):
+    while True:
+        searchId = returnQueue.get()
+        p.event.post(p.event.Event(AI_MOVE_READY, searchId=searchId))
 
 '''
-Highlight the square and moves that the user has selected.
-Highlights valid moves and important squares on the chessboard. 
-Colors specified in configuration are applied for readability and gameplay ease.
+Keeps track of what is already on the screen so a frame only repaints what changed.
+The board squares are pre-rendered once, the pieces live on their own cached layer and every move log
+line is rendered once. draw() hands only the changed rectangles to p.display.update().
+'''
+class BoardRenderer:
+    def __init__(self, screen, moveLogFont):
+        self.screen = screen
+        self.moveLogFont = moveLogFont
+        self.boardSurface = p.Surface((WIDTH, HEIGHT)) # pre-rendered squares, never changes
+        drawBoard(self.boardSurface)
+        self.pieceLayer = p.Surface((WIDTH, HEIGHT), p.SRCALPHA) # pieces only, transparent elsewhere
+        self.layerPieces = [[None] * DIMENSION for _ in range(DIMENSION)] # what the piece layer holds
+        # highlight overlays, transperancy value -> 0 transparent; 255 opaque
+        self.highlightSurfaces = [None, p.Surface((SQ_SIZE, SQ_SIZE)), p.Surface((SQ_SIZE, SQ_SIZE))]
+        self.highlightSurfaces[1].set_alpha(100)
+        self.highlightSurfaces[1].fill(p.Color("yellow")) # selected square
+        self.highlightSurfaces[2].set_alpha(100)
+        self.highlightSurfaces[2].fill(p.Color("#ffff33")) # squares the selected piece can move to
+        self.moveLogView = MoveLogView(moveLogFont, p.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT))
+        self.invalidate()
+
+    '''
+    Forget what is on the screen, the next draw() repaints everything.
+    Call this after something else drew over the window (promotion popup, animation).
+    '''
+    def invalidate(self):
+        self.shownPieces = [[None] * DIMENSION for _ in range(DIMENSION)]
+        self.shownHighlights = [[-1] * DIMENSION for _ in range(DIMENSION)]
+        self.moveLogView.changed = True
+        self.shownText = None
+
+    '''
+    Draw the current game state, repainting only squares, log lines or text that changed since the last call.
+    text is the game over message or None.
+    '''
+    def draw(self, gs, validMoves, sqSelected, text=None):
+        dirty = []
+        if text != self.shownText and self.shownText is not None:
+            # old message is painted over the board, repaint the squares underneath it
+            self.shownPieces = [[None] * DIMENSION for _ in range(DIMENSION)]
+
+        highlights = getHighlightedSquares(gs, validMoves, sqSelected)
+        board = gs.board
+        for r in range(DIMENSION):
+            for c in range(DIMENSION):
+                piece = board[r][c]
+                highlight = highlights.get((r, c), 0)
+                if piece == self.shownPieces[r][c] and highlight == self.shownHighlights[r][c]:
+                    continue
+                square = squareRect(r, c)
+                if piece != self.layerPieces[r][c]:
+                    self.pieceLayer.fill((0, 0, 0, 0), square)
+                    if piece != "--":
+                        self.pieceLayer.blit(IMAGES[piece], square)
+                    self.layerPieces[r][c] = piece
+                self.screen.blit(self.boardSurface, square, square)
+                if highlight:
+                    self.screen.blit(self.highlightSurfaces[highlight], square)
+                self.screen.blit(self.pieceLayer, square, square)
+                self.shownPieces[r][c] = piece
+                self.shownHighlights[r][c] = highlight
+                dirty.append(square)
+
+        self.moveLogView.sync(gs.moveLog)
+        if self.moveLogView.changed:
+            dirty.append(self.moveLogView.draw(self.screen))
+
+        if text is not None and (text != self.shownText or dirty):
+            dirty.append(drawText(self.screen, text))
+        self.shownText = text
+
+        if dirty:
+            p.display.update(dirty)
 
 '''
-def highlightSquares(screen, gs, validMoves, sqSelected):
-    if sqSelected != ():
-        r, c = sqSelected
-        if gs.board[r][c][0] == ("w" if gs.whiteToMove else "b"): #sqSelected is a piece that can be moved
-            #highlight selected square
-            # Surface in pygame used to add images or transparency feature
-            s = p.Surface((SQ_SIZE, SQ_SIZE))
-            s.set_alpha(100) #transperancy value -> 0 transparent; 255 opaque
-            s.fill(p.Color("yellow"))
-            screen.blit(s, (c*SQ_SIZE, r*SQ_SIZE))
-            #highlight moves from that square
-            s.fill(p.Color("#ffff33"))
-            for move in validMoves:
-                if move.startRow == r and move.startCol == c:
-                    screen.blit(s, (SQ_SIZE*move.endCol, SQ_SIZE*move.endRow))
+Draw the moveLog of the pieces moved in the game.
+The move log panel on the right side of the screen, listing all moves made during the game.
+Rows are formatted incrementally as moves are made or undone instead of rebuilding the whole log,
+every row is rendered once and only the rows that fit in the panel are drawn.
+It follows the latest move unless the player scrolled up with the mouse wheel.
+'''
+class MoveLogView:
+    movesPerRow = 3
+    padding = 10 # Increase padding for better readability
+    lineSpacing = 5  # Increase line spacing for better separation
 
+    def __init__(self, font, rect):
+        self.font = font
+        self.rect = rect
+        self.loggedMoves = [] # moves already formatted, the same objects as in gs.moveLog
+        self.moveStrings = [] # str() of each logged move
+        self.rows = [] # text of every row
+        self.rowSurfaces = [] # rendered rows, None until a row is first shown
+        self.rowHeight = font.get_height() + self.lineSpacing
+        self.visibleRows = max(1, (rect.height - self.padding) // self.rowHeight)
+        self.firstRow = 0 # first row shown in the panel
+        self.followTail = True # keep the latest move in view
+        self.changed = True # panel needs to be drawn again
+
+    '''
+    Bring the view up to date with gs.moveLog.
+    Only the plies after the last one both logs agree on are formatted again, normally just one.
+    '''
+    def sync(self, moveLog):
+        logged = self.loggedMoves
+        keep = min(len(logged), len(moveLog))
+        while keep > 0 and logged[keep - 1] is not moveLog[keep - 1]:
+            keep -= 1
+        if keep == len(logged) == len(moveLog):
+            return
+        del logged[keep:]
+        del self.moveStrings[keep:]
+        for move in moveLog[keep:]:
+            logged.append(move)
+            self.moveStrings.append(str(move))
+
+        pliesPerRow = 2 * self.movesPerRow
+        firstChangedRow = keep // pliesPerRow
+        rowCount = (len(logged) + pliesPerRow - 1) // pliesPerRow
+        del self.rows[firstChangedRow:]
+        del self.rowSurfaces[firstChangedRow:]
+        for row in range(firstChangedRow, rowCount):
+            self.rows.append(self.formatRow(row))
+            self.rowSurfaces.append(None)
+        if self.followTail:
+            self.firstRow = len(self.rows)
+        self.scroll(0)
+        self.changed = True
+
+    '''
+    Text of one row, e.g. " 1. e2e4 e7e5  2. Ng1f3 Nb8c6 ..." with movesPerRow moves on it.
+    '''
+    def formatRow(self, row):
+        moveStrings = self.moveStrings
+        text = ""
+        for i in range(row * 2 * self.movesPerRow, min((row + 1) * 2 * self.movesPerRow, len(moveStrings)), 2):
+            text += " " + str(i // 2 + 1) + ". " + moveStrings[i] + " "
+            if i + 1 < len(moveStrings):
+                text += moveStrings[i + 1]
+        return text
+
+    '''
+    Scroll by a number of rows, negative is up. Scrolling to the bottom resumes following the latest move.
+    '''
+    def scroll(self, rows):
+        lastFirstRow = max(0, len(self.rows) - self.visibleRows)
+        firstRow = min(max(self.firstRow + rows, 0), lastFirstRow)
+        if firstRow != self.firstRow:
+            self.firstRow = firstRow
+            self.changed = True
+        self.followTail = firstRow == lastFirstRow
+
+    '''
+    Draw the visible rows onto the screen and return the panel rectangle.
+    '''
+    def draw(self, screen):
+        p.draw.rect(screen, p.Color(LIGHT_SQUARE_COLOR), self.rect)
+        textY = self.padding
+        for row in range(self.firstRow, min(self.firstRow + self.visibleRows, len(self.rows))):
+            textObject = self.rowSurfaces[row]
+            if textObject is None:
+                textObject = self.font.render(self.rows[row], True, p.Color('black'))
+                self.rowSurfaces[row] = textObject
+            # Adjust text location based on padding and line spacing
+            screen.blit(textObject, self.rect.move(self.padding, textY))
+            textY += self.rowHeight
+        self.changed = False
+        return self.rect
 
 '''
-Responsible for all the graphics within a current game state.
-Draws the complete game state on the Pygame window.
-This includes the chessboard, pieces, move log, and any highlighted squares.
-
+Highlight the square and moves that the user has selected, validMoves is a chessEngine.MoveList.
+Returns a dict of (row, col) -> 1 for the selected square and 2 for the squares its piece can move to.
 '''
-def drawGameState(screen, gs, validMoves, sqSelected, moveLogFont):
-    drawBoard(screen) #draw squares on the board
-    #add in piece highlighting or move suggestions
-    highlightSquares(screen, gs, validMoves, sqSelected)
-    drawPieces(screen, gs.board) #draw pieces on top of these squares
-    drawMoveLog(screen, gs, moveLogFont)
+def getHighlightedSquares(gs, validMoves, sqSelected):
+    highlights = {}
+    if sqSelected != ():
+        r, c = sqSelected
+        if gs.board[r][c][0] == ("w" if gs.whiteToMove else "b"): #sqSelected is a piece that can be moved
+            highlights[(r, c)] = 1
+            #highlight moves from that square
+            for move in validMoves.fromSquare(sqSelected):
+                highlights[(move.endRow, move.endCol)] = 2
+    return highlights
 
 '''
 Draw the squares on the board.The top left square is always light.
@@ -372,8 +621,6 @@ configurations. The board is rendered as an 8x8 grid with alternating colors.
 
 '''
 def drawBoard(screen):
-    global colors
-    colors = [p.Color("#EBECD0"), p.Color("#739552")]
     for r in range(DIMENSION):
         for c in range(DIMENSION):
             color = colors[((r+c)%2)]
@@ -391,83 +638,74 @@ def drawPieces(screen, board):
         for c in range(DIMENSION):
             piece = board[r][c]
             if piece != "--": #not empty square
-                screen.blit(IMAGES[piece], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
+                screen.blit(IMAGES[piece], squareRect(r, c))
 
 '''
-Draw the moveLog of the pieces moved in the game.
-Draws a move log panel on the right side of the screen.
-This log lists all moves made during the game in standard chess notation.
-Useful for analyzing or reviewing gameplay history.
-
+The square of the screen grid that shows board square (r, c), and the other way round.
+The engine's board always has white at the bottom, only the view turns it round for PLAY_AS_BLACK.
 '''
+def viewSquare(r, c):
+    if PLAY_AS_BLACK:
+        return DIMENSION - 1 - r, DIMENSION - 1 - c
+    return r, c
 
-def drawMoveLog(screen, gs, moveLogFont):
-    p.draw.rect(screen, p.Color(LIGHT_SQUARE_COLOR), p.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT))
-    moveLog = gs.moveLog
-    moveTexts = []
-
-    for i in range(0, len(moveLog), 2):
-        moveString = " " + str(i // 2 + 1) + ". " + str(moveLog[i]) + " "
-        if i + 1 < len(moveLog):
-            moveString += str(moveLog[i+1])
-        moveTexts.append(moveString)
-
-    movesPerRow = 3
-    padding = 10 # Increase padding for better readability
-    lineSpacing = 5  # Increase line spacing for better separation
-    textY = padding
-
-    for i in range(0, len(moveTexts), movesPerRow):
-        text = ""
-        for j in range(movesPerRow):
-            if i + j < len(moveTexts):
-                text += moveTexts[i + j]
-
-        textObject = moveLogFont.render(text, True, p.Color('black'))
-
-        # Adjust text location based on padding and line spacing
-        textLocation = p.Rect(WIDTH, 0, MOVE_LOG_PANEL_WIDTH, MOVE_LOG_PANEL_HEIGHT).move(padding, textY)
-        screen.blit(textObject, textLocation)
-
-        # Update Y coordinate for the next line with increased line spacing
-        textY += textObject.get_height() + lineSpacing
+'''
+Screen rectangle of board square (r, c).
+'''
+def squareRect(r, c):
+    r, c = viewSquare(r, c)
+    return p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE)
 
 '''
 Animating the moves.
 Animates the movement of a piece from the starting square to the ending square.
 This provides a smoother gameplay experience by making transitions visually clear.
-
+The board without the moving piece is composed once, each frame only restores the background
+under the sprite's last position and blits the sprite at its new one.
 '''
 
-def animateMove(move, screen, board, clock):
-    global colors
-    dR = move.endRow - move.startRow
-    dC = move.endCol - move.startCol
+def animateMove(move, screen, board, clock, boardSurface):
+    startRow, startCol = viewSquare(move.startRow, move.startCol) # screen grid coordinates
+    endRow, endCol = viewSquare(move.endRow, move.endCol)
+    dR = endRow - startRow
+    dC = endCol - startCol
     framesPerSquare = 5 #frames to move one square
     # how many frame the animation will take
     frameCount = (abs(dR) + abs(dC))*framesPerSquare
+
+    background = boardSurface.copy()
+    drawPieces(background, board)
+    #erase the piece moved from its ending square
+    endSquare = squareRect(move.endRow, move.endCol)
+    background.blit(boardSurface, endSquare, endSquare)
+    #draw captured piece onto rectangle
+    if move.pieceCaptured != '--':
+        if move.isEnpassantMove:
+            enPassantRow = move.endRow + 1 if move.pieceCaptured[0] == 'b' else move.endRow - 1
+            endSquare = squareRect(enPassantRow, move.endCol)  # pygame rectangle
+        background.blit(IMAGES[move.pieceCaptured], endSquare)
+    screen.blit(background, (0, 0))
+    p.display.update(background.get_rect())
+
+    sprite = IMAGES[move.pieceMoved]
+    lastRect = None
     for frame in range(frameCount + 1): # generate all the coordinates
-        r, c = (move.startRow + dR*frame/frameCount, move.startCol + dC*frame/frameCount)
-        drawBoard(screen)
-        drawPieces(screen, board)
-        #erase the piece moved from its ending square
-        color = colors[(move.endRow + move.endCol)%2]
-        endSquare = p.Rect(move.endCol*SQ_SIZE, move.endRow*SQ_SIZE, SQ_SIZE, SQ_SIZE)
-        p.draw.rect(screen, color, endSquare)
-        #draw captured piece onto rectangle
-        if move.pieceCaptured != '--':
-            if move.isEnpassantMove:
-                enPassantRow = move.endRow + 1 if move.pieceCaptured[0] == 'b' else move.endRow - 1
-                endSquare = p.Rect(move.endCol * SQ_SIZE, enPassantRow * SQ_SIZE, SQ_SIZE, SQ_SIZE)  # pygame rectangle
-            screen.blit(IMAGES[move.pieceCaptured], endSquare)
+        r, c = (startRow + dR*frame/frameCount, startCol + dC*frame/frameCount)
+        spriteRect = p.Rect(round(c*SQ_SIZE), round(r*SQ_SIZE), SQ_SIZE, SQ_SIZE)
+        dirty = [spriteRect]
+        if lastRect is not None:
+            screen.blit(background, lastRect, lastRect)
+            dirty.append(lastRect)
         #draw moving piece
-        screen.blit(IMAGES[move.pieceMoved], p.Rect(c*SQ_SIZE, r*SQ_SIZE, SQ_SIZE, SQ_SIZE))
-        p.display.flip()
-        clock.tick(60)
+        screen.blit(sprite, spriteRect)
+        p.display.update(dirty)
+        lastRect = spriteRect
+        clock.tick(ANIMATION_FPS)
 '''
 Display text on the screen.
 Draws any overlay or game-ending text on the screen.
 For example, text like "Checkmate" or "Stalemate" is displayed when required.
+Returns the rectangle that was drawn over.
 
 '''
 def drawText(screen, text):
@@ -477,6 +715,9 @@ def drawText(screen, text):
     screen.blit(textObject, textLocation)
     textObject = font.render(text, 0, p.Color("Black"))
     screen.blit(textObject, textLocation.move(1, 1))
+    return textLocation.union(textLocation.move(1, 1))
+
+MODULE_LOADED = time.perf_counter()
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,188 @@
+"""
+Test suite runner: searches every position of an EPD file (e.g. Win At Chess) with a fixed time or node budget
+and checks the move the engine settles on against the position's "bm" (best move) and "am" (avoid move)
+operations. Positions are spread over a process pool, every position starts with an empty transposition table.
+Besides the solved count it reports when each position was solved: the time and nodes of the first iteration
+from which on the engine kept a right move, which shows whether a faster search also finds the moves sooner.
+
+    python -m chess.epdSuite wac.epd --time 1 --workers 4 --json report.json
+    python -m chess.epdSuite wac.epd --nodes 20000
+
+An EPD line is the first four FEN fields followed by operations, e.g.
+    2rr3k/pp3pp1/1nnqbN1p/3pN3/2pP4/2P3Q1/PPB4P/R4RK1 w - - bm Qg6; id "WAC.001";
+"""
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chess import ChessAI
+from chess.chessEngine import GameState
+
+WORKERS = max(1, (os.cpu_count() or 2) - 1) # search processes
+TIME_LIMIT = 1.0 # default seconds per position
+MAX_DEPTH = 20 # iterations stop here if the budget lasts that long
+OPERATION_PATTERN = re.compile(r'([A-Za-z]\w*)((?:\s+(?:"[^"]*"|[^\s;"]+))*)\s*;')
+
+
+'''
+Parses one EPD line.
+
+    Returns:
+        dict: "fen" (a full FEN, the move counters come from the hmvc and fmvn operations or default to 0 1),
+        "operations" mapping every operation to its list of operands (quotes removed), "id" and the line itself.
+        None for an empty line or a comment.
+'''
+def parseEpd(line):
+    line = line.strip()
+    if not line or line.startswith("#"):
+        return None
+    fields = line.split(None, 4)
+    if len(fields) < 4:
+        raise ValueError("EPD needs at least 4 FEN fields: " + line)
+    operations = {}
+    for name, operands in OPERATION_PATTERN.findall(fields[4] if len(fields) > 4 else ""):
+        operations[name] = [operand.strip('"') for operand in re.findall(r'"[^"]*"|[^\s"]+', operands)]
+    fen = " ".join(fields[:4] + [operations.get("hmvc", ["0"])[0], operations.get("fmvn", ["1"])[0]])
+    return {"fen": fen, "operations": operations, "id": " ".join(operations.get("id", [])), "epd": line}
+
+'''
+Reads the positions of an EPD file, numbering the ones without an id.
+'''
+def readSuite(file):
+    positions = []
+    for line in file:
+        position = parseEpd(line)
+        if position is not None:
+            position["id"] = position["id"] or str(len(positions) + 1)
+            positions.append(position)
+    return positions
+
+
+workerState = None # the GameState of a search process
+
+
+'''
+Process pool initializer, every search process keeps one GameState.
+'''
+def initSearchWorker():
+    global workerState
+    workerState = GameState()
+    ChessAI.PRINT_SEARCH_PROGRESS = False
+
+'''
+Runs in a pool process: searches one position within the budget and reports how it went.
+
+    Returns:
+        dict: the position's id, the move found in SAN, whether it is right, the score, depth reached,
+        nodes, seconds, nodes per second, and the seconds and nodes until it was solved (None if it wasn't).
+'''
+def searchJob(position, timeLimit, nodeLimit, depth):
+    gs = workerState if workerState is not None else GameState()
+    gs.loadFen(position["fen"])
+    # parsed as move codes against a list of their own, the moves searched aren't touched and the promotion
+    # piece counts: am e8=N doesn't rule out e8=Q
+    parseMoves = gs.getValidMoves()
+    bestMoves = [gs.parseSan(san, parseMoves).encode() for san in position["operations"].get("bm", [])]
+    avoidMoves = [gs.parseSan(san, parseMoves).encode() for san in position["operations"].get("am", [])]
+    validMoves = gs.getValidMoves()
+    def isRight(move):
+        code = move.encode()
+        return (not bestMoves or code in bestMoves) and code not in avoidMoves
+
+    # the first iteration of the run of right answers that lasts until the end of the search
+    iterations = []
+    solvedAt = [None]
+    def onIteration(iterationDepth, move, score):
+        iterations.append(iterationDepth)
+        if not isRight(move):
+            solvedAt[0] = None
+        elif solvedAt[0] is None:
+            solvedAt[0] = (time.perf_counter() - start, ChessAI.nodes)
+
+    ChessAI.clearSearchState()
+    stopRequested = None if nodeLimit is None else lambda: ChessAI.nodes >= nodeLimit
+    start = time.perf_counter()
+    move, score, pv = ChessAI.searchPosition(gs, validMoves, depth, timeLimit, stopRequested, onIteration)
+    seconds = time.perf_counter() - start
+    solved = move is not None and isRight(move)
+    return {"id": position["id"], "fen": position["fen"],
+            "bm": position["operations"].get("bm", []), "am": position["operations"].get("am", []),
+            "move": gs.getSan(move, validMoves) if move is not None else None, "solved": solved,
+            "score": round(score, 2), "depth": iterations[-1] if iterations else 0, "nodes": ChessAI.nodes,
+            "seconds": round(seconds, 3), "nps": round(ChessAI.nodes / seconds) if seconds else 0,
+            "solvedSeconds": round(solvedAt[0][0], 3) if solved and solvedAt[0] else None,
+            "solvedNodes": solvedAt[0][1] if solved and solvedAt[0] else None}
+
+'''
+Searches every position on a process pool, printing a line per position as it finishes.
+
+    Returns:
+        (list, dict): the result of every position in suite order and the summary: solved count, percentiles of
+        the time and nodes to solution over the solved positions, total nodes, search seconds and nodes per second.
+'''
+def runSuite(positions, timeLimit=TIME_LIMIT, nodeLimit=None, depth=MAX_DEPTH, workers=WORKERS, out=sys.stdout):
+    results = [None] * len(positions)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=initSearchWorker) as executor:
+        futures = {executor.submit(searchJob, position, timeLimit, nodeLimit, depth): i
+                   for i, position in enumerate(positions)}
+        for future in as_completed(futures):
+            result = future.result()
+            results[futures[future]] = result
+            print("%-12s %-6s %-8s bm %-10s am %-10s depth %2d %8d nodes %6.2fs" % (
+                result["id"], "solved" if result["solved"] else "failed", result["move"],
+                " ".join(result["bm"]) or "-", " ".join(result["am"]) or "-", result["depth"],
+                result["nodes"], result["seconds"]), file=out)
+    return results, summarize(results, time.perf_counter() - start)
+
+'''
+Summary of a suite run, see runSuite.
+'''
+def summarize(results, wallSeconds):
+    solved = [result for result in results if result["solved"]]
+    def percentiles(values):
+        values = sorted(value for value in values if value is not None) # None: solved before an iteration ended
+        if not values:
+            return None
+        return {name: values[min(len(values) - 1, int(p * len(values)))]
+                for name, p in (("p25", 0.25), ("p50", 0.5), ("p75", 0.75), ("p90", 0.9), ("max", 1.0))}
+    nodes = sum(result["nodes"] for result in results)
+    seconds = sum(result["seconds"] for result in results)
+    return {"positions": len(results), "solved": len(solved),
+            "solvedSeconds": percentiles([result["solvedSeconds"] for result in solved]),
+            "solvedNodes": percentiles([result["solvedNodes"] for result in solved]),
+            "nodes": nodes, "searchSeconds": round(seconds, 2), "nps": round(nodes / seconds) if seconds else 0,
+            "wallSeconds": round(wallSeconds, 2)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run an EPD test suite against the engine.")
+    parser.add_argument("epd", help="EPD file, - for standard input")
+    parser.add_argument("--time", type=float, default=None, help="seconds per position (default %s)" % TIME_LIMIT)
+    parser.add_argument("--nodes", type=int, default=None, help="nodes per position instead of a time limit")
+    parser.add_argument("--depth", type=int, default=MAX_DEPTH, help="deepest iteration")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--json", help="write the report to this file")
+    args = parser.parse_args()
+
+    timeLimit = args.time if args.time is not None or args.nodes is not None else TIME_LIMIT
+    positions = readSuite(sys.stdin if args.epd == "-" else open(args.epd))
+    results, summary = runSuite(positions, timeLimit, args.nodes, args.depth, args.workers)
+    print("solved %d of %d, %d nodes in %.1fs of search, %d nodes/s, %.1fs wall" % (
+        summary["solved"], summary["positions"], summary["nodes"], summary["searchSeconds"], summary["nps"],
+        summary["wallSeconds"]))
+    if summary["solvedSeconds"]:
+        print("time to solution: " + ", ".join("%s %.2fs" % item for item in summary["solvedSeconds"].items()))
+    if args.json:
+        with open(args.json, "w") as file:
+            json.dump({"suite": args.epd, "timeLimit": timeLimit, "nodeLimit": args.nodes, "depth": args.depth,
+                       "summary": summary, "positions": results}, file, indent=1)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Client for gameServer.py, and a load test built on it: it opens a number of idle games plus some active ones
+that play random moves against the engine, and reports how long the engine replies took.
+
+    python -m chess.gameClient --local --idle 2000 --games 20 --moves 5
+    python -m chess.gameClient --port 8765 --games 20
+
+--local starts a server in the same process on a free port, so nothing else has to be running.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from chess.chessEngine import GameState
+from chess import gameServer
+
+
+class GameClient:
+    """
+        One connection to the server. request() waits for the reply to that request, engine moves are
+        delivered to the queue of their game (see engineMoves).
+    """
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+        self.pending = {}
+        self.gameQueues = {}
+        self.nextId = 1
+        self.listener = None
+
+    async def connect(self, host=gameServer.HOST, port=gameServer.PORT):
+        self.reader, self.writer = await asyncio.open_connection(host, port, limit=gameServer.MAX_LINE)
+        self.listener = asyncio.get_running_loop().create_task(self.listen())
+
+    async def listen(self):
+        while True:
+            line = await self.reader.readline()
+            if not line:
+                break
+            message = json.loads(line)
+            future = self.pending.pop(message.get("id"), None)
+            if future is not None:
+                future.set_result(message)
+            elif "game" in message:
+                self.engineMoves(message["game"]).put_nowait(message)
+        for future in self.pending.values():
+            future.set_exception(ConnectionError("server closed the connection"))
+
+    '''
+    Sends a request and returns the server's reply.
+    '''
+    async def request(self, **message):
+        message["id"] = self.nextId
+        self.nextId += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[message["id"]] = future
+        self.writer.write(json.dumps(message).encode() + b"\n")
+        await self.writer.drain()
+        return await future
+
+    '''
+    Queue of the messages the server pushes for a game on its own, the engine's moves.
+    '''
+    def engineMoves(self, gameId):
+        return self.gameQueues.setdefault(gameId, asyncio.Queue())
+
+    async def close(self):
+        self.writer.close()
+        if self.listener is not None:
+            self.listener.cancel()
+
+
+'''
+Plays random legal moves against the engine and returns how long each engine reply took.
+'''
+async def playGame(client, moves, timeLimit, rng):
+    created = await client.request(op="new", engine="b", timeLimit=timeLimit)
+    gameId = created["game"]
+    gs = GameState(gameServer.SESSION_UNDO_CAPACITY)
+    latencies = []
+    for _ in range(moves):
+        gs.loadFen(created["fen"])
+        validMoves = gs.getValidMoves()
+        if not validMoves:
+            break
+        start = time.perf_counter()
+        reply = await client.request(op="move", game=gameId, move=rng.choice(validMoves).getChessNotation())
+        if reply["op"] == "error":
+            raise RuntimeError(reply["message"])
+        if reply["status"] != "ongoing":
+            break
+        created = await client.engineMoves(gameId).get()
+        latencies.append(time.perf_counter() - start)
+        if created["op"] == "error":
+            raise RuntimeError(created["message"])
+        if created["status"] != "ongoing":
+            break
+    await client.request(op="close", game=gameId)
+    return latencies
+
+
+async def loadTest(args):
+    server = None
+    port = args.port
+    if args.local:
+        server = gameServer.GameServer(args.workers)
+        port = await server.start(args.host, 0)
+    idleClient = GameClient()
+    await idleClient.connect(args.host, port)
+    start = time.perf_counter()
+    for _ in range(args.idle):
+        await idleClient.request(op="new")
+    print("%d idle games opened in %.2fs" % (args.idle, time.perf_counter() - start))
+
+    clients = []
+    for _ in range(args.clients):
+        client = GameClient()
+        await client.connect(args.host, port)
+        clients.append(client)
+    rng = random.Random(args.seed)
+    start = time.perf_counter()
+    results = await asyncio.gather(*[playGame(clients[i % len(clients)], args.moves, args.time,
+                                              random.Random(rng.random())) for i in range(args.games)])
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for game in results for latency in game)
+    if latencies:
+        print("%d engine moves in %.1fs, latency p50 %.2fs p95 %.2fs max %.2fs" % (
+            len(latencies), elapsed, latencies[len(latencies) // 2],
+            latencies[min(len(latencies) - 1, int(0.95 * len(latencies)))], latencies[-1]))
+    print("server:", await idleClient.request(op="stats"))
+    for client in clients + [idleClient]:
+        await client.close()
+    if server is not None:
+        await server.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test for the game server.")
+    parser.add_argument("--host", default=gameServer.HOST)
+    parser.add_argument("--port", type=int, default=gameServer.PORT)
+    parser.add_argument("--local", action="store_true", help="start a server in this process")
+    parser.add_argument("--workers", type=int, default=gameServer.WORKERS, help="search processes with --local")
+    parser.add_argument("--idle", type=int, default=1000, help="games opened and left alone")
+    parser.add_argument("--games", type=int, default=10, help="games playing against the engine")
+    parser.add_argument("--clients", type=int, default=2, help="connections the active games are spread over")
+    parser.add_argument("--moves", type=int, default=5, help="moves per active game")
+    parser.add_argument("--time", type=float, default=0.5, help="engine seconds per move")
+    parser.add_argument("--seed", type=int, default=0)
+    asyncio.run(loadTest(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,390 @@
+"""
+Headless game server. One asyncio process holds many games and talks to clients over a local TCP socket,
+one JSON object per line in each direction. Engine searches run on a bounded process pool: a scheduler hands
+out the pool's slots round-robin over the connected clients, so a client with a thousand games waiting can't
+starve one with a single game, and every search has a time limit, so a move comes back within roughly
+(searches queued ahead / workers + 1) * time limit. Engine moves are pushed to the client when they are ready.
+
+    python -m chess.gameServer --port 8765 --workers 4
+    python -m chess.gameServer --cache analysis.cache      # keep search results on disk, shared by the workers
+
+Requests (an optional "id" is echoed back in the reply):
+    {"op": "new", "engine": "b", "timeLimit": 1.0, "depth": 3, "fen": "..."}   engine plays "w", "b" or nobody
+    {"op": "move", "game": 1, "move": "e4"}                                     SAN or coordinates like e2e4
+    {"op": "undo", "game": 1}                                                   back to the player's last turn
+    {"op": "state", "game": 1}
+    {"op": "close", "game": 1}
+    {"op": "stats"}
+Replies are {"op": "created" | "moved" | "state" | "closed" | "stats" | "error", ...}. An engine move arrives
+as {"op": "moved", "by": "engine", ...} whenever the search is done.
+"""
+import argparse
+import asyncio
+import copy
+import json
+import os
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chess import ChessAI
+from chess.chessEngine import GameState, PROMOTION_PIECES
+
+HOST = "127.0.0.1"
+PORT = 8765
+WORKERS = max(1, (os.cpu_count() or 2) - 1) # search processes
+TIME_LIMIT = 1.0 # default seconds per engine move
+MAX_TIME_LIMIT = 10.0 # clients can't ask for more than this
+SEARCH_DEPTH = 3 # default depth, the time limit stops deeper searches early
+MAX_SEARCH_DEPTH = 8
+MAX_QUEUED_SEARCHES = 1000 # searches waiting for a slot before new ones are turned down
+SESSION_UNDO_CAPACITY = 16 # plies preallocated per game, keeps idle games small
+MAX_LINE = 1 << 16 # longest request line accepted
+LATENCY_SAMPLES = 1000 # engine move latencies kept for the stats
+
+
+class ServerBusy(Exception):
+    pass
+
+
+workerState = None # the GameState of a search process
+
+
+'''
+Process pool initializer, every search process keeps one GameState and its own transposition table.
+With a cacheFile the processes also share a persistent analysis cache, see ChessAI.ANALYSIS_CACHE_FILE.
+'''
+def initSearchWorker(cacheFile=None):
+    global workerState
+    workerState = GameState()
+    ChessAI.PRINT_SEARCH_PROGRESS = False
+    ChessAI.ANALYSIS_CACHE_FILE = cacheFile
+
+'''
+Runs in a pool process: searches the position and returns the chosen move in SAN and its score.
+'''
+def searchJob(fen, depth, timeLimit):
+    gs = workerState if workerState is not None else GameState()
+    gs.loadFen(fen)
+    validMoves = gs.getValidMoves()
+    if not validMoves:
+        return None, 0
+    move, score, pv = ChessAI.searchPosition(gs, validMoves, depth, timeLimit)
+    return gs.getSan(move, validMoves, False), score
+
+
+class Session:
+    """
+        One game: the position, which side the engine plays and its search settings.
+        version changes with every move and undo, an engine result for an older version is dropped.
+    """
+    def __init__(self, gameId, client, engineColor, timeLimit, depth):
+        self.gameId = gameId
+        self.client = client
+        self.engineColor = engineColor
+        self.timeLimit = timeLimit
+        self.depth = depth
+        self.gs = GameState(SESSION_UNDO_CAPACITY)
+        self.version = 0
+        self.searching = False
+
+    def engineToMove(self):
+        return self.engineColor == ("w" if self.gs.whiteToMove else "b")
+
+    def status(self):
+        validMoves = self.gs.getValidMoves()
+        if validMoves:
+            return "ongoing"
+        return "checkmate" if self.gs.inCheck else "stalemate"
+
+    def describe(self):
+        return {"game": self.gameId, "fen": self.gs.getFen(), "toMove": "w" if self.gs.whiteToMove else "b",
+                "status": self.status(), "engine": self.engineColor, "searching": self.searching}
+
+
+class SearchScheduler:
+    """
+        Fair queue in front of the process pool. Every client has its own FIFO of waiting searches and the
+        pool's slots go to the clients in turn. At most `workers` searches are in the pool at once, so the
+        order is decided here and not by the pool's own FIFO.
+    """
+    def __init__(self, workers, maxQueued, cacheFile=None):
+        self.executor = ProcessPoolExecutor(max_workers=workers, initializer=initSearchWorker, initargs=(cacheFile,))
+        self.slots = asyncio.Semaphore(workers)
+        self.queues = OrderedDict() # client -> deque of (session, version, queued at)
+        self.queued = 0
+        self.maxQueued = maxQueued
+        self.running = 0
+        self.wakeup = asyncio.Event()
+        self.latencies = deque(maxlen=LATENCY_SAMPLES)
+        self.task = None
+
+    def start(self, onResult):
+        self.onResult = onResult
+        self.task = asyncio.get_running_loop().create_task(self.dispatch())
+
+    def submit(self, session):
+        if self.queued >= self.maxQueued:
+            raise ServerBusy("too many searches queued, try again later")
+        self.queues.setdefault(session.client, deque()).append((session, session.version, time.perf_counter()))
+        self.queued += 1
+        session.searching = True
+        self.wakeup.set()
+
+    '''
+    Drops the waiting searches of a client that went away.
+    '''
+    def forget(self, client):
+        queue = self.queues.pop(client, None)
+        if queue:
+            self.queued -= len(queue)
+
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self.slots.acquire()
+            while not self.queued:
+                self.wakeup.clear()
+                await self.wakeup.wait()
+            client, queue = next(iter(self.queues.items()))
+            job = queue.popleft()
+            self.queued -= 1
+            del self.queues[client]
+            if queue:
+                self.queues[client] = queue # to the back of the line, the other clients go first
+            session, version, queuedAt = job
+            if session.version != version:
+                self.slots.release()
+                continue # the game was undone or closed while the search waited
+            future = loop.run_in_executor(self.executor, searchJob, session.gs.getFen(), session.depth,
+                                          session.timeLimit)
+            self.running += 1
+            loop.create_task(self.finish(future, session, version, queuedAt))
+
+    async def finish(self, future, session, version, queuedAt):
+        try:
+            san, score = await future
+        except Exception as error: # a crashed search must not take the slot with it
+            san, score = None, str(error)
+        finally:
+            self.running -= 1
+            self.slots.release()
+        self.latencies.append(time.perf_counter() - queuedAt)
+        await self.onResult(session, version, san, score)
+
+    def stats(self):
+        latencies = sorted(self.latencies)
+        def percentile(p):
+            return round(latencies[min(len(latencies) - 1, int(p * len(latencies)))], 3) if latencies else None
+        return {"queued": self.queued, "running": self.running, "latencyP50": percentile(0.5),
+                "latencyP95": percentile(0.95), "latencyMax": percentile(1.0)}
+
+    def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class GameServer:
+    """
+        Holds the games of all connected clients and answers their requests.
+    """
+    def __init__(self, workers=WORKERS, maxQueued=MAX_QUEUED_SEARCHES, cacheFile=None):
+        self.workers = workers
+        self.maxQueued = maxQueued
+        self.cacheFile = cacheFile
+        self.sessions = {}
+        self.nextGameId = 1
+        self.scheduler = None
+        self.server = None
+        self.clientTasks = set()
+
+    async def start(self, host=HOST, port=PORT):
+        self.scheduler = SearchScheduler(self.workers, self.maxQueued, self.cacheFile)
+        self.scheduler.start(self.engineMoved)
+        self.server = await asyncio.start_server(self.handleClient, host, port, limit=MAX_LINE)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        for task in self.clientTasks:
+            task.cancel()
+        await asyncio.gather(*self.clientTasks, return_exceptions=True)
+        if self.scheduler is not None:
+            self.scheduler.close()
+
+    async def handleClient(self, reader, writer):
+        client = writer
+        task = asyncio.current_task()
+        self.clientTasks.add(task)
+        try:
+            while True:
+                try:
+                    line = await reader.readline()
+                except (ValueError, asyncio.LimitOverrunError):
+                    self.send(client, {"op": "error", "message": "request too long"})
+                    break
+                if not line:
+                    break
+                request = None
+                try:
+                    request = json.loads(line)
+                    if not isinstance(request, dict):
+                        raise ValueError("request must be a JSON object")
+                    reply = self.handleRequest(client, request)
+                except (ValueError, KeyError, TypeError, ServerBusy) as error:
+                    reply = {"op": "error", "message": str(error)}
+                    if isinstance(request, dict) and "game" in request:
+                        reply["game"] = request["game"]
+                if isinstance(request, dict) and "id" in request:
+                    reply["id"] = request["id"]
+                self.send(client, reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.CancelledError):
+            pass # cancelled by close(), ending normally keeps asyncio from reporting the handler as failed
+        finally:
+            self.scheduler.forget(client)
+            for gameId in [gameId for gameId, session in self.sessions.items() if session.client is client]:
+                del self.sessions[gameId]
+            self.clientTasks.discard(task)
+            writer.close()
+
+    def send(self, client, message):
+        if not client.is_closing():
+            client.write(json.dumps(message).encode() + b"\n")
+
+    def handleRequest(self, client, request):
+        op = request.get("op")
+        if op == "new":
+            return self.newGame(client, request)
+        if op == "stats":
+            return dict(self.scheduler.stats(), op="stats", games=len(self.sessions), workers=self.workers)
+        if op not in ("move", "undo", "state", "close"):
+            raise ValueError("unknown op " + str(op))
+        session = self.sessions.get(request.get("game"))
+        if session is None or session.client is not client:
+            raise ValueError("no such game")
+        if op == "move":
+            return self.playerMove(session, str(request["move"]))
+        if op == "undo":
+            return self.undo(session)
+        if op == "state":
+            return dict(session.describe(), op="state")
+        del self.sessions[session.gameId] # close
+        session.version += 1
+        return {"op": "closed", "game": session.gameId}
+
+    def newGame(self, client, request):
+        engineColor = request.get("engine")
+        if engineColor not in ("w", "b", None):
+            raise ValueError("engine must be w, b or null")
+        timeLimit = float(request.get("timeLimit", TIME_LIMIT))
+        if not 0 < timeLimit <= MAX_TIME_LIMIT: # also false for nan
+            raise ValueError("timeLimit must be more than 0 and at most %s" % MAX_TIME_LIMIT)
+        depth = max(1, min(int(request.get("depth", SEARCH_DEPTH)), MAX_SEARCH_DEPTH))
+        session = Session(self.nextGameId, client, engineColor, timeLimit, depth)
+        if "fen" in request:
+            session.gs.loadFen(request["fen"])
+        if session.engineToMove() and session.status() == "ongoing":
+            self.scheduler.submit(session)
+        self.sessions[session.gameId] = session
+        self.nextGameId += 1
+        return dict(session.describe(), op="created")
+
+    def playerMove(self, session, text):
+        if session.searching or session.engineToMove():
+            raise ValueError("not your turn")
+        gs = session.gs
+        validMoves = gs.getValidMoves()
+        move = findMove(gs, validMoves, text)
+        san = gs.getSan(move, validMoves)
+        gs.makeMove(move)
+        session.version += 1
+        reply = dict(session.describe(), op="moved", by="player", move=san)
+        if session.engineToMove() and reply["status"] == "ongoing":
+            self.scheduler.submit(session)
+            reply["searching"] = True
+        return reply
+
+    def undo(self, session):
+        gs = session.gs
+        if not gs.moveLog:
+            raise ValueError("nothing to undo")
+        gs.undoMove()
+        while gs.moveLog and session.engineToMove():
+            gs.undoMove() # also take back the engine's reply, it's the player's turn again
+        session.version += 1
+        session.searching = False # a running search is for the old position, its result gets dropped
+        if session.engineToMove() and session.status() == "ongoing":
+            self.scheduler.submit(session) # undone back to a position where the engine is to move
+        return dict(session.describe(), op="state")
+
+    async def engineMoved(self, session, version, san, score):
+        if session.version != version or self.sessions.get(session.gameId) is not session:
+            return # the game was changed or closed while the engine was thinking
+        session.searching = False
+        if san is None:
+            self.send(session.client, {"op": "error", "game": session.gameId,
+                                       "message": "search failed: " + str(score)})
+            return
+        gs = session.gs
+        validMoves = gs.getValidMoves()
+        move = gs.parseSan(san, validMoves)
+        san = gs.getSan(move, validMoves)
+        gs.makeMove(move)
+        session.version += 1
+        self.send(session.client, dict(session.describe(), op="moved", by="engine", move=san,
+                                                   score=round(score, 2)))
+        try:
+            await session.client.drain()
+        except ConnectionError:
+            pass
+
+'''
+Finds a legal move given in SAN or in coordinates (e2e4, e7e8q).
+A promotion is returned as a copy with its promotionChoice set, the Moves in validMoves stay as they are.
+Raises ValueError for a promotion letter other than q, r, b or n, or one on a move that doesn't promote.
+'''
+def findMove(gs, validMoves, text):
+    if len(text) in (4, 5) and text[0] in "abcdefgh" and text[1].isdigit() and text[2] in "abcdefgh":
+        promotion = text[4:].upper()
+        if promotion and promotion not in PROMOTION_PIECES:
+            raise ValueError("unknown promotion piece %s in %s, use q, r, b or n" % (text[4:], text))
+        for move in validMoves:
+            if move.getChessNotation() == text[:4]:
+                if move.isPawnPromotion:
+                    move = copy.copy(move)
+                    move.promotionChoice = promotion or "Q"
+                elif promotion:
+                    raise ValueError(text[:4] + " doesn't promote")
+                return move
+    return gs.parseSan(text, validMoves)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve many chess games over a local socket.")
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--workers", type=int, default=WORKERS, help="engine search processes")
+    parser.add_argument("--cache", default=None, help="persistent analysis cache file shared by the searches")
+    args = parser.parse_args()
+
+    async def serve():
+        server = GameServer(args.workers, cacheFile=args.cache)
+        port = await server.start(args.host, args.port)
+        print("serving on %s:%d with %d search processes" % (args.host, port, args.workers))
+        try:
+            await server.server.serve_forever()
+        finally:
+            await server.close()
+
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
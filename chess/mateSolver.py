@@ -0,0 +1,247 @@
+"""
+Mate solver for puzzles: proves that the side to move can force mate, and finds the forcing line, far deeper
+than the AI's full width search gets. It is a depth-first proof-number search (df-pn): the attacker only ever
+tries checks, the defender tries every reply, and the search always works on the line that looks closest to
+being proven (few defender replies) or refuted, so long forced mates take thousands of nodes, not millions.
+
+Every position has a proof number phi and a disproof number delta from the point of view of its side to move:
+roughly how many positions still have to be solved to show that it reaches its goal (phi) or that it doesn't
+(delta). The attacker's goal is to mate within the move limit, the defender's to escape. phi 0 means solved
+as a success, delta 0 as a failure. Positions are keyed by their Zobrist hash in a fixed size table, a new
+position replaces whatever shared its slot, so memory stays bounded however long the search runs.
+The move generator only promotes to a queen, mates that need an underpromotion aren't found.
+
+    python -m chess.mateSolver --fen "r5k1/6pp/8/3Q2N1/8/8/8/6K1 w - - 0 1" --moves 5
+"""
+import argparse
+import time
+from chess.chessEngine import GameState, MAX_MOVES
+
+MATE = "mate" # solve results
+NO_MATE = "no mate"
+UNKNOWN = "unknown" # node or time limit reached first
+
+INFINITE = 1 << 40 # proof and disproof number of a solved position
+TABLE_SIZE = 1 << 18 # entries, must be a power of two
+MAX_MATE_MOVES = 30 # the deepest mate, in moves, the ply buffers below are sized for
+STOP_CHECK_INTERVAL = 256 # nodes between looks at the clock
+
+"""
+Search state. A table entry is (hash, plies left, phi, delta, plies to mate). A solved entry is reused with a
+different number of plies left when it still holds: a mate found with fewer plies left, a refutation found
+with more. nodes counts the positions expanded by the current solve.
+"""
+table = [None] * TABLE_SIZE
+moveBuffers = [[0] * MAX_MOVES for _ in range(2 * MAX_MATE_MOVES + 1)]
+path = set() # hashes of the positions on the current line, a repetition counts as an escape
+nodes = 0
+nodeLimit = None
+deadline = None
+searchStopped = False
+
+
+'''
+Tries to prove that the side to move can force mate.
+
+    Parameters:
+        gs (GameState): the position, it is back where it was afterwards.
+        maxMoves (int): longest mate looked for, in moves of the side to move (mate in maxMoves or less).
+        maxNodes (int): positions to expand at most, None for no limit.
+        timeLimit (float): seconds at most, None for no limit.
+
+    Returns:
+        (str, list, int): MATE, NO_MATE or UNKNOWN, the forcing line as Move objects (attacker moves and the
+        defender's longest resistance, ending in mate) when it is MATE, and the number of positions expanded.
+'''
+def solveMate(gs, maxMoves, maxNodes=None, timeLimit=None):
+    global nodes, nodeLimit, deadline, searchStopped
+    if not 0 < maxMoves <= MAX_MATE_MOVES:
+        raise ValueError("maxMoves must be between 1 and " + str(MAX_MATE_MOVES))
+    nodes = 0
+    nodeLimit = maxNodes
+    deadline = None if timeLimit is None else time.perf_counter() + timeLimit
+    searchStopped = False
+    path.clear()
+    plies = 2 * maxMoves - 1
+    inCheck = gs.inCheck
+    searchNode(gs, INFINITE, INFINITE, plies, True, 0)
+    phi, delta, _ = lookUp(gs.hash, plies, True)
+    result, line = UNKNOWN, []
+    if phi == 0:
+        result, line = MATE, forcingLine(gs, plies)
+    elif delta == 0:
+        result = NO_MATE
+    gs.inCheck = inCheck
+    return result, line, nodes
+
+'''
+Forgets every solved position, e.g. to time solves from scratch.
+'''
+def clearTable():
+    for i in range(TABLE_SIZE):
+        table[i] = None
+
+'''
+Expands the current position and keeps working on its most promising child until the position's phi reaches
+thresholdPhi or its delta reaches thresholdDelta, then stores both in the table.
+attacker says whose turn it is, plies how many plies are left to mate in.
+'''
+def searchNode(gs, thresholdPhi, thresholdDelta, plies, attacker, ply):
+    global nodes, searchStopped
+    nodes += 1
+    if nodes % STOP_CHECK_INTERVAL == 0 and ((nodeLimit is not None and nodes >= nodeLimit) or
+                                             (deadline is not None and time.perf_counter() >= deadline)):
+        searchStopped = True
+    key = gs.hash
+    moves = moveBuffers[ply]
+    count = gs.fillValidMoves(moves)
+    if count == 0 or plies == 0:
+        # the side to move fails, unless it is the defender and isn't mated: stalemate or out of plies
+        if attacker or (count == 0 and gs.inCheck):
+            store(key, plies, INFINITE, 0, 0)
+        else:
+            store(key, plies, 0, INFINITE, 0)
+        return
+
+    # children as (move code, hash), the attacker's checks only
+    children = []
+    for i in range(count):
+        move = moves[i]
+        gs.makeMoveCode(move)
+        if not attacker or gs.kingInCheck():
+            children.append((move, gs.hash))
+        gs.undoMoveCode(move)
+    if not children:
+        store(key, plies, INFINITE, 0, 0) # no check left to give
+        return
+
+    path.add(key)
+    while True:
+        phi, delta, length, best, bestPhi, secondDelta = combineChildren(children, plies - 1, not attacker)
+        if phi >= thresholdPhi or delta >= thresholdDelta or searchStopped:
+            break
+        move = children[best][0]
+        gs.makeMoveCode(move)
+        searchNode(gs, min(INFINITE, thresholdDelta + bestPhi - delta), min(thresholdPhi, secondDelta + 1),
+                   plies - 1, not attacker, ply + 1)
+        gs.undoMoveCode(move)
+    path.discard(key)
+    store(key, plies, phi, delta, length)
+
+'''
+phi and delta of a position from its children's: the side to move succeeds if one child fails for the
+opponent (phi is the smallest child delta) and fails if every child succeeds (delta is the sum of the child phis).
+
+    Returns:
+        (int, int, int, int, int, int): phi, delta, plies to mate once solved as a mate (the quickest
+        mate for the attacker, the longest resistance for the defender), the index of the child to work on,
+        its phi and the second smallest child delta.
+'''
+def combineChildren(children, plies, childAttacker):
+    phi = INFINITE
+    secondDelta = INFINITE
+    delta = 0
+    best = 0
+    bestPhi = 0
+    quickest = INFINITE
+    longest = 0
+    for i, (move, key) in enumerate(children):
+        childPhi, childDelta, length = lookUp(key, plies, childAttacker)
+        if childDelta < phi:
+            secondDelta = phi
+            phi = childDelta
+            best = i
+            bestPhi = childPhi
+        elif childDelta < secondDelta:
+            secondDelta = childDelta
+        delta = min(INFINITE, delta + childPhi)
+        if childDelta == 0:
+            quickest = min(quickest, length + 1)
+        if childPhi == 0:
+            longest = max(longest, length + 1)
+    return phi, delta, quickest if phi == 0 else longest, best, bestPhi, secondDelta
+
+'''
+phi, delta and plies to mate of a position with plies left, (1, 1, 0) for a position that isn't in the table.
+'''
+def lookUp(key, plies, attacker):
+    if key in path:
+        return (INFINITE, 0, 0) if attacker else (0, INFINITE, 0) # going round in circles mates nobody
+    entry = table[key & (TABLE_SIZE - 1)]
+    if entry is None or entry[0] != key:
+        return 1, 1, 0
+    entryPlies, phi, delta = entry[1], entry[2], entry[3]
+    mated = phi == 0 if attacker else delta == 0 # solved as a mate for the attacker
+    escaped = delta == 0 if attacker else phi == 0
+    if entryPlies == plies or (mated and entryPlies < plies) or (escaped and entryPlies > plies):
+        return phi, delta, entry[4]
+    return 1, 1, 0
+
+'''
+Stores a position's numbers, replacing whatever was in its slot.
+'''
+def store(key, plies, phi, delta, length):
+    table[key & (TABLE_SIZE - 1)] = (key, plies, phi, delta, length)
+
+'''
+Follows a solved mate through the table: the attacker's quickest mating move, the defender's longest reply.
+Stops early if a position on the way was replaced in the table meanwhile.
+'''
+def forcingLine(gs, plies):
+    line = []
+    attacker = True
+    while plies > 0:
+        moves = moveBuffers[len(line)]
+        count = gs.fillValidMoves(moves)
+        best = None
+        bestLength = 0
+        for i in range(count):
+            move = moves[i]
+            gs.makeMoveCode(move)
+            givesCheck = gs.kingInCheck()
+            phi, delta, length = lookUp(gs.hash, plies - 1, not attacker)
+            gs.undoMoveCode(move)
+            if attacker and givesCheck and delta == 0 and (best is None or length < bestLength):
+                best, bestLength = move, length
+            elif not attacker and phi == 0 and (best is None or length > bestLength):
+                best, bestLength = move, length
+        if best is None:
+            break
+        line.append(gs.decodeMove(best))
+        gs.makeMoveCode(best)
+        plies -= 1
+        attacker = not attacker
+    for move in reversed(line):
+        gs.undoMoveCode(move.encode())
+    return line
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find a forced mate for the side to move.")
+    parser.add_argument("--fen", required=True)
+    parser.add_argument("--moves", type=int, default=5, help="longest mate to look for, in moves")
+    parser.add_argument("--nodes", type=int, default=None, help="positions to expand at most")
+    parser.add_argument("--time", type=float, default=None, help="seconds at most")
+    args = parser.parse_args()
+
+    gs = GameState()
+    gs.loadFen(args.fen)
+    gs.getValidMoves()
+    start = time.perf_counter()
+    result, line, expanded = solveMate(gs, args.moves, args.nodes, args.time)
+    seconds = time.perf_counter() - start
+    sans = []
+    for move in line:
+        sans.append(gs.getSan(move))
+        gs.makeMove(move)
+    for _ in line:
+        gs.undoMove()
+    if result == MATE:
+        print("mate in %d: %s" % ((len(line) + 1) // 2, " ".join(sans)))
+    else:
+        print(result)
+    print("%d nodes, %.3fs, %.0f nodes/s" % (expanded, seconds, expanded / seconds if seconds else 0))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Perft, the number of leaf nodes of the move tree to a fixed depth, for each move generator, and how many objects
+each one allocates per node.
+getValidMoves builds a list of new Move objects at every node (every Move builds two tuples for its squares on
+top), fillValidMoves writes move codes into buffers allocated once. Allocations are counted as Move objects
+created and as garbage collector runs, the collector runs whenever enough allocated objects pile up.
+
+    python -m chess.perft --depth 4
+    python -m chess.perft --fen "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1" --depth 3 --search 4
+"""
+import argparse
+import gc
+import time
+from chess import ChessAI, chessEngine
+from chess.chessEngine import GameState, MAX_MOVES
+
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+
+
+class CountingMove(chessEngine.Move):
+    """
+        Move that counts how many times it was created, swapped in for Move while allocations are measured.
+    """
+    created = 0
+
+    def __init__(self, *args, **kwargs):
+        CountingMove.created += 1
+        super().__init__(*args, **kwargs)
+
+
+'''
+Perft with getValidMoves, makeMove and undoMove, the way the GUI uses the engine.
+'''
+def perftMoves(gs, depth):
+    if depth == 0:
+        return 1
+    nodes = 0
+    for move in gs.getValidMoves():
+        gs.makeMove(move)
+        nodes += perftMoves(gs, depth - 1)
+        gs.undoMove()
+    return nodes
+
+'''
+Perft with fillValidMoves into one buffer per ply, the way the search uses the engine.
+'''
+def perftCodes(gs, depth, buffers=None, ply=0):
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [[0] * MAX_MOVES for _ in range(depth)]
+    moves = buffers[ply]
+    nodes = 0
+    for i in range(gs.fillValidMoves(moves)):
+        gs.makeMoveCode(moves[i])
+        nodes += perftCodes(gs, depth - 1, buffers, ply + 1)
+        gs.undoMoveCode(moves[i])
+    return nodes
+
+'''
+Perft with fillPseudoLegalMoves and a leavesKingInCheck test per move, the way the search's nodes work.
+'''
+def perftPseudoLegal(gs, depth, buffers=None, ply=0):
+    if depth == 0:
+        return 1
+    if buffers is None:
+        buffers = [[0] * MAX_MOVES for _ in range(depth)]
+    moves = buffers[ply]
+    inCheck = gs.inCheck = gs.kingInCheck()
+    nodes = 0
+    for i in range(gs.fillPseudoLegalMoves(moves)):
+        gs.makeMoveCode(moves[i])
+        if not gs.leavesKingInCheck(moves[i], inCheck):
+            nodes += perftPseudoLegal(gs, depth - 1, buffers, ply + 1)
+        gs.undoMoveCode(moves[i])
+    return nodes
+
+'''
+Runs function(*args) counting the Move objects created and the garbage collector runs meanwhile.
+
+    Returns:
+        (result, int, int, float): what function returned, Move objects created, collector runs and seconds.
+'''
+def countAllocations(function, *args):
+    collections = [0]
+    def onCollect(phase, info):
+        if phase == "start":
+            collections[0] += 1
+    gc.collect()
+    chessEngine.Move = CountingMove
+    CountingMove.created = 0
+    gc.callbacks.append(onCollect)
+    start = time.perf_counter()
+    try:
+        result = function(*args)
+    finally:
+        seconds = time.perf_counter() - start
+        gc.callbacks.remove(onCollect)
+        chessEngine.Move = CountingMove.__bases__[0]
+    return result, CountingMove.created, collections[0], seconds
+
+'''
+Prints one line of measurements, per node where that makes sense.
+'''
+def report(name, nodes, created, collections, seconds):
+    print("%-22s %10d nodes %7.2fs %9.0f nodes/s %8.2f Move objects/node %7.2f gc runs/1000 nodes" % (
+        name, nodes, seconds, nodes / seconds if seconds else 0, created / max(1, nodes),
+        1000 * collections / max(1, nodes)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perft and allocations per node of the move generators.")
+    parser.add_argument("--fen", default=START_FEN)
+    parser.add_argument("--depth", type=int, default=3, help="perft depth")
+    parser.add_argument("--search", type=int, default=0, help="also measure a search to this depth")
+    args = parser.parse_args()
+
+    gs = GameState()
+    gs.loadFen(args.fen)
+    for name, perft in (("getValidMoves", perftMoves), ("fillValidMoves", perftCodes),
+                        ("pseudo legal", perftPseudoLegal)):
+        nodes, created, collections, seconds = countAllocations(perft, gs, args.depth)
+        report(name + " perft %d" % args.depth, nodes, created, collections, seconds)
+    if args.search:
+        ChessAI.PRINT_SEARCH_PROGRESS = False
+        ChessAI.clearSearchState()
+        _, created, collections, seconds = countAllocations(ChessAI.searchPosition, gs, gs.getValidMoves(),
+                                                            args.search)
+        report("search depth %d" % args.search, ChessAI.nodes, created, collections, seconds)
+
+
+if __name__ == "__main__":
+    main()
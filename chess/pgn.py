@@ -0,0 +1,115 @@
+"""
+Reading and writing games in PGN.
+Only the main line is kept: comments, NAGs and variations in the input are skipped.
+Moves are returned as SAN strings, GameState.parseSan turns them into moves.
+"""
+import re
+
+HEADER_PATTERN = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]')
+TOKEN_PATTERN = re.compile(r'\{[^}]*\}?|;[^\n]*|\(|\)|\$\d+|\d+\.+|1-0|0-1|1/2-1/2|\*|[^\s{}();$]+')
+RESULTS = ("1-0", "0-1", "1/2-1/2", "*")
+STANDARD_HEADERS = ["Event", "Site", "Date", "Round", "White", "Black", "Result"] # the seven tag roster, in order
+LINE_WIDTH = 79
+
+'''
+Reads the games in PGN text.
+
+    Parameters:
+        lines (iterable): lines of PGN, e.g. an open file, so big collections are read one game at a time.
+
+    Returns:
+        generator: (headers, moves) per game, headers a dict of the tag pairs (Result is always set)
+        and moves the SAN strings of the main line.
+'''
+def readGames(lines):
+    headers = {}
+    movetext = []
+    inComment = False
+    for line in lines:
+        stripped = line.strip()
+        if not inComment and stripped.startswith("["):
+            if movetext:
+                yield parseGame(headers, movetext)
+                headers, movetext = {}, []
+            match = HEADER_PATTERN.match(stripped)
+            if match:
+                headers[match.group(1)] = match.group(2).replace('\\"', '"').replace("\\\\", "\\")
+        elif stripped and not stripped.startswith("%"):
+            movetext.append(line)
+            # a comment can run over several lines, a [ inside it doesn't start a new game
+            inComment = stripped.rfind("{") > stripped.rfind("}") or (inComment and "}" not in stripped)
+    if headers or movetext:
+        yield parseGame(headers, movetext)
+
+'''
+Picks the main line moves and the result out of a game's movetext.
+'''
+def parseGame(headers, movetext):
+    moves = []
+    depth = 0 # nesting of variations
+    result = None
+    for token in TOKEN_PATTERN.findall("".join(movetext)):
+        if token == "(":
+            depth += 1
+        elif token == ")":
+            depth = max(0, depth - 1)
+        elif depth > 0 or token[0] in "{;$" or token[0].isdigit() and token.endswith("."):
+            continue
+        elif token in RESULTS:
+            result = token
+        else:
+            moves.append(token.rstrip("!?"))
+    headers.setdefault("Result", result or "*")
+    return headers, moves
+
+'''
+Writes one game as PGN.
+
+    Parameters:
+        headers (dict): tag pairs, the seven tag roster is written first and filled in with "?" where missing.
+        moves (list): SAN strings of the main line.
+        comments (list): optional text per ply, written as {comment} after the move. None or "" for no comment.
+        nags (list): optional numeric annotation glyph per ply (e.g. 2 for "?", 4 for "??"), None for none.
+        firstPly (int): 0 if the game starts with a white move, 1 if it starts with black to move.
+
+    Returns:
+        str: the game, ending with a blank line.
+'''
+def writeGame(headers, moves, comments=None, nags=None, firstPly=0):
+    lines = []
+    for name in STANDARD_HEADERS:
+        lines.append('[%s "%s"]' % (name, escape(headers.get(name, "?" if name != "Result" else "*"))))
+    for name, value in headers.items():
+        if name not in STANDARD_HEADERS:
+            lines.append('[%s "%s"]' % (name, escape(value)))
+    lines.append("")
+
+    tokens = []
+    for i, san in enumerate(moves):
+        ply = firstPly + i
+        if ply % 2 == 0:
+            tokens.append("%d." % (ply // 2 + 1))
+        elif i == 0 or (comments and comments[i - 1]):
+            tokens.append("%d..." % (ply // 2 + 1)) # black move after a comment repeats the move number
+        tokens.append(san)
+        if nags and nags[i]:
+            tokens.append("$%d" % nags[i])
+        if comments and comments[i]:
+            tokens.append("{" + comments[i].replace("}", ")") + "}")
+    tokens.append(headers.get("Result", "*"))
+
+    line = ""
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > LINE_WIDTH:
+            lines.append(line)
+            line = token
+        else:
+            line = line + " " + token if line else token
+    lines.append(line)
+    return "\n".join(lines) + "\n\n"
+
+'''
+Escapes a tag value for writing.
+'''
+def escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"')
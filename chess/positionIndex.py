@@ -0,0 +1,301 @@
+"""
+Position index over game collections: which games of an archive reached a position, at which ply, and what was
+played next with how it turned out. Every game is replayed and the Zobrist hash of each position it passes
+through is stored in an SQLite database, looking a position up is then an index seek on its hash.
+
+Games are replayed in worker processes. The main process cuts the PGN files into batches of games, the workers
+parse and replay them with parseSanCode and makeMoveCode, and the main process, the only writer, numbers the
+games in file order and stores them. After every file the continuation statistics (position, move, games,
+white wins, draws, black wins) are brought up to date from the games just added, so queries don't aggregate.
+A move that can't be read ends its game, the positions up to it stay in the index.
+
+    python -m chess.positionIndex games.db --add archive.pgn more.pgn --workers 4
+    python -m chess.positionIndex games.db --moves "e4 c5 Nf3 d6"
+    python -m chess.positionIndex games.db --fen "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3"
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from chess import pgn
+from chess.chessEngine import GameState
+
+WORKERS = max(1, (os.cpu_count() or 2) - 1) # replay processes
+BATCH_GAMES = 200 # games per job sent to a replay process
+START_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+GAME_HEADERS = ("Event", "Site", "Date", "Round", "White", "Black", "Result", "FEN") # kept per game
+QUERY_LIMIT = 50 # games listed by a query
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS games (
+    id INTEGER PRIMARY KEY, event TEXT, site TEXT, date TEXT, round TEXT, white TEXT, black TEXT, result TEXT,
+    fen TEXT, plies INTEGER);
+CREATE TABLE IF NOT EXISTS positions (hash INTEGER, game INTEGER, ply INTEGER, move INTEGER);
+CREATE TABLE IF NOT EXISTS continuations (
+    hash INTEGER, move INTEGER, games INTEGER, whiteWins INTEGER, draws INTEGER, blackWins INTEGER,
+    PRIMARY KEY (hash, move)) WITHOUT ROWID;
+"""
+"""
+positions has a row per position of every game: the hash, the game, the ply (0 is the start position) and the
+code of the move played from it, NULL after the last move. SQLite integers are signed, hashes are stored as
+signed 64-bit values. Its index is created after the first load, building it once is faster than keeping it
+sorted during a bulk insert.
+"""
+POSITIONS_INDEX = "CREATE INDEX IF NOT EXISTS positionsByHash ON positions (hash, game, ply)"
+ADD_CONTINUATIONS = """
+INSERT INTO continuations (hash, move, games, whiteWins, draws, blackWins)
+SELECT p.hash, p.move, count(*), sum(g.result = '1-0'), sum(g.result = '1/2-1/2'), sum(g.result = '0-1')
+FROM (SELECT DISTINCT hash, move, game FROM positions WHERE rowid > ? AND move IS NOT NULL) AS p
+JOIN games AS g ON g.id = p.game
+WHERE true
+GROUP BY p.hash, p.move
+ON CONFLICT (hash, move) DO UPDATE SET games = games + excluded.games, whiteWins = whiteWins + excluded.whiteWins,
+    draws = draws + excluded.draws, blackWins = blackWins + excluded.blackWins
+"""
+
+
+class PositionIndex:
+    """
+        The index in the SQLite database at path, created if it doesn't exist.
+    """
+    def __init__(self, path):
+        self.path = path
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("PRAGMA journal_mode = WAL")
+        self.connection.execute("PRAGMA synchronous = NORMAL")
+        self.connection.executescript(SCHEMA)
+
+    """
+        Indexes the games of a PGN file.
+
+            Parameters:
+                lines (iterable): the file's lines.
+                workers (int): replay processes, 1 replays in this process.
+                source (str): shown with the progress, e.g. the file name.
+                out: where progress goes, None for nowhere.
+
+            Returns:
+                (int, int, int): games added, positions added and games cut short by a move that couldn't be read.
+    """
+    def addGames(self, lines, workers=WORKERS, source="", out=None):
+        connection = self.connection
+        connection.execute("PRAGMA synchronous = OFF") # a crash during a load means loading the file again
+        firstRow = connection.execute("SELECT coalesce(max(rowid), 0) FROM positions").fetchone()[0]
+        gameId = connection.execute("SELECT coalesce(max(id), 0) FROM games").fetchone()[0]
+        games = positions = cutShort = 0
+        start = time.perf_counter()
+        with connection:
+            for batch in replayBatches(splitGames(lines, BATCH_GAMES), workers):
+                gameRows = []
+                positionRows = []
+                for headers, keys, moves, complete in batch:
+                    gameId += 1
+                    gameRows.append((gameId,) + headers + (len(moves),))
+                    for ply, key in enumerate(keys):
+                        positionRows.append((key, gameId, ply, moves[ply] if ply < len(moves) else None))
+                    cutShort += not complete
+                connection.executemany("INSERT INTO games VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", gameRows)
+                connection.executemany("INSERT INTO positions VALUES (?, ?, ?, ?)", positionRows)
+                games += len(gameRows)
+                positions += len(positionRows)
+                if out is not None:
+                    seconds = time.perf_counter() - start
+                    print("\r%s: %d games, %d positions, %.0f games/s" % (
+                        source, games, positions, games / seconds if seconds else 0), end="", file=out)
+            connection.execute(POSITIONS_INDEX)
+            connection.execute(ADD_CONTINUATIONS, (firstRow,))
+        connection.execute("PRAGMA synchronous = NORMAL")
+        if out is not None:
+            print(file=out)
+        return games, positions, cutShort
+
+    """
+        The games that reached the position with hash key, as (game id, first ply it was reached at),
+        by game id, at most limit of them.
+    """
+    def findGames(self, key, limit=QUERY_LIMIT):
+        return self.connection.execute(
+            "SELECT game, min(ply) FROM positions WHERE hash = ? GROUP BY game ORDER BY game LIMIT ?",
+            (signedKey(key), limit)).fetchall()
+
+    """
+        How many games reached the position with hash key.
+    """
+    def countGames(self, key):
+        return self.connection.execute("SELECT count(DISTINCT game) FROM positions WHERE hash = ?",
+                                       (signedKey(key),)).fetchone()[0]
+
+    """
+        What was played from the position with hash key, most played first, as
+        (move code, games, white wins, draws, black wins). GameState.decodeMove turns a code into a Move.
+        A game that played the same move from the position twice counts once.
+    """
+    def continuations(self, key):
+        return self.connection.execute(
+            "SELECT move, games, whiteWins, draws, blackWins FROM continuations WHERE hash = ? "
+            "ORDER BY games DESC, move", (signedKey(key),)).fetchall()
+
+    """
+        The headers of a game (the GAME_HEADERS that it had) and its length in plies, None for an unknown id.
+    """
+    def game(self, gameId):
+        row = self.connection.execute("SELECT event, site, date, round, white, black, result, fen, plies "
+                                      "FROM games WHERE id = ?", (gameId,)).fetchone()
+        if row is None:
+            return None
+        headers = {name: value for name, value in zip(GAME_HEADERS, row) if value is not None}
+        headers["plies"] = row[-1]
+        return headers
+
+    """
+        Counts of games, positions and distinct (position, move) continuations in the index.
+    """
+    def stats(self):
+        count = self.connection.execute
+        return {"games": count("SELECT count(*) FROM games").fetchone()[0],
+                "positions": count("SELECT count(*) FROM positions").fetchone()[0],
+                "continuations": count("SELECT count(*) FROM continuations").fetchone()[0]}
+
+    def close(self):
+        self.connection.close()
+
+
+'''
+Hashes are unsigned 64-bit, SQLite integers signed.
+'''
+def signedKey(key):
+    return key - (1 << 64) if key >= 1 << 63 else key
+
+'''
+Cuts the lines of a PGN file into lists of lines holding batchGames games each (the last one fewer).
+A game starts with a tag line after the previous game's movetext, as in pgn.readGames.
+'''
+def splitGames(lines, batchGames):
+    batch = []
+    games = 0
+    inMovetext = inComment = False
+    for line in lines:
+        stripped = line.strip()
+        if not inComment and stripped.startswith("["):
+            if inMovetext:
+                games += 1
+                inMovetext = False
+                if games == batchGames:
+                    yield batch
+                    batch, games = [], 0
+        elif stripped and not stripped.startswith("%"):
+            inMovetext = True
+            inComment = stripped.rfind("{") > stripped.rfind("}") or (inComment and "}" not in stripped)
+        batch.append(line)
+    if batch:
+        yield batch
+
+'''
+Replays the batches, on a process pool if workers is more than 1, and yields replayBatch's results in
+batch order. Only a few batches per process are handed out ahead, a big file isn't read into memory at once.
+'''
+def replayBatches(batches, workers):
+    if workers <= 1:
+        initReplayWorker()
+        for batch in batches:
+            yield replayBatch(batch)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=initReplayWorker) as executor:
+        pending = deque()
+        for batch in batches:
+            pending.append(executor.submit(replayBatch, batch))
+            if len(pending) >= 2 * workers:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+workerState = None # the GameState of a replay process
+
+
+'''
+Process pool initializer, every replay process keeps one GameState.
+'''
+def initReplayWorker():
+    global workerState
+    workerState = GameState()
+
+'''
+Runs in a pool process: replays the games in a batch of PGN lines.
+
+    Returns:
+        list: per game its GAME_HEADERS values, the signed hash of every position it reached, the move code
+        played from each of them but the last, and whether every move could be read.
+'''
+def replayBatch(lines):
+    gs = workerState if workerState is not None else GameState()
+    games = []
+    for headers, sanMoves in pgn.readGames(lines):
+        keys = []
+        moves = []
+        complete = True
+        try:
+            gs.loadFen(headers.get("FEN", START_FEN))
+            keys.append(signedKey(gs.hash))
+            for san in sanMoves:
+                code = gs.parseSanCode(san)
+                gs.makeMoveCode(code)
+                moves.append(code)
+                keys.append(signedKey(gs.hash))
+        except ValueError:
+            complete = False
+        games.append((tuple(headers.get(name) for name in GAME_HEADERS), keys, moves, complete))
+    return games
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Index the positions of PGN games, or look a position up.")
+    parser.add_argument("database")
+    parser.add_argument("--add", nargs="+", metavar="PGN", help="PGN files to index, - for standard input")
+    parser.add_argument("--workers", type=int, default=WORKERS)
+    parser.add_argument("--fen", help="position to look up (default the start position)")
+    parser.add_argument("--moves", help="SAN moves played from --fen before looking up, e.g. \"e4 c5 Nf3\"")
+    parser.add_argument("--limit", type=int, default=QUERY_LIMIT, help="games to list")
+    args = parser.parse_args()
+
+    index = PositionIndex(args.database)
+    for path in args.add or []:
+        start = time.perf_counter()
+        file = sys.stdin if path == "-" else open(path, errors="replace")
+        games, positions, cutShort = index.addGames(file, args.workers, path, sys.stderr)
+        seconds = time.perf_counter() - start
+        print("%s: %d games (%d cut short by an unreadable move), %d positions in %.1fs, %.0f games/s" % (
+            path, games, cutShort, positions, seconds, games / seconds if seconds else 0))
+    if args.add and args.fen is None and args.moves is None:
+        index.close()
+        return
+
+    gs = GameState()
+    gs.loadFen(args.fen or START_FEN)
+    for san in (args.moves or "").split():
+        gs.makeMoveCode(gs.parseSanCode(san))
+    start = time.perf_counter()
+    continuations = index.continuations(gs.hash)
+    found = index.findGames(gs.hash, args.limit)
+    total = index.countGames(gs.hash)
+    seconds = time.perf_counter() - start
+    print("%d games reached the position (looked up in %.2fms)" % (total, seconds * 1000))
+    if continuations:
+        print("%-8s %7s %7s %7s %7s" % ("move", "games", "white", "draw", "black"))
+    for code, games, whiteWins, draws, blackWins in continuations:
+        print("%-8s %7d %6.0f%% %6.0f%% %6.0f%%" % (gs.getSan(gs.decodeMove(code)), games, 100 * whiteWins / games,
+                                                   100 * draws / games, 100 * blackWins / games))
+    for gameId, ply in found:
+        headers = index.game(gameId)
+        print("#%-7d %s - %s %s %s %s, ply %d" % (gameId, headers.get("White", "?"), headers.get("Black", "?"),
+                                                  headers.get("Result", "*"), headers.get("Event", "?"),
+                                                  headers.get("Date", "?"), ply))
+    index.close()
+
+
+if __name__ == "__main__":
+    main()
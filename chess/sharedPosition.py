@@ -0,0 +1,96 @@
+"""
+Shared memory handoff between the GUI (or a server) and AI search processes.
+Instead of pickling the whole GameState and its move log for every search, the position is written into a
+small fixed layout buffer that the search process reads in place, and the answer comes back through an
+equally small result slot. Handing off a position costs the same at move 5 and at move 500.
+"""
+import struct
+from multiprocessing import shared_memory
+from chess.chessEngine import PIECES, PIECE_CODES
+
+'''
+Position slot: search id, 64 piece codes, side to move, castling bits, en passant square (255 for none),
+halfmove clock and Zobrist hash.
+Result slot: search id, start row, start col, end row, end col, promotion piece code (0 for none) and score.
+The search id is written last and set to 0 while a slot is being rewritten, so a reader that sees the same
+id before and after copying a slot knows the copy isn't torn.
+'''
+POSITION_FORMAT = struct.Struct("<q64sBBBHQ")
+RESULT_FORMAT = struct.Struct("<qBBBBBd")
+RESULT_OFFSET = POSITION_FORMAT.size
+SLOT_SIZE = POSITION_FORMAT.size + RESULT_FORMAT.size
+NO_ENPASSANT = 255
+
+
+class SharedSearchSlot:
+    """
+        One position slot and one result slot in a block of shared memory.
+        The owner creates it with name None, search processes attach to it by name.
+    """
+    def __init__(self, name=None):
+        self.owner = name is None
+        if self.owner:
+            self.memory = shared_memory.SharedMemory(create=True, size=SLOT_SIZE)
+            self.memory.buf[:SLOT_SIZE] = bytes(SLOT_SIZE)
+        else:
+            self.memory = shared_memory.SharedMemory(name=name)
+        self.name = self.memory.name
+        self.buffer = self.memory.buf
+
+    """
+        Writes the position of gs for search searchId (a positive int).
+    """
+    def writePosition(self, gs, searchId):
+        board = bytes(PIECE_CODES[piece] for row in gs.board for piece in row)
+        ep = gs.enpassantPossible
+        POSITION_FORMAT.pack_into(self.buffer, 0, 0, board, gs.whiteToMove, gs.castleRights,
+                                  ep[0] * 8 + ep[1] if ep else NO_ENPASSANT, gs.halfmoveClock, gs.hash)
+        struct.pack_into("<q", self.buffer, 0, searchId)
+
+    """
+        Loads the position written for searchId into gs.
+        Returns False if the slot already holds a newer position, the search was superseded and can be skipped.
+    """
+    def readPosition(self, gs, searchId):
+        slotId, board, whiteToMove, castleRights, ep, halfmoveClock, h = POSITION_FORMAT.unpack_from(self.buffer, 0)
+        if slotId != searchId or struct.unpack_from("<q", self.buffer, 0)[0] != searchId:
+            return False
+        gs.setPosition([[PIECES[code] for code in board[r * 8:r * 8 + 8]] for r in range(8)], bool(whiteToMove),
+                       castleRights, () if ep == NO_ENPASSANT else divmod(ep, 8), halfmoveClock)
+        return gs.hash == h
+
+    """
+        Writes the move found for searchId, move may be None if there was no legal move.
+    """
+    def writeResult(self, searchId, move, score=0.0):
+        struct.pack_into("<q", self.buffer, RESULT_OFFSET, 0)
+        if move is None:
+            RESULT_FORMAT.pack_into(self.buffer, RESULT_OFFSET, 0, 0, 0, 0, 0, 0, score)
+        else:
+            promotion = PIECE_CODES[move.pieceMoved[0] + move.promotionChoice] if move.isPawnPromotion else 0
+            RESULT_FORMAT.pack_into(self.buffer, RESULT_OFFSET, 0, move.startRow, move.startCol,
+                                    move.endRow, move.endCol, promotion, score)
+        struct.pack_into("<q", self.buffer, RESULT_OFFSET, searchId)
+
+    """
+        Returns the move written for searchId as the matching Move from validMoves, or None if the slot
+        holds another search's answer or no move was found.
+    """
+    def readResult(self, searchId, validMoves):
+        slotId, startRow, startCol, endRow, endCol, promotion, score = RESULT_FORMAT.unpack_from(self.buffer, RESULT_OFFSET)
+        if slotId != searchId or struct.unpack_from("<q", self.buffer, RESULT_OFFSET)[0] != searchId:
+            return None
+        if startRow == startCol == endRow == endCol == 0:
+            return None
+        for move in validMoves:
+            if move.startRow == startRow and move.startCol == startCol and move.endRow == endRow and move.endCol == endCol:
+                if promotion:
+                    move.promotionChoice = PIECES[promotion][1]
+                return move
+        return None
+
+    def close(self):
+        self.buffer = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
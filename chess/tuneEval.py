@@ -0,0 +1,530 @@
+"""
+Offline tuning of the evaluation weights in ChessAI.py with Texel's method.
+Reads labelled positions, one per line: a FEN followed by the game result from white's point of view
+(1-0, 0-1, 1/2-1/2 or 1, 0, 0.5, quoted or not, so EPD lines like `... c9 "1-0";` work as well).
+Worker processes resolve every position to a quiet leaf and turn it into a sparse row of feature counts.
+By default the leaf comes from a quiescence search on material over the captures that win by static exchange
+(several thousand positions a second per worker), positions in check are left out. --resolve search uses the
+engine's own quiescence search instead, 6 to 100 times slower depending on how tactical the positions are.
+NumPy then fits all weights at once so that sigmoid(K * eval) predicts the results,
+and the weights are written to evalWeights.py, which ChessAI uses from its next import on.
+
+    python -m chess.tuneEval positions.epd --workers 8 --epochs 10 --cache positions.npz
+    python -m chess.tuneEval positions.epd --resolve search # quiescence search leaves
+
+Needs numpy, the game itself doesn't.
+"""
+import argparse
+import os
+import re
+import time
+from multiprocessing import Pool, cpu_count
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from chess import ChessAI
+from chess.chessEngine import GameState, rays, knightTargets, MOVE_ENPASSANT, MOVE_PROMOTION, GENERATE_CAPTURES
+
+"""
+Feature layout. scoreBoard is linear in its weights, so a position is a sparse row of counts and its
+evaluation is the dot product with the weight vector:
+material (white minus black count per piece), one column per square of every piece table (a black piece
+counts -1 on the mirrored square of the white table, the evaluation reads black's tables upside down),
+then the pawn structure terms from countPawnStructure.
+"""
+MATERIAL_PIECES = ["Q", "R", "B", "N", "p"] # the king's material weight stays 0
+TABLE_PIECES = ["N", "B", "Q", "R", "p"]
+TABLE_NAMES = ["knightScores", "bishopScores", "queenScores", "rookScores", "whitePawnScores"]
+MATERIAL_OFFSET = 0
+TABLE_OFFSET = MATERIAL_OFFSET + len(MATERIAL_PIECES)
+DOUBLED_INDEX = TABLE_OFFSET + 64 * len(TABLE_PIECES)
+ISOLATED_INDEX = DOUBLED_INDEX + 1
+PASSED_OFFSET = ISOLATED_INDEX + 1
+SHIELD_OFFSET = PASSED_OFFSET + 8
+PADDING_INDEX = SHIELD_OFFSET + len(ChessAI.PAWN_SHIELD_BONUS) # weight fixed at 0, fills unused row slots
+FEATURE_COUNT = PADDING_INDEX + 1
+ROW_WIDTH = 48 # most non-zero features a position can have: 5 material + 30 squares + 12 pawn terms
+TABLE_SCALE = 0.1 # scoreBoard adds the piece tables at a tenth of a pawn per point
+
+CHUNK_SIZE = 2048 # positions per job handed to a worker
+BATCH_SIZE = 16384 # positions per gradient step
+EVAL_CHUNK = 1 << 18 # positions evaluated at once when computing the loss
+RESULT_TOKENS = {"1-0": 1.0, "0-1": 0.0, "1/2-1/2": 0.5}
+RESULT_PATTERN = re.compile(r'(?<![\w./-])(1-0|0-1|1/2-1/2|1(?:\.0*)?|0(?:\.\d*)?|\.5)(?![\w./-])')
+
+SEE_VALUES = {"p": 1, "N": 3, "B": 3, "R": 5, "Q": 9, "K": 100} # fixed, the resolution mustn't depend on the fit
+PAWN_ATTACK_RAYS = {"w": (6, 7), "b": (4, 5)} # rays from a square that lead to the pawns attacking it
+RESOLUTIONS = ["static", "search", "none"] # how a position is turned into its quiet leaf, see --resolve
+
+leafResolution = "static" # set in every worker by initWorker
+workerState = None
+
+
+'''
+Splits a training line into its FEN and the result from white's point of view.
+
+    Returns:
+        (str, float): the FEN and the result, or None if the line has no recognisable result.
+'''
+def parseLine(line):
+    tokens = line.split()
+    if len(tokens) < 5:
+        return None
+    fields = tokens[:4]
+    rest = tokens[4:]
+    if len(rest) >= 3 and rest[0].isdigit() and rest[1].isdigit():
+        fields += rest[:2] # halfmove clock and move number
+        rest = rest[2:]
+    matches = RESULT_PATTERN.findall(" ".join(rest).replace('"', " ").replace(";", " ").replace("[", " ")
+                                     .replace("]", " ").replace("|", " ").replace(",", " "))
+    if not matches:
+        return None
+    token = matches[-1]
+    result = RESULT_TOKENS[token] if token in RESULT_TOKENS else float(token)
+    if not 0.0 <= result <= 1.0:
+        return None
+    return " ".join(fields), result
+
+'''
+Plays the quiescence search's capture line from the current position so gs ends up on a quiet position.
+
+    Returns:
+        bool: False if the position is decided (mate is found), those carry no information about the weights.
+'''
+def resolveQuietPosition(gs):
+    turnMultiplier = 1 if gs.whiteToMove else -1
+    score = ChessAI.quiescenceSearch(gs, -ChessAI.CHECKMATE, ChessAI.CHECKMATE, turnMultiplier)
+    if abs(score) >= ChessAI.CHECKMATE:
+        return False
+    for move in ChessAI.pvTable[0][:ChessAI.pvLength[0]]:
+        gs.makeMove(gs.decodeMove(move))
+    return True
+
+'''
+The cheapest piece of color that attacks (row, col), found by walking the rays out from the square.
+Pieces an exchange has already taken off the board are "--", so the attackers behind them (x-rays) show up.
+
+    Returns:
+        tuple: (row, col) of the attacker, or None if color doesn't attack the square.
+'''
+def leastValuableAttacker(board, row, col, color):
+    square = row * 8 + col
+    pawnRays = PAWN_ATTACK_RAYS[color]
+    best = None
+    bestValue = SEE_VALUES["K"] + 1
+    for j, ray in enumerate(rays[square]):
+        for i, (r, c, _) in enumerate(ray):
+            piece = board[r][c]
+            if piece == "--":
+                continue
+            if piece[0] == color:
+                kind = piece[1]
+                if kind == "Q" or kind == ("R" if j < 4 else "B") or \
+                        (i == 0 and (kind == "K" or (kind == "p" and j in pawnRays))):
+                    if kind == "p":
+                        return r, c
+                    if SEE_VALUES[kind] < bestValue:
+                        best, bestValue = (r, c), SEE_VALUES[kind]
+            break
+    if bestValue > SEE_VALUES["N"]:
+        for r, c, _ in knightTargets[square]:
+            if board[r][c] == color + "N":
+                return r, c
+    return best
+
+'''
+Static exchange evaluation of a capture or promotion: the material the side to move wins if both sides keep
+recapturing on the target square with their cheapest attacker, each free to stop when that is better.
+Pins are ignored, a king that captures into an attacked square simply loses SEE_VALUES["K"].
+
+    Returns:
+        int: the material won, negative if the capture loses material.
+'''
+def staticExchange(gs, move):
+    board = gs.board
+    start = move & 63
+    end = move >> 6 & 63
+    kind = move >> 12
+    row, col = end >> 3, end & 7
+    attacker = board[start >> 3][start & 7]
+    gains = [1 if kind == MOVE_ENPASSANT else SEE_VALUES.get(board[row][col][1], 0)]
+    pieceValue = SEE_VALUES[attacker[1]]
+    if kind >= MOVE_PROMOTION:
+        gains[0] += SEE_VALUES["Q"] - SEE_VALUES["p"]
+        pieceValue = SEE_VALUES["Q"]
+    removed = [(start >> 3, start & 7, attacker)]
+    board[start >> 3][start & 7] = "--"
+    color = "b" if attacker[0] == "w" else "w"
+    while True:
+        found = leastValuableAttacker(board, row, col, color)
+        if found is None:
+            break
+        r, c = found
+        piece = board[r][c]
+        gains.append(pieceValue - gains[-1])
+        pieceValue = SEE_VALUES[piece[1]]
+        removed.append((r, c, piece))
+        board[r][c] = "--"
+        color = "b" if color == "w" else "w"
+    for r, c, piece in removed:
+        board[r][c] = piece
+    for i in range(len(gains) - 1, 0, -1):
+        gains[i - 1] = -max(-gains[i - 1], gains[i])
+    return gains[0]
+
+'''
+Quiescence search on material alone for resolveStatically: only captures and promotions that win material by
+static exchange are searched, and a position scores the material won on the way to it, so there is no
+evaluation at any node and the tree stays a handful of moves. Either side may stand pat, in check as well.
+
+    Returns:
+        int: material the side to move wins, pvTable[ply] holds the capture line.
+'''
+def exchangeSearch(gs, alpha, beta, ply, inCheck):
+    pvTable, pvLength = ChessAI.pvTable, ChessAI.pvLength
+    pvLength[ply] = 0
+    bestScore = 0
+    if bestScore >= beta or ply == ChessAI.MAX_PLY - 1:
+        return bestScore
+    alpha = max(alpha, bestScore)
+    moves = ChessAI.moveBuffers[ply]
+    gs.inCheck = inCheck
+    board = gs.board
+    candidates = []
+    for i in range(gs.fillPseudoLegalMoves(moves, GENERATE_CAPTURES)):
+        if staticExchange(gs, moves[i]) > 0:
+            move = moves[i]
+            end = move >> 6 & 63
+            kind = move >> 12
+            gain = 1 if kind == MOVE_ENPASSANT else SEE_VALUES.get(board[end >> 3][end & 7][1], 0)
+            if kind >= MOVE_PROMOTION:
+                gain += SEE_VALUES["Q"] - SEE_VALUES["p"]
+            candidates.append((gain, move))
+    candidates.sort(reverse=True)
+
+    for gain, move in candidates:
+        gs.makeMoveCode(move)
+        if gs.leavesKingInCheck(move, inCheck):
+            gs.undoMoveCode(move)
+            continue
+        score = gain - exchangeSearch(gs, gain - beta, gain - alpha, ply + 1, gs.kingInCheck())
+        gs.undoMoveCode(move)
+        if score > bestScore:
+            bestScore = score
+        if score > alpha:
+            alpha = score
+            pvTable[ply][0] = move
+            childLength = pvLength[ply + 1]
+            pvTable[ply][1:childLength + 1] = pvTable[ply + 1][:childLength]
+            pvLength[ply] = childLength + 1
+            if alpha >= beta:
+                break
+    return bestScore
+
+'''
+Cheap stand-in for resolveQuietPosition: plays the capture line of exchangeSearch, which costs a capture
+generation and a few static exchanges per node instead of an evaluation at every node of a wider tree.
+Positions in check are left out, a static exchange can't tell how a check ends.
+
+    Returns:
+        bool: False if the position is in check.
+'''
+def resolveStatically(gs):
+    if gs.kingInCheck():
+        return False
+    exchangeSearch(gs, -SEE_VALUES["K"], SEE_VALUES["K"], 0, False)
+    for move in ChessAI.pvTable[0][:ChessAI.pvLength[0]]:
+        gs.makeMoveCode(move)
+    return True
+
+'''
+Counts the features of the position on gs, see the feature layout above.
+
+    Returns:
+        dict: feature index -> count, only the non-zero ones.
+'''
+def positionFeatures(gs):
+    features = {}
+    for r in range(8):
+        for c in range(8):
+            square = gs.board[r][c]
+            if square == "--" or square[1] == "K":
+                continue
+            sign = 1 if square[0] == "w" else -1
+            piece = square[1]
+            index = MATERIAL_OFFSET + MATERIAL_PIECES.index(piece)
+            features[index] = features.get(index, 0) + sign
+            tableRow = 7 - r if square[0] == "b" else r
+            index = TABLE_OFFSET + 64 * TABLE_PIECES.index(piece) + tableRow * 8 + c
+            features[index] = features.get(index, 0) + sign
+
+    white, black = ChessAI.countPawnStructure(gs.board)
+    features[DOUBLED_INDEX] = black[0] - white[0] # penalties, so white's count lowers the score
+    features[ISOLATED_INDEX] = black[1] - white[1]
+    for ranks in range(8):
+        features[PASSED_OFFSET + ranks] = white[2][ranks] - black[2][ranks]
+    for distance in range(len(ChessAI.PAWN_SHIELD_BONUS)):
+        count = 0
+        if gs.whiteKingLocation[0] == 7:
+            count += white[3][gs.whiteKingLocation[1]][distance]
+        if gs.blackKingLocation[0] == 0:
+            count -= black[3][gs.blackKingLocation[1]][distance]
+        features[SHIELD_OFFSET + distance] = count
+    return {index: count for index, count in features.items() if count != 0}
+
+'''
+Pool initializer, runs once in every worker process.
+'''
+def initWorker(resolution):
+    global leafResolution, workerState
+    leafResolution = resolution
+    workerState = GameState()
+
+'''
+Worker job: parses a chunk of lines and returns their feature rows.
+
+    Returns:
+        tuple: (columns, counts, results, skipped). columns and counts are (n, ROW_WIDTH) int16/int8 arrays,
+        unused slots point at PADDING_INDEX. skipped counts lines that were malformed, decided or in check.
+'''
+def extractFeatures(lines):
+    gs = workerState if workerState is not None else GameState()
+    columns = np.full((len(lines), ROW_WIDTH), PADDING_INDEX, dtype=np.int16)
+    counts = np.zeros((len(lines), ROW_WIDTH), dtype=np.int8)
+    results = np.empty(len(lines), dtype=np.float32)
+    n = 0
+    skipped = 0
+    for line in lines:
+        parsed = parseLine(line)
+        if parsed is None:
+            skipped += 1
+            continue
+        try:
+            gs.loadFen(parsed[0])
+        except (ValueError, IndexError):
+            skipped += 1
+            continue
+        if leafResolution == "static" and not resolveStatically(gs) or \
+                leafResolution == "search" and not resolveQuietPosition(gs):
+            skipped += 1
+            continue
+        features = positionFeatures(gs)
+        columns[n, :len(features)] = list(features.keys())
+        counts[n, :len(features)] = list(features.values())
+        results[n] = parsed[1]
+        n += 1
+    return columns[:n], counts[:n], results[:n], skipped
+
+'''
+Reads the training file in chunks of CHUNK_SIZE lines, skipping blank lines and # comments.
+'''
+def readChunks(path):
+    chunk = []
+    with open(path) as file:
+        for line in file:
+            if line.strip() and not line.startswith("#"):
+                chunk.append(line)
+                if len(chunk) == CHUNK_SIZE:
+                    yield chunk
+                    chunk = []
+    if chunk:
+        yield chunk
+
+'''
+Turns the whole training file into feature rows, spread over worker processes.
+
+    Returns:
+        tuple: (columns, counts, results) arrays for all usable positions.
+'''
+def loadDataset(path, workers, resolution="static"):
+    columns, counts, results = [], [], []
+    done = 0
+    skipped = 0
+    start = time.perf_counter()
+    with Pool(workers, initializer=initWorker, initargs=(resolution,)) as pool:
+        for chunkColumns, chunkCounts, chunkResults, chunkSkipped in pool.imap_unordered(extractFeatures,
+                                                                                         readChunks(path)):
+            columns.append(chunkColumns)
+            counts.append(chunkCounts)
+            results.append(chunkResults)
+            done += len(chunkResults)
+            skipped += chunkSkipped
+            if len(columns) % 50 == 0:
+                print("%d positions, %.0f/s" % (done, done / (time.perf_counter() - start)))
+    print("%d positions loaded, %d skipped, %.1fs" % (done, skipped, time.perf_counter() - start))
+    if not results:
+        raise ValueError("no usable positions in " + path)
+    return np.concatenate(columns), np.concatenate(counts), np.concatenate(results)
+
+'''
+Collects the current weights from ChessAI into a vector in the feature layout.
+'''
+def currentWeights():
+    weights = np.zeros(FEATURE_COUNT)
+    for i, piece in enumerate(MATERIAL_PIECES):
+        weights[MATERIAL_OFFSET + i] = ChessAI.pieceScore[piece]
+    for i, name in enumerate(TABLE_NAMES):
+        weights[TABLE_OFFSET + 64 * i:TABLE_OFFSET + 64 * (i + 1)] = np.ravel(getattr(ChessAI, name))
+    weights[DOUBLED_INDEX] = ChessAI.DOUBLED_PAWN_PENALTY
+    weights[ISOLATED_INDEX] = ChessAI.ISOLATED_PAWN_PENALTY
+    weights[PASSED_OFFSET:PASSED_OFFSET + 8] = ChessAI.PASSED_PAWN_BONUS
+    weights[SHIELD_OFFSET:PADDING_INDEX] = ChessAI.PAWN_SHIELD_BONUS
+    return weights
+
+'''
+Scale every weight is multiplied with in the evaluation, TABLE_SCALE for the piece tables and 1 otherwise.
+'''
+def featureScale():
+    scale = np.ones(FEATURE_COUNT)
+    scale[TABLE_OFFSET:DOUBLED_INDEX] = TABLE_SCALE
+    return scale
+
+'''
+Mean squared error between the results and sigmoid(K * eval) over the whole data set.
+'''
+def computeLoss(weights, data, K):
+    columns, counts, results = data
+    scaled = weights * featureScale()
+    total = 0.0
+    for start in range(0, len(results), EVAL_CHUNK):
+        chunk = slice(start, start + EVAL_CHUNK)
+        evals = (scaled[columns[chunk]] * counts[chunk]).sum(axis=1)
+        total += np.square(results[chunk] - 1 / (1 + np.exp(-K * evals))).sum()
+    return total / len(results)
+
+'''
+Finds the K that turns the current evaluation into the best prediction (golden section search),
+it is kept fixed while the weights are fitted.
+'''
+def fitScale(weights, data, low=0.05, high=10.0, iterations=40):
+    ratio = (5 ** 0.5 - 1) / 2
+    a, b = high - ratio * (high - low), low + ratio * (high - low)
+    lossA, lossB = computeLoss(weights, data, a), computeLoss(weights, data, b)
+    for _ in range(iterations):
+        if lossA < lossB:
+            high, b, lossB = b, a, lossA
+            a = high - ratio * (high - low)
+            lossA = computeLoss(weights, data, a)
+        else:
+            low, a, lossA = a, b, lossB
+            b = low + ratio * (high - low)
+            lossB = computeLoss(weights, data, b)
+    return (low + high) / 2
+
+'''
+Fits the weights with mini-batch gradient descent (Adam) on the mean squared error.
+The gradient of a whole batch is computed at once: evaluations are a gather and a row sum,
+the gradient is scattered back per feature with bincount.
+'''
+def fitWeights(weights, data, K, epochs, learningRate, seed=0):
+    columns, counts, results = data
+    scale = featureScale()
+    frozen = np.zeros(FEATURE_COUNT, dtype=bool)
+    frozen[PADDING_INDEX] = True
+    frozen[[PASSED_OFFSET, PASSED_OFFSET + 7]] = True # a pawn can't be passed on its start or promotion rank
+    weights = weights.copy()
+    m = np.zeros(FEATURE_COUNT)
+    v = np.zeros(FEATURE_COUNT)
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step = 0
+    rng = np.random.default_rng(seed)
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        order = rng.permutation(len(results))
+        for batchStart in range(0, len(order), BATCH_SIZE):
+            batch = order[batchStart:batchStart + BATCH_SIZE]
+            batchColumns = columns[batch]
+            batchCounts = counts[batch].astype(np.float64)
+            evals = ((weights * scale)[batchColumns] * batchCounts).sum(axis=1)
+            predicted = 1 / (1 + np.exp(-K * evals))
+            evalGradient = 2 * (predicted - results[batch]) * K * predicted * (1 - predicted) / len(batch)
+            gradient = np.bincount(batchColumns.ravel(), weights=(batchCounts * evalGradient[:, None]).ravel(),
+                                   minlength=FEATURE_COUNT) * scale
+            gradient[frozen] = 0
+            step += 1
+            m = beta1 * m + (1 - beta1) * gradient
+            v = beta2 * v + (1 - beta2) * gradient * gradient
+            weights -= learningRate * (m / (1 - beta1 ** step)) / (np.sqrt(v / (1 - beta2 ** step)) + epsilon)
+        print("epoch %d loss %.6f (%.1fs)" % (epoch + 1, computeLoss(weights, data, K), time.perf_counter() - start))
+    return weights
+
+'''
+Formats an 8x8 table the way the tables in ChessAI.py are laid out.
+'''
+def formatTable(name, values):
+    rows = [", ".join("%.2f" % value for value in values[r * 8:(r + 1) * 8]) for r in range(8)]
+    indent = " " * (len(name) + 4)
+    return name + " = [[" + ("],\n" + indent + "[").join(rows) + "]]\n"
+
+'''
+Writes the fitted weights as a Python module with the same names ChessAI uses.
+'''
+def writeWeights(path, weights, K, loss, positions):
+    def value(x):
+        return round(float(x), 3)
+    text = '"""\n'
+    text += "Evaluation weights generated by tuneEval.py from %d positions (K = %.3f, loss %.6f).\n" % (
+        positions, K, loss)
+    text += "Don't edit by hand, rerun the tuner instead.\n"
+    text += '"""\n\n'
+    pieceScore = {"K": 0}
+    for i, piece in enumerate(MATERIAL_PIECES):
+        pieceScore[piece] = value(weights[MATERIAL_OFFSET + i])
+    text += "pieceScore = %r\n\n" % pieceScore
+    for i, name in enumerate(TABLE_NAMES):
+        text += formatTable(name, weights[TABLE_OFFSET + 64 * i:TABLE_OFFSET + 64 * (i + 1)]) + "\n"
+    whitePawns = weights[TABLE_OFFSET + 64 * 4:TABLE_OFFSET + 64 * 5].reshape(8, 8)
+    text += formatTable("blackPawnScores", whitePawns[::-1].ravel()) + "\n"
+    text += "DOUBLED_PAWN_PENALTY = %r\n" % value(weights[DOUBLED_INDEX])
+    text += "ISOLATED_PAWN_PENALTY = %r\n" % value(weights[ISOLATED_INDEX])
+    text += "PASSED_PAWN_BONUS = %r\n" % [value(x) for x in weights[PASSED_OFFSET:PASSED_OFFSET + 8]]
+    text += "PAWN_SHIELD_BONUS = %r\n" % [value(x) for x in weights[SHIELD_OFFSET:PADDING_INDEX]]
+    temporary = path + ".tmp"
+    with open(temporary, "w") as file:
+        file.write(text)
+    os.replace(temporary, path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fit the evaluation weights to labelled positions.")
+    parser.add_argument("positions", help="file with one FEN and game result per line")
+    parser.add_argument("--workers", type=int, default=cpu_count(), help="processes extracting features")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--learning-rate", type=float, default=0.01)
+    parser.add_argument("--resolve", choices=RESOLUTIONS, default="static",
+                        help="static exchanges (default), quiescence search, or none: use the positions as they are")
+    parser.add_argument("--cache", help=".npz file to keep the extracted features in between runs")
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                         "evalWeights.py"))
+    args = parser.parse_args()
+    if np is None:
+        raise SystemExit("tuneEval needs numpy: pip install numpy")
+
+    cached = None
+    if args.cache and os.path.exists(args.cache) and \
+            os.path.getmtime(args.cache) >= os.path.getmtime(args.positions):
+        cached = np.load(args.cache)
+        if "resolution" not in cached.files or str(cached["resolution"]) != args.resolve:
+            cached = None # extracted with other leaves
+    if cached is not None:
+        data = cached["columns"], cached["counts"], cached["results"]
+        print("%d positions from %s" % (len(data[2]), args.cache))
+    else:
+        data = loadDataset(args.positions, args.workers, args.resolve)
+        if args.cache:
+            np.savez(args.cache, columns=data[0], counts=data[1], results=data[2], resolution=args.resolve)
+
+    weights = currentWeights()
+    K = fitScale(weights, data)
+    print("K %.3f, loss with the current weights %.6f" % (K, computeLoss(weights, data, K)))
+    weights = fitWeights(weights, data, K, args.epochs, args.learning_rate)
+    loss = computeLoss(weights, data, K)
+    writeWeights(args.output, weights, K, loss, len(data[2]))
+    print("loss %.6f, weights written to %s" % (loss, args.output))
+
+
+if __name__ == "__main__":
+    main()